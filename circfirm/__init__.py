@@ -18,6 +18,7 @@ from circfirm.startup import (
 # Folders
 APP_DIR = specify_app_dir("circfirm")
 UF2_ARCHIVE = specify_folder(APP_DIR, "archive")
+VERSION_LISTINGS = specify_folder(APP_DIR, "listings")
 
 # Files
 _SETTINGS_FILE_SRC = os.path.abspath(
@@ -27,6 +28,10 @@ SETTINGS_FILE = specify_template(
     _SETTINGS_FILE_SRC, os.path.join(APP_DIR, "settings.yaml")
 )
 UF2_BOARD_LIST = specify_file(APP_DIR, "boards.txt")
+RELEASE_INDEX = os.path.join(APP_DIR, "index.sqlite3")
+BOOTLOADER_MAP = os.path.join(APP_DIR, "bootloaders.yaml")
+ARCHIVE_CATALOG = os.path.join(APP_DIR, "archive.sqlite3")
+ARCHIVE_LOCKS = os.path.join(APP_DIR, "locks")
 
 UF2INFO_FILE = "info_uf2.txt"
 BOOTOUT_FILE = "boot_out.txt"
@@ -0,0 +1,142 @@
+# SPDX-FileCopyrightText: 2026 Alec Delaney
+# SPDX-License-Identifier: MIT
+
+"""Backend functionality for mapping UF2 bootloaders to CircuitPython boards.
+
+Author(s): Alec Delaney
+"""
+
+import os
+import pathlib
+import re
+import tempfile
+from collections.abc import Iterable
+
+import yaml
+
+import circfirm
+
+BootloaderMap = dict[tuple[str, str | None], str]
+
+
+def read_bootloader_map() -> BootloaderMap:
+    """Read the stored mapping of UF2 bootloaders to CircuitPython board IDs.
+
+    Bootloaders are keyed by their board ID and model, since different
+    boards can share a bootloader board ID.  The stored mapping lists the
+    CircuitPython board ID under each model of a bootloader board ID, or
+    directly under the bootloader board ID (or under a model of null) to use
+    it for every model, which is given a model of None.
+    """
+    try:
+        with open(circfirm.BOOTLOADER_MAP, encoding="utf-8") as mapfile:
+            stored_map = yaml.safe_load(mapfile)
+    except (OSError, yaml.YAMLError):
+        return {}
+    if not isinstance(stored_map, dict):
+        return {}
+    bootloader_map: BootloaderMap = {}
+    for uf2_board_id, value in stored_map.items():
+        if isinstance(value, dict):
+            for stored_model, board_id in value.items():
+                model = None if stored_model is None else str(stored_model)
+                bootloader_map[str(uf2_board_id), model] = str(board_id)
+        else:
+            bootloader_map[str(uf2_board_id), None] = str(value)
+    return bootloader_map
+
+
+def write_bootloader_map(bootloader_map: BootloaderMap) -> None:
+    """Store a mapping of UF2 bootloaders to CircuitPython board IDs."""
+    models: dict[str, dict[str | None, str]] = {}
+    for (uf2_board_id, model), board_id in bootloader_map.items():
+        models.setdefault(uf2_board_id, {})[model] = board_id
+    stored_map = {
+        uf2_board_id: board_ids[None] if list(board_ids) == [None] else board_ids
+        for uf2_board_id, board_ids in sorted(models.items())
+    }
+    map_file = pathlib.Path(circfirm.BOOTLOADER_MAP)
+    map_file.parent.mkdir(parents=True, exist_ok=True)
+    temp_fd, temp_filepath = tempfile.mkstemp(
+        prefix=f".{map_file.name}.", dir=map_file.parent
+    )
+    try:
+        with os.fdopen(temp_fd, mode="w", encoding="utf-8") as mapfile:
+            # Models of None cannot be sorted with the other models
+            yaml.safe_dump(stored_map, mapfile, sort_keys=False)
+        os.replace(temp_filepath, map_file)
+    except BaseException:
+        pathlib.Path(temp_filepath).unlink(missing_ok=True)
+        raise
+
+
+def _normalize_name(name: str) -> str:
+    """Normalize a board name so that differently formatted names can be compared."""
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def match_board_id(model: str | None, board_ids: Iterable[str]) -> str | None:
+    """Match a UF2 bootloader model to a CircuitPython board ID, if it can be done uniquely.
+
+    The model is compared to the board IDs, and then to the board IDs
+    without their leading vendor name.  Bootloaders without a model are not
+    matched, since their bootloader board ID is often shared between boards.
+    """
+    if model is None:
+        return None
+    exact_names: dict[str, set[str]] = {}
+    unprefixed_names: dict[str, set[str]] = {}
+    for board_id in board_ids:
+        exact_names.setdefault(_normalize_name(board_id), set()).add(board_id)
+        _, _, unprefixed = board_id.partition("_")
+        if unprefixed:
+            unprefixed_names.setdefault(_normalize_name(unprefixed), set()).add(
+                board_id
+            )
+
+    for board_names in (exact_names, unprefixed_names):
+        matches = board_names.get(_normalize_name(model), set())
+        if len(matches) == 1:
+            return matches.pop()
+    return None
+
+
+def _lookup_board_id(
+    bootloader_map: BootloaderMap, uf2_board_id: str, model: str | None
+) -> str | None:
+    """Get the CircuitPython board ID for a UF2 bootloader from a mapping, if any."""
+    board_id = bootloader_map.get((uf2_board_id, model))
+    if board_id is None:
+        board_id = bootloader_map.get((uf2_board_id, None))
+    return board_id
+
+
+def lookup_board_id(uf2_board_id: str, model: str | None) -> str | None:
+    """Get the stored CircuitPython board ID for a UF2 bootloader, if any.
+
+    A board ID stored for the model of the bootloader is used before one
+    stored for every model.
+    """
+    return _lookup_board_id(read_bootloader_map(), uf2_board_id, model)
+
+
+def resolve_board_id(
+    uf2_board_id: str, model: str | None, board_ids: Iterable[str]
+) -> str | None:
+    """Get the CircuitPython board ID for a UF2 bootloader.
+
+    The stored mapping is used if it has the bootloader (see
+    lookup_board_id()), and otherwise the bootloader model is matched to the
+    given board IDs.  New matches are added to the stored mapping under the
+    bootloader board ID and model, so that the board list is only needed the
+    first time a bootloader is seen.
+    """
+    bootloader_map = read_bootloader_map()
+    board_id = _lookup_board_id(bootloader_map, uf2_board_id, model)
+    if board_id is not None:
+        return board_id
+    board_id = match_board_id(model, board_ids)
+    if board_id is not None:
+        bootloader_map[uf2_board_id, model] = board_id
+        write_bootloader_map(bootloader_map)
+    return board_id
@@ -6,13 +6,45 @@
 Author(s): Alec Delaney
 """
 
+import concurrent.futures
+import ctypes
+import ctypes.util
+import glob
+import mmap
 import os
 import pathlib
+import queue
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Collection, Iterable, Iterator
+from typing import BinaryIO, NamedTuple
 
 import packaging.version
 import requests
 
 import circfirm.backend
+import circfirm.backend.catalog
+import circfirm.backend.lock
+import circfirm.backend.session
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+PARTIAL_SUFFIX = ".part"
+TEE_QUEUE_SIZE = 16
+COPY_CHUNK_SIZE = 256 * 1024  # A multiple of the 512 byte UF2 block size
+FALLOC_FL_KEEP_SIZE = 0x01
+
+
+class CopyResult(NamedTuple):
+    """The size and duration of a UF2 file copy."""
+
+    size: int
+    seconds: float
+
+    @property
+    def bytes_per_second(self) -> float:
+        """The throughput of the copy."""
+        return self.size / self.seconds if self.seconds > 0 else float("inf")
 
 
 def get_uf2_filepath(
@@ -35,44 +67,595 @@ def is_downloaded(board_id: str, version: str, language: str = "en_US") -> bool:
     return uf2_file.exists()
 
 
-def download_uf2(board_id: str, version: str, language: str = "en_US") -> None:
-    """Download a version of CircuitPython for a specific board."""
+def is_partial_download(filename: str) -> bool:
+    """Check whether a file in the archive is an in-progress download."""
+    return filename.startswith(".") and filename.endswith(PARTIAL_SUFFIX)
+
+
+def _get_partial_download_filename(filename: str) -> str:
+    """Get the name of the UF2 file that an in-progress download is for."""
+    # Temporary files are named ".<UF2 filename>.<random characters>.part"
+    return filename[1:].removesuffix(PARTIAL_SUFFIX).rpartition(".")[0]
+
+
+def _get_expected_size(response: requests.Response) -> int | None:
+    """Get the expected size of the response body, if known."""
+    content_length = response.headers.get("Content-Length")
+    encoding = response.headers.get("Content-Encoding", "identity")
+    if content_length is None or encoding != "identity":
+        return None
+    return int(content_length)
+
+
+class _TeeWriter:
+    """Writer of chunks to a file in a background thread.
+
+    This allows a slow device to be written to while the rest of the file is
+    still being downloaded.  Only a limited number of chunks are queued, and
+    any error writing the file is raised once the writer is closed, so that
+    it never interrupts the download itself.
+    """
+
+    def __init__(self, filepath: str) -> None:
+        """Open the file and start writing chunks to it in the background."""
+        self._file = open(filepath, mode="wb")
+        self._chunks: queue.Queue[bytes | None] = queue.Queue(TEE_QUEUE_SIZE)
+        self._error: OSError | None = None
+        self._thread = threading.Thread(target=self._write_chunks, daemon=True)
+        self._thread.start()
+
+    def _write_chunks(self) -> None:
+        """Write the queued chunks to the file until the writer is closed."""
+        while (chunk := self._chunks.get()) is not None:
+            if self._error is not None:
+                continue
+            try:
+                self._file.write(chunk)
+            except OSError as err:
+                self._error = err
+
+    def write(self, chunk: bytes) -> None:
+        """Queue a chunk to be written to the file."""
+        self._chunks.put(chunk)
+
+    def close(self) -> None:
+        """Finish writing the queued chunks and close the file."""
+        self._chunks.put(None)
+        self._thread.join()
+        try:
+            if self._error is None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+        except OSError as err:
+            self._error = err
+        finally:
+            self._file.close()
+        if self._error is not None:
+            raise self._error
+
+
+def _remove_device_file(device_file: str | None) -> None:
+    """Remove an incomplete UF2 file from a device, if it is still there."""
+    if device_file is None:
+        return
+    try:
+        pathlib.Path(device_file).unlink(missing_ok=True)
+    except OSError:
+        pass
+
+
+def download_uf2(
+    board_id: str,
+    version: str,
+    language: str = "en_US",
+    bootloader: str | None = None,
+) -> None:
+    """Download a version of CircuitPython for a specific board.
+
+    The file is streamed into a temporary file in the board folder and only
+    renamed into place once it is complete, so an interrupted download never
+    leaves a truncated UF2 file in the archive.
+
+    If the location of a device in bootloader mode is given, the file is
+    also written to it as it is downloaded, instead of being copied once the
+    download finishes.  A complete download is still added to the archive
+    if opening or writing the file on the device fails, and the error is
+    raised afterwards.
+
+    Only one download of a file runs at a time, even between processes.  If
+    the file is being downloaded elsewhere, this waits for that download,
+    and uses its result (copying it to the device, if given) instead of
+    downloading the file again.
+    """
+    file = circfirm.backend.get_uf2_filename(board_id, version, language=language)
+    with circfirm.backend.lock.lock(file) as waited:
+        if waited and is_downloaded(board_id, version, language):
+            if bootloader is not None:
+                copy_uf2(board_id, version, language, bootloader)
+            return
+        _download_uf2(board_id, version, language, bootloader)
+
+
+def _create_partial_download(uf2_file: pathlib.Path) -> tuple[int, str]:
+    """Create the temporary file for downloading a UF2 file, opened for writing.
+
+    The caller must hold the lock for the UF2 file, so any other temporary
+    files for it were left by abandoned downloads, and are removed.
+    """
+    with circfirm.backend.lock.lock(
+        circfirm.backend.lock.ARCHIVE_LOCK, exclusive=False
+    ):
+        uf2_file.parent.mkdir(parents=True, exist_ok=True)
+        for abandoned in uf2_file.parent.glob(
+            f".{glob.escape(uf2_file.name)}.*{PARTIAL_SUFFIX}"
+        ):
+            abandoned.unlink(missing_ok=True)
+        return tempfile.mkstemp(
+            prefix=f".{uf2_file.name}.", suffix=PARTIAL_SUFFIX, dir=uf2_file.parent
+        )
+
+
+def _write_response(
+    response: requests.Response,
+    uf2file: BinaryIO,
+    tee: _TeeWriter | None,
+    url: str,
+) -> None:
+    """Write a streamed UF2 file download to a file, and to a device if given."""
+    try:
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            uf2file.write(chunk)
+            if tee is not None:
+                tee.write(chunk)
+    except requests.exceptions.ChunkedEncodingError as err:
+        raise ConnectionError(
+            f"Download of the UF2 file was interrupted:\n{url}"
+        ) from err
+
+
+def _download_uf2(
+    board_id: str, version: str, language: str, bootloader: str | None
+) -> None:
+    """Download a version of CircuitPython (see download_uf2()).
+
+    The archive is only locked while the temporary file is created, while
+    the complete download is moved into place, and while an empty board
+    folder is removed after a failed download, so that downloads do not
+    hold up each other or removals from the archive.
+    """
     file = circfirm.backend.get_uf2_filename(board_id, version, language=language)
     uf2_file = get_uf2_filepath(board_id, version, language=language)
     url = f"https://downloads.circuitpython.org/bin/{board_id}/{language}/{file}"
-    response = requests.get(url)
+    with circfirm.backend.session.get(url, stream=True) as response:
+        SUCCESS = 200
+        if response.status_code != SUCCESS:
+            raise ConnectionError(
+                f"Could not download the specified UF2 file:\n{url}\nAre the board ID, version, and language correct?"
+            )
 
-    SUCCESS = 200
-    if response.status_code != SUCCESS:
-        raise ConnectionError(
-            f"Could not download the specified UF2 file:\n{url}\nAre the board ID, version, and language correct?"
+        expected_size = _get_expected_size(response)
+        temp_fd, temp_filepath = _create_partial_download(uf2_file)
+        device_file = None if bootloader is None else os.path.join(bootloader, file)
+        device_error = None
+        try:
+            with os.fdopen(temp_fd, mode="wb") as uf2file:
+                tee = None
+                if device_file is not None:
+                    try:
+                        tee = _TeeWriter(device_file)
+                    except OSError as err:
+                        device_error = err
+                try:
+                    _write_response(response, uf2file, tee, url)
+                finally:
+                    if tee is not None:
+                        try:
+                            tee.close()
+                        except OSError as err:
+                            device_error = err
+                uf2file.flush()
+                os.fsync(uf2file.fileno())
+                size = uf2file.tell()
+            if expected_size is not None and size != expected_size:
+                raise ConnectionError(
+                    f"Download of the UF2 file was incomplete:\n{url}\nReceived {size} of {expected_size} bytes"
+                )
+            with circfirm.backend.lock.lock(
+                circfirm.backend.lock.ARCHIVE_LOCK, exclusive=False
+            ):
+                os.replace(temp_filepath, uf2_file)
+                circfirm.backend.catalog.add_firmware(board_id, version, language, size)
+        except BaseException:
+            pathlib.Path(temp_filepath).unlink(missing_ok=True)
+            # Lock the archive so the board folder is not removed while
+            # another download is creating its temporary file in it
+            with circfirm.backend.lock.lock(circfirm.backend.lock.ARCHIVE_LOCK):
+                try:  # Remove the board folder if this left it empty
+                    uf2_file.parent.rmdir()
+                except OSError:
+                    pass
+            _remove_device_file(device_file)
+            raise
+        if device_error is not None:
+            _remove_device_file(device_file)
+            raise device_error
+
+
+def download_uf2s(
+    jobs: Iterable[tuple[str, str, str]], max_workers: int = 8
+) -> Iterator[tuple[tuple[str, str, str], Exception | None]]:
+    """Download many UF2 files in parallel.
+
+    Each job is a board ID, version, and language.  Jobs are yielded as they
+    finish, along with the error that caused them to fail, if any.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = {executor.submit(download_uf2, *job): job for job in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.exception()
+
+
+def _iter_file_chunks(uf2file: BinaryIO) -> Iterator[memoryview]:
+    """Read an open file in chunks, reusing the same buffer for each chunk."""
+    buffer = bytearray(COPY_CHUNK_SIZE)
+    view = memoryview(buffer)
+    while size := uf2file.readinto(buffer):
+        yield view[:size]
+
+
+def _iter_buffer_chunks(buffer: bytes | mmap.mmap) -> Iterator[memoryview]:
+    """Split a buffer into chunks without copying it."""
+    view = memoryview(buffer)
+    for start in range(0, len(view), COPY_CHUNK_SIZE):
+        yield view[start : start + COPY_CHUNK_SIZE]
+
+
+def _preallocate(fd: int, size: int) -> None:
+    """Allocate the space for a file, if its filesystem supports doing so natively.
+
+    This uses fallocate() on Linux, keeping the size of the file.  It does
+    not use posix_fallocate(), which writes zeros across the file instead
+    on filesystems without native support (such as those of many UF2
+    bootloaders), doubling the data written and possibly being read as UF2
+    blocks.  Nothing is done if the space cannot be allocated natively.
+    """
+    libc_name = ctypes.util.find_library("c")
+    if libc_name is None:
+        return
+    try:
+        fallocate = ctypes.CDLL(libc_name, use_errno=True).fallocate64
+    except (OSError, AttributeError):
+        return
+    fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+    fallocate(fd, FALLOC_FL_KEEP_SIZE, 0, size)
+
+
+def _write_device_file(
+    chunks: Iterable[memoryview], device_file: str, size: int, preallocate: bool
+) -> CopyResult:
+    """Write chunks to a file on a device, waiting until they are written.
+
+    The file is written without any buffering, so each chunk is written to
+    the device as a single large write.
+    """
+    start_time = time.monotonic()
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+    fd = os.open(device_file, flags, 0o644)
+    try:
+        if preallocate:
+            _preallocate(fd, size)
+        written = 0
+        for chunk in chunks:
+            remaining = chunk
+            while remaining:
+                count = os.write(fd, remaining)
+                remaining = remaining[count:]
+                written += count
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return CopyResult(written, time.monotonic() - start_time)
+
+
+def copy_uf2(
+    board_id: str,
+    version: str,
+    language: str,
+    bootloader: str,
+    *,
+    preallocate: bool = False,
+) -> CopyResult:
+    """Copy a downloaded UF2 file to a device in bootloader mode.
+
+    The file is copied in large chunks that are aligned to the UF2 block
+    size, and the copy only finishes once the file is written to the device.
+    The space for the file can also be allocated on the device first.  The
+    archive is only locked while the file is opened, since an open file can
+    be read to the end even if it is removed from the archive.
+    """
+    uf2_file = get_uf2_filepath(board_id, version, language)
+    with circfirm.backend.lock.lock(
+        circfirm.backend.lock.ARCHIVE_LOCK, exclusive=False
+    ):
+        uf2file = open(uf2_file, mode="rb", buffering=0)
+    with uf2file:
+        return _write_device_file(
+            _iter_file_chunks(uf2file),
+            os.path.join(bootloader, uf2_file.name),
+            os.fstat(uf2file.fileno()).st_size,
+            preallocate,
         )
 
-    uf2_file.parent.mkdir(parents=True, exist_ok=True)
-    with open(uf2_file, mode="wb") as uf2file:
-        uf2file.write(response.content)
 
+def _copy_mapped_uf2(
+    mapped_file: bytes | mmap.mmap, filename: str, bootloader: str, preallocate: bool
+) -> CopyResult:
+    """Copy a memory-mapped UF2 file to a device in bootloader mode."""
+    return _write_device_file(
+        _iter_buffer_chunks(mapped_file),
+        os.path.join(bootloader, filename),
+        len(mapped_file),
+        preallocate,
+    )
 
-def get_sorted_boards(board_id: str | None) -> dict[str, dict[str, set[str]]]:
-    """Get a sorted collection of boards, versions, and languages."""
-    boards: dict[str, dict[str, set[str]]] = {}
-    for board_folder in sorted(os.listdir(circfirm.UF2_ARCHIVE)):
-        versions: dict[str, list[str]] = {}
-        sorted_versions: dict[str, set[str]] = {}
-        if board_id is not None and board_id != board_folder:
-            continue
-        board_folder_full = get_board_folder(board_folder)
-        for item in os.listdir(board_folder_full):
-            version, language = circfirm.backend.parse_firmware_info(item)
+
+def _map_uf2(board_id: str, version: str, language: str) -> bytes | mmap.mmap:
+    """Memory-map a downloaded UF2 file.
+
+    The mapping is closed once it is no longer used, rather than explicitly,
+    since copies that failed may still reference it.
+    """
+    uf2_file = get_uf2_filepath(board_id, version, language)
+    with open(uf2_file, mode="rb") as uf2file:
+        # Empty files cannot be mapped
+        if not os.fstat(uf2file.fileno()).st_size:
+            return b""
+        return mmap.mmap(uf2file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def copy_uf2s(
+    jobs: Iterable[tuple[str, str, str, str]],
+    max_workers: int = 8,
+    *,
+    preallocate: bool = False,
+    use_mmap: bool = False,
+) -> Iterator[tuple[tuple[str, str, str, str], CopyResult | None, Exception | None]]:
+    """Copy downloaded UF2 files to many devices in bootloader mode in parallel.
+
+    Each job is a board ID, version, language, and bootloader location.  Jobs
+    are yielded as they finish, along with the result of the copy if it
+    succeeded, or the error that caused it to fail.
+
+    If requested, each UF2 file is memory-mapped once and then copied to
+    every device that needs it from memory, instead of each copy reading
+    the file again.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        mapped_files: dict[tuple[str, str, str], bytes | mmap.mmap | OSError] = {}
+        futures = {}
+        for job in jobs:
+            board_id, version, language, bootloader = job
+            firmware = (board_id, version, language)
+            if use_mmap and firmware not in mapped_files:
+                try:
+                    mapped_files[firmware] = _map_uf2(*firmware)
+                except OSError as err:
+                    mapped_files[firmware] = err
+            mapped_file = mapped_files.get(firmware)
+            if mapped_file is None:
+                future = executor.submit(copy_uf2, *job, preallocate=preallocate)
+            elif isinstance(mapped_file, OSError):
+                future = concurrent.futures.Future()
+                future.set_exception(mapped_file)
+            else:
+                future = executor.submit(
+                    _copy_mapped_uf2,
+                    mapped_file,
+                    circfirm.backend.get_uf2_filename(*firmware),
+                    bootloader,
+                    preallocate,
+                )
+            futures[future] = job
+        for future in concurrent.futures.as_completed(futures):
+            error = future.exception()
+            yield futures[future], None if error else future.result(), error
+
+
+def get_sorted_boards(board_id: str | None) -> dict[str, dict[str, list[str]]]:
+    """Get a sorted collection of boards, versions, and languages.
+
+    Boards are sorted by board ID, versions are sorted newest first, and
+    languages are sorted alphabetically.
+    """
+    boards: dict[str, dict[str, list[str]]] = {}
+    for entry in circfirm.backend.catalog.get_entries(board_id):
+        boards.setdefault(entry.board_id, {}).setdefault(entry.version, []).append(
+            entry.language
+        )
+    return {
+        board: {
+            version: versions[version]
+            for version in sorted(versions, reverse=True, key=packaging.version.Version)
+        }
+        for board, versions in boards.items()
+    }
+
+
+def is_pinned(
+    board_id: str,
+    version: str,
+    language: str,
+    pins: Iterable[tuple[str, str | None, str | None]],
+) -> bool:
+    """Check whether a firmware file matches any of the given pins.
+
+    Each pin is a board ID, version, and language, where a version or
+    language of None matches any.
+    """
+    return any(
+        pin_board_id == board_id
+        and pin_version in {None, version}
+        and pin_language in {None, language}
+        for pin_board_id, pin_version, pin_language in pins
+    )
+
+
+def remove_uf2s(
+    entries: Iterable[circfirm.backend.catalog.CatalogEntry],
+) -> list[circfirm.backend.catalog.CatalogEntry]:
+    """Remove cached UF2 files in one pass, returning those that were removed.
+
+    The catalog is updated once for all of them, and any board folders left
+    empty are removed as well.  The archive is locked while they are removed,
+    so that they are not removed while downloads are being moved into place
+    or while copies are opening them.
+    """
+    removed = []
+    with circfirm.backend.lock.lock(circfirm.backend.lock.ARCHIVE_LOCK):
+        for entry in entries:
             try:
-                version_set = set(versions[version])
-                version_set.add(language)
-                versions[version] = sorted(version_set)
-            except KeyError:
-                versions[version] = [language]
-        for sorted_version in sorted(
-            versions, reverse=True, key=packaging.version.Version
-        ):
-            sorted_versions[sorted_version] = versions[sorted_version]
-        boards[board_folder] = sorted_versions
-    return boards
+                get_uf2_filepath(entry.board_id, entry.version, entry.language).unlink(
+                    missing_ok=True
+                )
+            except OSError:
+                continue
+            removed.append(entry)
+
+        circfirm.backend.catalog.remove_firmware(
+            (entry.board_id, entry.version, entry.language) for entry in removed
+        )
+        for board_id in {entry.board_id for entry in removed}:
+            try:  # Remove the board folder if this left it empty
+                get_board_folder(board_id).rmdir()
+            except OSError:
+                pass
+    return removed
+
+
+def remove_abandoned_downloads(
+    board_ids: Iterable[str],
+    matches: Callable[[str, str, str], bool] | None = None,
+) -> list[pathlib.Path]:
+    """Remove the temporary files of abandoned downloads for some boards from the archive.
+
+    Downloads are abandoned when their process exits or is killed partway
+    through them.  Downloads still in progress hold the lock for their file,
+    so they are left alone.  Only the folders of the board IDs are checked,
+    rather than the whole archive.  If given, only the downloads for which
+    matches returns true, given their board ID, version, and language, are
+    removed.  The removed temporary files are returned.
+    """
+    removed = []
+    with circfirm.backend.lock.lock(circfirm.backend.lock.ARCHIVE_LOCK):
+        for board_id in set(board_ids):
+            board_folder = get_board_folder(board_id)
+            removed_from_folder = False
+            try:
+                temp_files = list(board_folder.iterdir())
+            except OSError:
+                continue
+            for temp_file in temp_files:
+                if not is_partial_download(temp_file.name):
+                    continue
+                file = _get_partial_download_filename(temp_file.name)
+                try:
+                    version, language = circfirm.backend.parse_firmware_info(file)
+                except ValueError:
+                    continue
+                if matches is not None and not matches(
+                    board_folder.name, version, language
+                ):
+                    continue
+                with circfirm.backend.lock.try_lock(file) as acquired:
+                    if not acquired:
+                        continue
+                    try:
+                        temp_file.unlink()
+                    except OSError:
+                        continue
+                removed.append(temp_file)
+                removed_from_folder = True
+            if removed_from_folder:
+                try:  # Remove the board folder if this left it empty
+                    board_folder.rmdir()
+                except OSError:
+                    pass
+    return removed
+
+
+def evict_uf2s(
+    max_size: int,
+    pins: Iterable[tuple[str, str | None, str | None]] = (),
+    keep: Iterable[tuple[str, str, str]] = (),
+) -> list[circfirm.backend.catalog.CatalogEntry]:
+    """Remove the least recently used UF2 files until the archive fits in a size.
+
+    The size is in bytes.  Firmware files matching any of the pins (see
+    is_pinned()), as well as those given to keep as a board ID, version, and
+    language, are never removed, so the archive may stay larger than the
+    size.  The removed firmware files are returned.
+    """
+    pins = list(pins)
+    keep = set(keep)
+    entries = circfirm.backend.catalog.get_least_recently_used()
+    total_size = sum(entry.size for entry in entries)
+    evictable = []
+    for entry in entries:
+        if total_size <= max_size:
+            break
+        firmware = (entry.board_id, entry.version, entry.language)
+        if firmware in keep or is_pinned(*firmware, pins):
+            continue
+        total_size -= entry.size
+        evictable.append(entry)
+    return remove_uf2s(evictable)
+
+
+def get_prunable_uf2s(
+    keep_latest: int | None = None,
+    pre_releases: bool = False,
+    languages: Collection[str] | None = None,
+    pins: Iterable[tuple[str, str | None, str | None]] = (),
+) -> list[circfirm.backend.catalog.CatalogEntry]:
+    """Get the cached UF2 files that a retention policy would remove.
+
+    Versions are compared for each board and language separately, newest
+    first.  The policy can keep only the given number of the newest stable
+    versions, remove pre-release versions older than the newest stable
+    version, and remove languages that are not in the given languages.
+    Firmware files matching any of the pins (see is_pinned()) are always
+    kept.  The firmware files are returned ordered by board ID, language,
+    and then version (newest first).
+    """
+    pins = list(pins)
+    groups: dict[tuple[str, str], list[circfirm.backend.catalog.CatalogEntry]] = {}
+    for entry in circfirm.backend.catalog.get_entries():
+        groups.setdefault((entry.board_id, entry.language), []).append(entry)
+
+    prunable = []
+    for board_language in sorted(groups):
+        entries = sorted(
+            groups[board_language],
+            key=lambda entry: packaging.version.Version(entry.version),
+            reverse=True,
+        )
+        if languages is not None and board_language[1] not in languages:
+            prunable.extend(entries)
+            continue
+        versions = [packaging.version.Version(entry.version) for entry in entries]
+        stable = [version for version in versions if not version.is_prerelease]
+        removed = set()
+        if keep_latest is not None:
+            removed.update(stable[keep_latest:])
+        if pre_releases and stable:
+            removed.update(
+                version
+                for version in versions
+                if version.is_prerelease and version < stable[0]
+            )
+        prunable.extend(
+            entry
+            for entry, version in zip(entries, versions, strict=True)
+            if version in removed
+        )
+    return [entry for entry in prunable if not is_pinned(*entry[:3], pins)]
@@ -0,0 +1,288 @@
+# SPDX-FileCopyrightText: 2026 Alec Delaney
+# SPDX-License-Identifier: MIT
+
+"""Backend functionality for working with the catalog of cached firmware.
+
+Author(s): Alec Delaney
+"""
+
+import contextlib
+import os
+import pathlib
+import sqlite3
+import time
+from collections.abc import Iterable, Iterator
+from typing import NamedTuple
+
+import circfirm
+import circfirm.backend
+
+SCHEMA_VERSION = 2
+SCHEMA = """
+DROP TABLE IF EXISTS firmware;
+DROP TABLE IF EXISTS boards;
+CREATE TABLE firmware (
+    board_id TEXT NOT NULL,
+    version TEXT NOT NULL,
+    language TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (board_id, version, language)
+) WITHOUT ROWID;
+CREATE TABLE boards (
+    board_id TEXT PRIMARY KEY,
+    signature TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+CONNECT_TIMEOUT = 30
+
+
+class CatalogEntry(NamedTuple):
+    """A firmware file in the catalog of cached firmware."""
+
+    board_id: str
+    version: str
+    language: str
+    size: int
+
+
+def _create_tables(connection: sqlite3.Connection) -> None:
+    """Create the catalog tables, unless another connection just created them.
+
+    This is done in one write transaction, so that connections opened at
+    the same time do not create the tables over each other.
+    """
+    with connection:
+        connection.execute("BEGIN IMMEDIATE")
+        (user_version,) = connection.execute("PRAGMA user_version").fetchone()
+        if user_version == SCHEMA_VERSION:
+            return
+        for statement in SCHEMA.split(";"):
+            if statement.strip():
+                connection.execute(statement)
+        connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+@contextlib.contextmanager
+def _connect() -> Iterator[sqlite3.Connection]:
+    """Open a connection to the catalog, creating it if needed.
+
+    Catalogs from older versions are emptied, since they can be rebuilt from
+    the archive.
+    """
+    catalog_path = pathlib.Path(circfirm.ARCHIVE_CATALOG)
+    catalog_path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(catalog_path, timeout=CONNECT_TIMEOUT)
+    try:
+        (user_version,) = connection.execute("PRAGMA user_version").fetchone()
+        if user_version != SCHEMA_VERSION:
+            _create_tables(connection)
+        yield connection
+    finally:
+        connection.close()
+
+
+def _get_signature(path: str) -> str | None:
+    """Get a signature of a board folder that changes whenever its contents do.
+
+    The change time is included since, unlike the modification time, it
+    cannot be set to an earlier value when the folder is copied or restored.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{stat.st_ino}:{stat.st_mtime_ns}:{stat.st_ctime_ns}"
+
+
+def _scan_board_folder(board_id: str) -> list[tuple[CatalogEntry, float]]:
+    """Get the firmware files in a board folder of the archive.
+
+    Each file is returned along with its modification time, which is used as
+    its last use if it has not been cataloged yet.  Files that are not
+    firmware files (including in-progress downloads) are skipped.
+    """
+    entries = []
+    try:
+        with os.scandir(os.path.join(circfirm.UF2_ARCHIVE, board_id)) as items:
+            for item in items:
+                try:
+                    version, language = circfirm.backend.parse_firmware_info(item.name)
+                    stat = item.stat()
+                except (ValueError, OSError):
+                    continue
+                entries.append(
+                    (
+                        CatalogEntry(board_id, version, language, stat.st_size),
+                        stat.st_mtime,
+                    )
+                )
+    except OSError:
+        pass
+    return entries
+
+
+def sync() -> None:
+    """Bring the catalog up to date with the archive.
+
+    Only the board folders that changed since they were last scanned are
+    scanned again, so this only lists the archive folder and checks each of
+    the board folders in it.  The last use of files that were already
+    cataloged is kept.
+    """
+    try:
+        board_ids = os.listdir(circfirm.UF2_ARCHIVE)
+    except FileNotFoundError:
+        board_ids = []
+    signatures = {
+        board_id: _get_signature(os.path.join(circfirm.UF2_ARCHIVE, board_id))
+        for board_id in board_ids
+    }
+    with _connect() as connection:
+        stored = dict(connection.execute("SELECT board_id, signature FROM boards"))
+        cataloged = {
+            board_id
+            for (board_id,) in connection.execute(
+                "SELECT DISTINCT board_id FROM firmware"
+            )
+        }
+        changed = [
+            board_id
+            for board_id, signature in signatures.items()
+            if signature is not None and stored.get(board_id) != signature
+        ]
+        removed = (cataloged | set(stored)) - {
+            board_id
+            for board_id, signature in signatures.items()
+            if signature is not None
+        }
+        if not changed and not removed:
+            return
+
+        # Signatures are taken before scanning, so any changes made during
+        # the scan are picked up by the next sync
+        scanned = [
+            (*entry, mtime)
+            for board_id in changed
+            for entry, mtime in _scan_board_folder(board_id)
+        ]
+        found = {tuple(row[:3]) for row in scanned}
+        missing = [
+            row
+            for board_id in changed
+            for row in connection.execute(
+                "SELECT board_id, version, language FROM firmware WHERE board_id = ?",
+                (board_id,),
+            )
+            if row not in found
+        ]
+        with connection:
+            stale = [(board_id,) for board_id in removed]
+            connection.executemany("DELETE FROM firmware WHERE board_id = ?", stale)
+            connection.executemany(
+                "DELETE FROM boards WHERE board_id = ?",
+                [*stale, *((board_id,) for board_id in changed)],
+            )
+            connection.executemany(
+                "DELETE FROM firmware "
+                "WHERE board_id = ? AND version = ? AND language = ?",
+                missing,
+            )
+            connection.executemany(
+                "INSERT INTO firmware VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (board_id, version, language) "
+                "DO UPDATE SET size = excluded.size",
+                scanned,
+            )
+            connection.executemany(
+                "INSERT INTO boards VALUES (?, ?)",
+                [(board_id, signatures[board_id]) for board_id in changed],
+            )
+
+
+def rebuild() -> int:
+    """Rebuild the catalog from the archive, returning the number of firmware files."""
+    clear()
+    sync()
+    return len(get_entries())
+
+
+def clear() -> None:
+    """Remove every entry from the catalog."""
+    with _connect() as connection, connection:
+        connection.execute("DELETE FROM firmware")
+        connection.execute("DELETE FROM boards")
+
+
+def add_firmware(board_id: str, version: str, language: str, size: int) -> None:
+    """Add a firmware file that was added to the archive to the catalog.
+
+    The firmware file is marked as just used.  The board folder is still
+    scanned again by the next sync, which keeps the catalog correct if other
+    files in it changed at the same time.
+    """
+    with _connect() as connection, connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO firmware VALUES (?, ?, ?, ?, ?)",
+            (board_id, version, language, size, time.time()),
+        )
+
+
+def touch_firmware(board_id: str, version: str, language: str) -> None:
+    """Mark a cached firmware file as just used.
+
+    The catalog is synced with the archive first, so that firmware files
+    that have not been cataloged yet are marked as well.
+    """
+    sync()
+    with _connect() as connection, connection:
+        connection.execute(
+            "UPDATE firmware SET last_used = ? "
+            "WHERE board_id = ? AND version = ? AND language = ?",
+            (time.time(), board_id, version, language),
+        )
+
+
+def remove_firmware(firmwares: Iterable[tuple[str, str, str]]) -> None:
+    """Remove firmware files that were deleted from the archive from the catalog.
+
+    Each firmware file is given as a board ID, version, and language.
+    """
+    with _connect() as connection, connection:
+        connection.executemany(
+            "DELETE FROM firmware WHERE board_id = ? AND version = ? AND language = ?",
+            firmwares,
+        )
+
+
+def get_entries(board_id: str | None = None) -> list[CatalogEntry]:
+    """Get the cached firmware files, optionally for a specific board.
+
+    The catalog is synced with the archive first.  Entries are ordered by
+    board ID, version, and then language.
+    """
+    sync()
+    query = "SELECT board_id, version, language, size FROM firmware"
+    params: tuple[str, ...] = ()
+    if board_id is not None:
+        query += " WHERE board_id = ?"
+        params = (board_id,)
+    with _connect() as connection:
+        rows = connection.execute(
+            f"{query} ORDER BY board_id, version, language", params
+        )
+        return [CatalogEntry(*row) for row in rows]
+
+
+def get_least_recently_used() -> list[CatalogEntry]:
+    """Get the cached firmware files, ordered from least to most recently used.
+
+    The catalog is synced with the archive first.
+    """
+    sync()
+    with _connect() as connection:
+        rows = connection.execute(
+            "SELECT board_id, version, language, size FROM firmware "
+            "ORDER BY last_used, board_id, version, language"
+        )
+        return [CatalogEntry(*row) for row in rows]
@@ -6,8 +6,17 @@
 Author(s): Alec Delaney
 """
 
+import concurrent.futures
+import os
 import pathlib
+import platform
 import re
+import select
+import threading
+import time
+from collections.abc import Callable, Collection, Iterator
+from types import TracebackType
+from typing import NamedTuple
 
 import psutil
 
@@ -17,6 +26,95 @@ BOARD_ID_REGEX = r"Board ID:\s*(.*)"
 BOARD_VER_REGEX = (
     r"Adafruit CircuitPython (\d+\.\d+\.\d+(?:-(?:\balpha\b|\bbeta\b)\.\d+)*)"
 )
+UF2_BOARD_ID_REGEX = r"Board-ID:?\s*(.*)"
+UF2_BOOTLOADER_VER_REGEX = r"UF2 Bootloader v?(\S+)"
+UF2_MODEL_REGEX = r"Model:\s*(.*)"
+
+MOUNTINFO_FILE = "/proc/self/mountinfo"
+SYSFS_BLOCK_FOLDER = "/sys/class/block"
+DEVICE_FILESYSTEMS = frozenset(
+    ("vfat", "msdos", "exfat", "fat", "fat12", "fat16", "fat32")
+)
+PROBE_TIMEOUT = 1.0
+WAIT_MIN_INTERVAL = 0.05
+WAIT_MAX_INTERVAL = 0.5
+
+_STUCK_PROBES: dict[str, concurrent.futures.Future[str | None]] = {}
+_STUCK_PROBES_LOCK = threading.Lock()
+
+
+class Device(NamedTuple):
+    """A connected CircuitPython device.
+
+    For devices in bootloader mode, the board ID and version are those of the
+    bootloader.
+    """
+
+    path: str
+    bootloader: bool
+    board_id: str | None
+    version: str | None
+
+
+class MountWatcher:
+    """Watcher for changes to the mounted filesystems.
+
+    On Linux, the mount table is watched so that waiting ends as soon as a
+    filesystem is mounted or unmounted.  Elsewhere, waiting simply sleeps.
+    """
+
+    def __init__(self) -> None:
+        """Start watching the mount table, if it is supported."""
+        self._mountinfo = None
+        self._poller = None
+        if hasattr(select, "poll") and os.path.exists(MOUNTINFO_FILE):
+            try:
+                self._mountinfo = open(MOUNTINFO_FILE, "rb")
+                self._mountinfo.read()
+                self._poller = select.poll()
+                self._poller.register(self._mountinfo, select.POLLPRI | select.POLLERR)
+            except OSError:  # pragma: no cover
+                self.close()
+
+    @property
+    def is_watching(self) -> bool:
+        """Whether changes to the mount table are being watched."""
+        return self._poller is not None
+
+    def wait(self, timeout: float) -> bool:
+        """Wait up to the timeout (in seconds) for the mounted filesystems to change.
+
+        Returns whether a change was seen.
+        """
+        if self._poller is None:
+            time.sleep(timeout)
+            return False
+        if not self._poller.poll(timeout * 1000):
+            return False
+        # The mount table needs to be read again before the next change is reported
+        self._mountinfo.seek(0)
+        self._mountinfo.read()
+        return True
+
+    def close(self) -> None:
+        """Stop watching the mount table."""
+        if self._mountinfo is not None:
+            self._mountinfo.close()
+        self._mountinfo = None
+        self._poller = None
+
+    def __enter__(self) -> "MountWatcher":
+        """Enter a context that stops watching the mount table on exit."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Stop watching the mount table."""
+        self.close()
 
 
 def get_board_info(device_path: str) -> tuple[str, str]:
@@ -33,16 +131,187 @@ def get_board_info(device_path: str) -> tuple[str, str]:
     return board_match[1], version_match[1]
 
 
+def get_bootloader_info(device_path: str) -> tuple[str, str]:
+    """Get the attached bootloader's board ID and version."""
+    uf2info_file = pathlib.Path(device_path) / circfirm.UF2INFO_FILE
+    with open(uf2info_file, encoding="utf-8") as infofile:
+        contents = infofile.read()
+    board_match = re.search(UF2_BOARD_ID_REGEX, contents)
+    if not board_match:
+        raise ValueError("Could not parse the board ID from the UF2 info file")
+    version_match = re.search(UF2_BOOTLOADER_VER_REGEX, contents)
+    if not version_match:
+        raise ValueError(
+            "Could not parse the bootloader version from the UF2 info file"
+        )
+    return board_match[1].strip(), version_match[1]
+
+
+def get_bootloader_model(device_path: str) -> str | None:
+    """Get the attached bootloader's model name, if it is listed."""
+    uf2info_file = pathlib.Path(device_path) / circfirm.UF2INFO_FILE
+    with open(uf2info_file, encoding="utf-8") as infofile:
+        contents = infofile.read()
+    model_match = re.search(UF2_MODEL_REGEX, contents)
+    return model_match[1].strip() if model_match else None
+
+
+def _is_candidate(fstype: str, opts: str) -> bool:
+    """Check whether a partition could be a CircuitPython device."""
+    if platform.system() == "Windows":  # pragma: no cover
+        drive_types = opts.split(",")
+        return "remote" not in drive_types and "cdrom" not in drive_types
+    return fstype.lower() in DEVICE_FILESYSTEMS
+
+
+def _is_removable(device: str, opts: str) -> bool:
+    """Check whether a partition is reported as being on removable media."""
+    if platform.system() == "Windows":  # pragma: no cover
+        return "removable" in opts.split(",")
+    block_path = pathlib.Path(SYSFS_BLOCK_FOLDER) / os.path.basename(
+        os.path.realpath(device)
+    )
+    # Partitions do not have a removable flag, but the disks they are on do
+    for device_path in (block_path, block_path.resolve().parent):
+        try:
+            return (device_path / "removable").read_text().strip() == "1"
+        except OSError:
+            continue
+    return False
+
+
+def _get_candidate_mounts() -> list[str]:
+    """Get the mount points that could be CircuitPython devices.
+
+    Mount points on removable media are listed first.
+    """
+    partitions = [
+        partition
+        for partition in psutil.disk_partitions()
+        if _is_candidate(partition.fstype, partition.opts)
+    ]
+    partitions.sort(
+        key=lambda partition: not _is_removable(partition.device, partition.opts)
+    )
+    return [partition.mountpoint for partition in partitions]
+
+
+def _start_probe(
+    mountpoint: str, filenames: tuple[str, ...]
+) -> concurrent.futures.Future[str | None]:
+    """Start checking which of the given files exists on a mount point in the background.
+
+    The result is the first of the files that exists, if any.  Daemon threads
+    are used so that a probe stuck on an unresponsive mount never prevents the
+    process from exiting.
+    """
+    future: concurrent.futures.Future[str | None] = concurrent.futures.Future()
+
+    def probe() -> None:
+        """Check which of the files exists."""
+        try:
+            for filename in filenames:
+                if (pathlib.Path(mountpoint) / filename).exists():
+                    future.set_result(filename)
+                    return
+            future.set_result(None)
+        except OSError:  # pragma: no cover
+            future.set_result(None)
+
+    threading.Thread(target=probe, daemon=True).start()
+    return future
+
+
+def _probe_mounts(
+    mountpoints: list[str], filenames: tuple[str, ...]
+) -> list[tuple[str, str]]:
+    """Get the mount points that have one of the given files, in the order given.
+
+    Each mount point is returned along with the first of the files it has.
+    The mount points are checked in parallel, and any that do not respond
+    within the probe timeout are skipped until their check finishes.
+    """
+    probes: dict[str, concurrent.futures.Future[str | None]] = {}
+    with _STUCK_PROBES_LOCK:
+        for mountpoint in mountpoints:
+            stuck_probe = _STUCK_PROBES.get(mountpoint)
+            if stuck_probe is not None:
+                if not stuck_probe.done():
+                    continue
+                del _STUCK_PROBES[mountpoint]
+            probes[mountpoint] = _start_probe(mountpoint, filenames)
+
+    found = []
+    deadline = time.monotonic() + PROBE_TIMEOUT
+    for mountpoint, probe in probes.items():
+        try:
+            filename = probe.result(max(deadline - time.monotonic(), 0))
+        except concurrent.futures.TimeoutError:
+            with _STUCK_PROBES_LOCK:
+                _STUCK_PROBES[mountpoint] = probe
+            continue
+        if filename is not None:
+            found.append((mountpoint, filename))
+    return found
+
+
 def _find_device(filename: str) -> str | None:
     """Find a specific connected device."""
-    for partition in psutil.disk_partitions():
+    devices = _probe_mounts(_get_candidate_mounts(), (filename,))
+    return devices[0][0] if devices else None
+
+
+def find_devices() -> list[Device]:
+    """Find every connected CircuitPython device, in either mode.
+
+    The partitions are only scanned once.  The board ID and version are read
+    from each device, and are None if they cannot be determined.
+    """
+    devices = []
+    probe_files = (circfirm.BOOTOUT_FILE, circfirm.UF2INFO_FILE)
+    for mountpoint, filename in _probe_mounts(_get_candidate_mounts(), probe_files):
+        bootloader = filename == circfirm.UF2INFO_FILE
+        get_info = get_bootloader_info if bootloader else get_board_info
         try:
-            bootout_file = pathlib.Path(partition.mountpoint) / filename
-            if bootout_file.exists():
-                return partition.mountpoint
-        except PermissionError:  # pragma: no cover
-            pass
-    return None
+            board_id, version = get_info(mountpoint)
+        except (OSError, ValueError):
+            board_id, version = None, None
+        devices.append(Device(mountpoint, bootloader, board_id, version))
+    return devices
+
+
+def watch_bootloaders() -> Iterator[Device]:
+    """Watch for CircuitPython devices in bootloader mode being connected.
+
+    Devices that are already connected are yielded first, and a device is
+    yielded again if it is disconnected and then connected again.  Like
+    waiting for a single device, the devices are checked whenever the
+    mounted filesystems change as well as periodically with a backoff.
+    """
+    connected: set[str] = set()
+    interval = WAIT_MIN_INTERVAL
+    with MountWatcher() as watcher:
+        while True:
+            bootloaders = find_bootloaders()
+            connected &= {bootloader.path for bootloader in bootloaders}
+            for bootloader in bootloaders:
+                if bootloader.path not in connected:
+                    connected.add(bootloader.path)
+                    yield bootloader
+            if watcher.wait(interval):
+                interval = WAIT_MIN_INTERVAL
+            else:
+                interval = min(interval * 2, WAIT_MAX_INTERVAL)
+
+
+def find_circuitpys() -> list[Device]:
+    """Find every connected CircuitPython device in non-bootloader mode."""
+    return [device for device in find_devices() if not device.bootloader]
+
+
+def find_bootloaders() -> list[Device]:
+    """Find every connected CircuitPython device in bootloader mode."""
+    return [device for device in find_devices() if device.bootloader]
 
 
 def find_circuitpy() -> str | None:
@@ -53,3 +322,60 @@ def find_circuitpy() -> str | None:
 def find_bootloader() -> str | None:
     """Find CircuitPython device in bootloader mode."""
     return _find_device(circfirm.UF2INFO_FILE)
+
+
+def _wait_for_device(
+    find_device: Callable[[], str | None], timeout: float | None
+) -> str | None:
+    """Wait for a specific device to be connected.
+
+    The devices are checked whenever the mounted filesystems change, as well
+    as periodically with a backoff, since not every platform (or device)
+    reports mount changes.  Returns None if the timeout (in seconds) passes
+    first.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    interval = WAIT_MIN_INTERVAL
+    with MountWatcher() as watcher:
+        while not (device := find_device()):
+            wait_time = interval
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                wait_time = min(wait_time, remaining)
+            if watcher.wait(wait_time):
+                interval = WAIT_MIN_INTERVAL
+            else:
+                interval = min(interval * 2, WAIT_MAX_INTERVAL)
+    return device
+
+
+def wait_for_bootloader(timeout: float | None = None) -> str | None:
+    """Wait for a CircuitPython device in bootloader mode to be connected."""
+    return _wait_for_device(find_bootloader, timeout)
+
+
+def wait_for_circuitpy(
+    timeout: float | None = None,
+    *,
+    board_id: str | None = None,
+    ignore: Collection[str] = (),
+) -> str | None:
+    """Wait for a CircuitPython device in non-bootloader mode to be connected.
+
+    If a board ID is given, only devices with that board ID are waited on.
+    Devices at any of the locations to ignore (such as those that were
+    already connected) are skipped.
+    """
+    if board_id is None and not ignore:
+        return _wait_for_device(find_circuitpy, timeout)
+
+    def find_matching_circuitpy() -> str | None:
+        """Find a matching CircuitPython device in non-bootloader mode."""
+        for device in find_circuitpys():
+            if device.path not in ignore and board_id in {None, device.board_id}:
+                return device.path
+        return None
+
+    return _wait_for_device(find_matching_circuitpy, timeout)
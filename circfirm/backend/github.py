@@ -6,20 +6,36 @@
 Author(s): Alec Delaney
 """
 
+import codecs
+import concurrent.futures
 import datetime
+import http
+import json
+import os
+import pathlib
 import re
-from typing import TypedDict
+import tempfile
+from collections.abc import Iterable, Iterator
+from typing import Any, NamedTuple, TypedDict
 
 import requests
 
+import circfirm
+import circfirm.backend.session
+
 BASE_REQUESTS_HEADERS = {
     "Accept": "application/vnd.github+json",
     "X-GitHub-Api-Version": "2022-11-28",
 }
 
+TREES_URL = "https://api.github.com/repos/adafruit/circuitpython/git/trees"
+ZEPHYR_BOARDS_PATH = "ports/zephyr-cp/boards"
+
 NONZEPHYR_BOARDS_REGEX = r"ports/(.+)/boards/([^/]+)"
 ZEPHYR_BOARDS_REGEX = r"ports/zephyr-cp/boards/(.+/[^/]+)"
 
+STREAM_CHUNK_SIZE = 64 * 1024
+
 
 class RateLimit(TypedDict):
     """Format of a rate limit dictionary."""
@@ -42,9 +58,17 @@ class GitTreeItem(TypedDict):
     url: str
 
 
+class BoardList(NamedTuple):
+    """A board ID list along with the git tree it was taken from."""
+
+    boards: list[str]
+    sha: str
+    etag: str | None
+
+
 def get_rate_limit() -> tuple[int, int, datetime.datetime]:
     """Get the rate limit for the GitHub REST endpoint."""
-    response = requests.get(
+    response = circfirm.backend.session.get(
         url="https://api.github.com/rate_limit",
         headers=BASE_REQUESTS_HEADERS,
     )
@@ -55,35 +79,249 @@ def get_rate_limit() -> tuple[int, int, datetime.datetime]:
     return available, total, reset_time
 
 
-def get_board_id_list(token: str) -> list[str]:
-    """Get a list of CircuitPython boards."""
-    boards = set()
-    headers = BASE_REQUESTS_HEADERS.copy()
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
-    response = requests.get(
-        url="https://api.github.com/repos/adafruit/circuitpython/git/trees/main",
-        params={
-            "recursive": True,
-        },
-        headers=headers,
+def read_board_list() -> BoardList | None:
+    """Read the stored board ID list, if one has been stored."""
+    metadata: dict[str, str] = {}
+    boards = []
+    try:
+        with open(circfirm.UF2_BOARD_LIST, encoding="utf-8") as boardfile:
+            for raw_line in boardfile:
+                line = raw_line.strip()
+                if line.startswith("#"):
+                    key, _, value = line[1:].partition(":")
+                    metadata[key.strip()] = value.strip()
+                elif line:
+                    boards.append(line)
+    except OSError:
+        return None
+    if "sha" not in metadata:
+        return None
+    return BoardList(boards, metadata["sha"], metadata.get("etag") or None)
+
+
+def write_board_list(board_list: BoardList) -> None:
+    """Store a board ID list, replacing any previously stored one."""
+    board_list_file = pathlib.Path(circfirm.UF2_BOARD_LIST)
+    board_list_file.parent.mkdir(parents=True, exist_ok=True)
+    temp_fd, temp_filepath = tempfile.mkstemp(
+        prefix=f".{board_list_file.name}.", dir=board_list_file.parent
     )
     try:
-        tree_items: list[GitTreeItem] = response.json()["tree"]
-    except KeyError as err:
-        raise ValueError("Could not parse JSON response, check token") from err
-    for tree_item in tree_items:
-        if tree_item["type"] != "tree":
-            continue
+        with os.fdopen(temp_fd, mode="w", encoding="utf-8") as boardfile:
+            boardfile.write(f"# sha: {board_list.sha}\n")
+            boardfile.write(f"# etag: {board_list.etag or ''}\n")
+            boardfile.writelines(f"{board}\n" for board in board_list.boards)
+        os.replace(temp_filepath, board_list_file)
+    except BaseException:
+        pathlib.Path(temp_filepath).unlink(missing_ok=True)
+        raise
+
+
+class _JSONObjectStream:
+    """Incremental reader for a JSON object arriving in chunks of text."""
+
+    def __init__(self, chunks: Iterable[str]) -> None:
+        """Initialize the reader with the chunks of text to read."""
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Read the next chunk of text into the buffer, if there is one."""
+        for chunk in self._chunks:
+            if chunk:
+                self._buffer = self._buffer[self._pos :] + chunk
+                self._pos = 0
+                return True
+        self._eof = True
+        return False
 
-        # Zephyr boards are organized differently, and require some modifications to the name
-        if zephyr_match := re.match(ZEPHYR_BOARDS_REGEX, tree_item["path"]):
-            result = zephyr_match[1].replace("/", "_")
-            boards.add(result)
+    def peek(self) -> str:
+        """Get the next non-whitespace character without consuming it."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise json.JSONDecodeError("Unexpected end of data", self._buffer, 0)
 
-        # Non-Zephyr boards are all organized the same
-        elif nonzephyr_match := re.match(NONZEPHYR_BOARDS_REGEX, tree_item["path"]):
-            if nonzephyr_match[1] == "zephyr-cp":
+    def expect(self, char: str) -> None:
+        """Consume the next non-whitespace character, which must be the given one."""
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expected {char!r}", self._buffer, self._pos)
+        self._pos += 1
+
+    def skip(self, char: str) -> bool:
+        """Consume the next non-whitespace character if it is the given one."""
+        if self.peek() == char:
+            self._pos += 1
+            return True
+        return False
+
+    def decode(self) -> Any:
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A value at the end of the buffer (like a number) may continue in the next chunk
+            if end == len(self._buffer) and not self._eof and self._fill():
                 continue
-            boards.add(nonzephyr_match[2])
-    return sorted(boards)
+            self._pos = end
+            return value
+
+
+def _iter_tree_items(
+    chunks: Iterable[str], metadata: dict[str, Any]
+) -> Iterator[GitTreeItem]:
+    """Iterate through the items of a git tree response as it is read.
+
+    Only the tree directory items are yielded, and the other top-level
+    values of the response are stored in the given metadata dictionary.
+    """
+    stream = _JSONObjectStream(chunks)
+    stream.expect("{")
+    while not stream.skip("}"):
+        stream.skip(",")
+        key = stream.decode()
+        stream.expect(":")
+        if key != "tree":
+            metadata[key] = stream.decode()
+            continue
+        stream.expect("[")
+        while not stream.skip("]"):
+            stream.skip(",")
+            tree_item: GitTreeItem = stream.decode()
+            if tree_item["type"] == "tree":
+                yield tree_item
+
+
+def _parse_board_id(path: str) -> str | None:
+    """Get the board ID of a folder in the repository, if it is a board folder."""
+    # Zephyr boards are organized differently, and require some modifications to the name
+    if zephyr_match := re.match(ZEPHYR_BOARDS_REGEX, path):
+        return zephyr_match[1].replace("/", "_")
+
+    # Non-Zephyr boards are all organized the same
+    if nonzephyr_match := re.match(NONZEPHYR_BOARDS_REGEX, path):
+        if nonzephyr_match[1] != "zephyr-cp":
+            return nonzephyr_match[2]
+    return None
+
+
+def _get_tree(path: str, headers: dict[str, str]) -> requests.Response:
+    """Request the git tree of a folder on the main branch, without reading it."""
+    return circfirm.backend.session.get(
+        url=f"{TREES_URL}/main:{path}",
+        headers=headers,
+        stream=True,
+    )
+
+
+def _read_tree(
+    response: requests.Response, metadata: dict[str, Any] | None = None
+) -> list[GitTreeItem]:
+    """Read the folders of a git tree response, closing it afterwards."""
+    if metadata is None:
+        metadata = {}
+    with response:
+        chunks = codecs.iterdecode(response.iter_content(STREAM_CHUNK_SIZE), "utf-8")
+        return list(_iter_tree_items(chunks, metadata))
+
+
+def _get_subtree(path: str, headers: dict[str, str]) -> tuple[str, list[GitTreeItem]]:
+    """Get the folders of a folder in the repository, if it exists."""
+    response = _get_tree(path, headers)
+    if response.status_code == http.HTTPStatus.NOT_FOUND:
+        response.close()
+        return path, []
+    if not response.ok:
+        response.close()
+        raise ValueError("Could not parse JSON response, check token")
+    return path, _read_tree(response)
+
+
+def _stream_board_ids(
+    ports: list[str],
+    headers: dict[str, str],
+    board_list: BoardList,
+    max_workers: int,
+) -> Iterator[str]:
+    """Iterate through the board IDs of the given ports as they are found.
+
+    The boards folder of each port is fetched in parallel, along with the
+    vendor folders of the Zephyr port.  Once every folder has been fetched,
+    the board ID list is stored.
+    """
+    boards: set[str] = set()
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        pending = {
+            executor.submit(_get_subtree, f"ports/{port}/boards", headers)
+            for port in ports
+        }
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                subtree_path, tree_items = future.result()
+                for tree_item in tree_items:
+                    path = f"{subtree_path}/{tree_item['path']}"
+                    # Zephyr boards are nested in vendor folders
+                    if subtree_path == ZEPHYR_BOARDS_PATH:
+                        pending.add(executor.submit(_get_subtree, path, headers))
+                    board = _parse_board_id(path)
+                    if board is not None and board not in boards:
+                        boards.add(board)
+                        yield board
+    board_list.boards.extend(sorted(boards))
+    write_board_list(board_list)
+
+
+def iter_board_ids(
+    token: str, *, refresh: bool = False, max_workers: int = 8
+) -> Iterator[str]:
+    """Get the CircuitPython board IDs, in the order they are found.
+
+    Only the ports folder is requested before returning.  The boards folder
+    of each port is then fetched in parallel as the board IDs are used,
+    which transfers much less than the recursive tree of the whole
+    repository (and is never truncated).
+
+    The list is stored locally along with the ETag of the ports folder it
+    was taken from.  Unless a refresh is requested, the stored list is
+    revalidated with a conditional request and reused if the ports folder
+    has not changed, which avoids fetching any of the boards folders.
+    """
+    headers = BASE_REQUESTS_HEADERS.copy()
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    stored = None if refresh else read_board_list()
+    ports_headers = headers.copy()
+    if stored is not None and stored.etag:
+        ports_headers["If-None-Match"] = stored.etag
+    response = _get_tree("ports", ports_headers)
+    if stored is not None and response.status_code == http.HTTPStatus.NOT_MODIFIED:
+        response.close()
+        return iter(stored.boards)
+    if not response.ok:
+        response.close()
+        raise ValueError("Could not parse JSON response, check token")
+    metadata: dict[str, Any] = {}
+    ports = [tree_item["path"] for tree_item in _read_tree(response, metadata)]
+    if "sha" not in metadata:
+        raise ValueError("Could not parse JSON response, check token")
+    board_list = BoardList([], metadata["sha"], response.headers.get("ETag"))
+    return _stream_board_ids(ports, headers, board_list, max_workers)
+
+
+def get_board_id_list(token: str, *, refresh: bool = False) -> list[str]:
+    """Get a sorted list of CircuitPython boards."""
+    return sorted(iter_board_ids(token, refresh=refresh))
@@ -0,0 +1,139 @@
+# SPDX-FileCopyrightText: 2026 Alec Delaney
+# SPDX-License-Identifier: MIT
+
+"""Backend functionality for working with the local index of released firmware.
+
+Author(s): Alec Delaney
+"""
+
+import contextlib
+import datetime
+import os
+import pathlib
+import sqlite3
+import tempfile
+import time
+from collections.abc import Iterable, Iterator
+from typing import NamedTuple
+
+import packaging.version
+
+import circfirm
+
+SCHEMA = """
+CREATE TABLE firmware (
+    board_id TEXT NOT NULL,
+    language TEXT NOT NULL,
+    version TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT NOT NULL,
+    PRIMARY KEY (board_id, language, version)
+) WITHOUT ROWID;
+CREATE TABLE metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class IndexEntry(NamedTuple):
+    """An entry in the index of released firmware."""
+
+    board_id: str
+    language: str
+    version: str
+    size: int
+    etag: str
+
+
+def index_exists() -> bool:
+    """Check whether the index of released firmware has been built."""
+    return os.path.exists(circfirm.RELEASE_INDEX)
+
+
+@contextlib.contextmanager
+def _connect(path: str) -> Iterator[sqlite3.Connection]:
+    """Open a connection to an index file, closing it afterwards."""
+    connection = sqlite3.connect(path)
+    try:
+        yield connection
+    finally:
+        connection.close()
+
+
+def write_index(entries: Iterable[IndexEntry]) -> int:
+    """Write the index of released firmware, replacing any existing one.
+
+    The index is written to a temporary file and then moved into place, so
+    readers never see a partially written index.  Returns the number of
+    entries written.
+    """
+    index_path = pathlib.Path(circfirm.RELEASE_INDEX)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_fd, temp_filepath = tempfile.mkstemp(
+        prefix=f".{index_path.name}.", dir=index_path.parent
+    )
+    os.close(temp_fd)
+    try:
+        with _connect(temp_filepath) as connection:
+            connection.executescript(SCHEMA)
+            connection.executemany(
+                "INSERT OR REPLACE INTO firmware VALUES (?, ?, ?, ?, ?)", entries
+            )
+            connection.execute(
+                "INSERT INTO metadata VALUES ('built', ?)", (str(time.time()),)
+            )
+            connection.commit()
+            (count,) = connection.execute("SELECT COUNT(*) FROM firmware").fetchone()
+        os.replace(temp_filepath, index_path)
+    except BaseException:
+        pathlib.Path(temp_filepath).unlink(missing_ok=True)
+        raise
+    return count
+
+
+def delete_index() -> None:
+    """Delete the index of released firmware, if it exists."""
+    pathlib.Path(circfirm.RELEASE_INDEX).unlink(missing_ok=True)
+
+
+def get_build_time() -> datetime.datetime | None:
+    """Get the time the index of released firmware was built, if it exists."""
+    if not index_exists():
+        return None
+    with _connect(circfirm.RELEASE_INDEX) as connection:
+        row = connection.execute(
+            "SELECT value FROM metadata WHERE key = 'built'"
+        ).fetchone()
+    return datetime.datetime.fromtimestamp(float(row[0]))
+
+
+def get_entries(board_id: str, language: str) -> list[IndexEntry] | None:
+    """Get the indexed firmware for a board and language.
+
+    Returns None if the index has not been built.
+    """
+    if not index_exists():
+        return None
+    with _connect(circfirm.RELEASE_INDEX) as connection:
+        rows = connection.execute(
+            "SELECT * FROM firmware WHERE board_id = ? AND language = ?",
+            (board_id, language),
+        ).fetchall()
+    return [IndexEntry(*row) for row in rows]
+
+
+def get_versions(board_id: str, language: str) -> list[str] | None:
+    """Get the indexed versions for a board and language, newest first.
+
+    Returns None if the index has not been built, or if it has no firmware
+    for the board and language (such as boards released after it was built).
+    """
+    entries = get_entries(board_id, language)
+    if not entries:
+        return None
+    return sorted(
+        (entry.version for entry in entries),
+        key=packaging.version.Version,
+        reverse=True,
+    )
@@ -0,0 +1,107 @@
+# SPDX-FileCopyrightText: 2026 Alec Delaney
+# SPDX-License-Identifier: MIT
+
+"""Backend functionality for locking the archive between processes.
+
+Author(s): Alec Delaney
+"""
+
+import contextlib
+import os
+import pathlib
+import time
+from collections.abc import Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+    import msvcrt
+
+import circfirm
+
+ARCHIVE_LOCK = "archive"
+POLL_INTERVAL = 0.1
+
+
+def _try_acquire(fd: int, exclusive: bool) -> bool:
+    """Try to acquire the lock on a lock file without waiting."""
+    if fcntl is None:  # pragma: no cover
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+    operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    try:
+        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _acquire(fd: int, exclusive: bool) -> None:
+    """Acquire the lock on a lock file, waiting for it if needed."""
+    if fcntl is None:  # pragma: no cover
+        # Windows has no way to wait for a lock indefinitely
+        while not _try_acquire(fd, exclusive):
+            time.sleep(POLL_INTERVAL)
+        return
+    fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+
+def _release(fd: int) -> None:
+    """Release the lock on a lock file."""
+    if fcntl is None:  # pragma: no cover
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        return
+    fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def _open_lock_file(name: str) -> Iterator[int]:
+    """Open the lock file for a lock, creating it if needed."""
+    lock_path = pathlib.Path(circfirm.ARCHIVE_LOCKS) / f"{name}.lock"
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT)
+    try:
+        yield fd
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def lock(name: str, *, exclusive: bool = True) -> Iterator[bool]:
+    """Hold an advisory lock shared by every circfirm process, waiting for it if needed.
+
+    Shared locks can be held at the same time as each other, but not at the
+    same time as an exclusive lock (on Windows, every lock is exclusive).
+    Locks are held by open files rather than processes, so they also work
+    between threads.  Whether another holder had to be waited on is given
+    when entering the context.
+    """
+    with _open_lock_file(name) as fd:
+        waited = not _try_acquire(fd, exclusive)
+        if waited:
+            _acquire(fd, exclusive)
+        try:
+            yield waited
+        finally:
+            _release(fd)
+
+
+@contextlib.contextmanager
+def try_lock(name: str, *, exclusive: bool = True) -> Iterator[bool]:
+    """Hold an advisory lock (see lock()) only if it is not held elsewhere.
+
+    This never waits for the lock.  Whether it was acquired is given when
+    entering the context.
+    """
+    with _open_lock_file(name) as fd:
+        acquired = _try_acquire(fd, exclusive)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                _release(fd)
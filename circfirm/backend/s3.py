@@ -6,51 +6,230 @@
 Author(s): Alec Delaney
 """
 
+import concurrent.futures
+import json
+import os
+import pathlib
 import re
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from typing import TYPE_CHECKING, Any
 
-import boto3
-import botocore
-import botocore.client
 import packaging.version
-from mypy_boto3_s3 import S3ServiceResource
 
 import circfirm.backend
+import circfirm.backend.index
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
+    from mypy_boto3_s3.type_defs import ObjectTypeDef
 
-S3_CONFIG = botocore.client.Config(signature_version=botocore.UNSIGNED)
-S3_RESOURCE: S3ServiceResource = boto3.resource("s3", config=S3_CONFIG)
 BUCKET_NAME = "adafruit-circuit-python"
-BUCKET = S3_RESOURCE.Bucket(BUCKET_NAME)
 
+S3_CLIENT_OPTIONS: dict[str, Any] = {
+    "max_pool_connections": 10,
+    "connect_timeout": 10,
+    "read_timeout": 60,
+    "endpoint_url": None,
+}
 
-def get_board_versions(
-    board_id: str, language: str = "en_US", *, regex: str | None = None
-) -> list[str]:
-    """Get a list of CircuitPython versions for a given board."""
+LISTING_CACHE_OPTIONS: dict[str, Any] = {
+    "ttl": 0,
+}
+
+_S3_CLIENT: "S3Client | None" = None
+_S3_CLIENT_LOCK = threading.Lock()
+
+
+def configure_s3_client(
+    *,
+    max_pool_connections: int = 10,
+    connect_timeout: float = 10,
+    read_timeout: float = 60,
+    endpoint_url: str | None = None,
+) -> None:
+    """Set the options used for creating the shared S3 client.
+
+    If the options differ from those of an already created client, that client
+    is discarded and a new one will be created the next time it is needed.
+    """
+    global _S3_CLIENT  # noqa: PLW0603
+    options = {
+        "max_pool_connections": max_pool_connections,
+        "connect_timeout": connect_timeout,
+        "read_timeout": read_timeout,
+        "endpoint_url": endpoint_url if endpoint_url else None,
+    }
+    with _S3_CLIENT_LOCK:
+        if options != S3_CLIENT_OPTIONS:
+            S3_CLIENT_OPTIONS.update(options)
+            _S3_CLIENT = None
+
+
+def configure_listing_cache(*, ttl: float = 0) -> None:
+    """Set how long, in seconds, cached version listings are used for.
+
+    A time of zero means that cached version listings are never used.
+    """
+    LISTING_CACHE_OPTIONS["ttl"] = ttl
+
+
+def get_s3_client() -> "S3Client":
+    """Get the shared S3 client, creating it the first time it is needed.
+
+    boto3 is only imported here so that commands which never talk to the S3
+    bucket do not pay for loading it.  The client is safe to share between
+    threads.
+    """
+    global _S3_CLIENT  # noqa: PLW0603
+    with _S3_CLIENT_LOCK:
+        if _S3_CLIENT is None:
+            import boto3  # noqa: PLC0415
+            import botocore  # noqa: PLC0415
+            import botocore.config  # noqa: PLC0415
+
+            config = botocore.config.Config(
+                signature_version=botocore.UNSIGNED,
+                max_pool_connections=S3_CLIENT_OPTIONS["max_pool_connections"],
+                connect_timeout=S3_CLIENT_OPTIONS["connect_timeout"],
+                read_timeout=S3_CLIENT_OPTIONS["read_timeout"],
+            )
+            _S3_CLIENT = boto3.session.Session().client(
+                "s3",
+                config=config,
+                endpoint_url=S3_CLIENT_OPTIONS["endpoint_url"],
+            )
+        return _S3_CLIENT
+
+
+def iter_objects(prefix: str) -> Iterator["ObjectTypeDef"]:
+    """Iterate through the objects in the bucket with the given prefix."""
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=prefix):
+        yield from page.get("Contents", [])
+
+
+def _iter_index_entries(
+    callback: Callable[[int], None] | None,
+) -> Iterator[circfirm.backend.index.IndexEntry]:
+    """Iterate through the firmware in the bucket as index entries."""
+    firmware_regex = re.compile(circfirm.backend.FIRMWARE_REGEX)
+    for num_objects, s3_object in enumerate(iter_objects("bin/"), start=1):
+        if callback is not None:
+            callback(num_objects)
+        key_parts = s3_object["Key"].split("/")
+        if len(key_parts) != 4:  # noqa: PLR2004
+            continue
+        _, board_id, language, filename = key_parts
+        result = firmware_regex.fullmatch(filename)
+        if not result or result[1] != board_id or result[2] != language:
+            continue
+        yield circfirm.backend.index.IndexEntry(
+            board_id,
+            language,
+            result[3],
+            s3_object["Size"],
+            s3_object["ETag"].strip('"'),
+        )
+
+
+def build_index(callback: Callable[[int], None] | None = None) -> int:
+    """Build the index of released firmware by crawling the bucket once.
+
+    The optional callback is called with the number of objects seen so far as
+    the crawl progresses.  Returns the number of firmware files indexed.
+    """
+    return circfirm.backend.index.write_index(_iter_index_entries(callback))
+
+
+def get_listing_filepath(board_id: str, language: str) -> pathlib.Path:
+    """Get the path to the cached version listing for a board and language."""
+    return pathlib.Path(circfirm.VERSION_LISTINGS) / board_id / f"{language}.json"
+
+
+def _read_listing(board_id: str, language: str) -> list[str] | None:
+    """Read a cached version listing, if it exists and has not expired."""
+    ttl = LISTING_CACHE_OPTIONS["ttl"]
+    if ttl <= 0:
+        return None
+    try:
+        with open(get_listing_filepath(board_id, language), encoding="utf-8") as file:
+            listing = json.load(file)
+        if time.time() - listing["timestamp"] > ttl:
+            return None
+        return listing["versions"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _write_listing(board_id: str, language: str, versions: list[str]) -> None:
+    """Write a version listing to the cache."""
+    listing_file = get_listing_filepath(board_id, language)
+    listing_file.parent.mkdir(parents=True, exist_ok=True)
+    temp_fd, temp_filepath = tempfile.mkstemp(
+        prefix=f".{listing_file.name}.", dir=listing_file.parent
+    )
+    try:
+        with os.fdopen(temp_fd, mode="w", encoding="utf-8") as file:
+            json.dump({"timestamp": time.time(), "versions": versions}, file)
+        os.replace(temp_filepath, listing_file)
+    except BaseException:
+        pathlib.Path(temp_filepath).unlink(missing_ok=True)
+        raise
+
+
+def _list_board_versions(board_id: str, language: str) -> list[str]:
+    """List the CircuitPython versions for a given board in the bucket."""
     prefix = f"bin/{board_id}/{language}"
     firmware_regex = circfirm.backend.FIRMWARE_REGEX_PATTERN.replace(
         r"[board]", board_id
     ).replace(r"[language]", language)
     version_regex = circfirm.backend._VALID_VERSIONS_CAPTURE
     firmware_regex = firmware_regex.replace(r"[version]", version_regex)
-    s3_objects = BUCKET.objects.filter(Prefix=prefix)
     versions = set()
-    for s3_object in s3_objects:
-        result = re.match(f"{prefix}/{firmware_regex}", s3_object.key)
+    for s3_object in iter_objects(prefix):
+        result = re.match(f"{prefix}/{firmware_regex}", s3_object["Key"])
         if result:
-            if regex:
-                firmware_filename = s3_object.key.split("/")[-1]
-                version, _ = circfirm.backend.parse_firmware_info(firmware_filename)
-                if not re.match(regex, version):
-                    continue
             versions.add(result[1])
     return sorted(versions, key=packaging.version.Version, reverse=True)
 
 
+def get_board_versions(
+    board_id: str,
+    language: str = "en_US",
+    *,
+    regex: str | None = None,
+    refresh: bool = False,
+) -> list[str]:
+    """Get a list of CircuitPython versions for a given board.
+
+    Unless a refresh is requested, the index of released firmware is used if
+    it has firmware for the board and language, followed by a cached version
+    listing if one is available and has not expired.  Version listings are
+    only cached if they can expire after some time (see
+    configure_listing_cache()).
+    """
+    versions = None
+    if not refresh:
+        versions = circfirm.backend.index.get_versions(board_id, language)
+        if versions is None:
+            versions = _read_listing(board_id, language)
+    if versions is None:
+        versions = _list_board_versions(board_id, language)
+        if LISTING_CACHE_OPTIONS["ttl"] > 0:  # Otherwise it would never be read
+            _write_listing(board_id, language, versions)
+    if regex:
+        versions = [version for version in versions if re.match(regex, version)]
+    return versions
+
+
 def get_latest_board_version(
-    board_id: str, language: str, pre_release: bool
+    board_id: str, language: str, pre_release: bool, *, refresh: bool = False
 ) -> str | None:
     """Get the latest version for a board in a given language."""
-    versions = get_board_versions(board_id, language)
+    versions = get_board_versions(board_id, language, refresh=refresh)
     if not pre_release:
         versions = [
             version
@@ -60,3 +239,29 @@ def get_latest_board_version(
     if versions:
         return versions[0]
     return None
+
+
+def get_latest_board_versions(
+    jobs: Iterable[tuple[str, str]],
+    pre_release: bool,
+    max_workers: int = 8,
+    *,
+    refresh: bool = False,
+) -> Iterator[tuple[tuple[str, str], str | None, Exception | None]]:
+    """Get the latest versions for many boards and languages in parallel.
+
+    Each job is a board ID and language.  Jobs are yielded as they finish,
+    along with the latest version and the error that caused them to fail, if
+    any.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = {
+            executor.submit(
+                get_latest_board_version, *job, pre_release, refresh=refresh
+            ): job
+            for job in jobs
+        }
+        for future in concurrent.futures.as_completed(futures):
+            error = future.exception()
+            version = None if error else future.result()
+            yield futures[future], version, error
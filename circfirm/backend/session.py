@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: 2026 Alec Delaney
+# SPDX-License-Identifier: MIT
+
+"""Backend functionality for the shared HTTP session.
+
+Author(s): Alec Delaney
+"""
+
+import threading
+from typing import Any
+
+import requests
+import requests.adapters
+import urllib3.util.retry
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+HTTP_SESSION_OPTIONS: dict[str, Any] = {
+    "pool_size": 10,
+    "connect_timeout": 10,
+    "read_timeout": 60,
+    "retries": 3,
+    "backoff_factor": 0.5,
+}
+
+_HTTP_SESSION: requests.Session | None = None
+_HTTP_SESSION_LOCK = threading.Lock()
+
+
+def configure_session(
+    *,
+    pool_size: int = 10,
+    connect_timeout: float = 10,
+    read_timeout: float = 60,
+    retries: int = 3,
+    backoff_factor: float = 0.5,
+) -> None:
+    """Set the options used for creating the shared HTTP session.
+
+    If the options differ from those of an already created session, that
+    session is closed and a new one will be created the next time it is needed.
+    """
+    global _HTTP_SESSION  # noqa: PLW0603
+    options = {
+        "pool_size": pool_size,
+        "connect_timeout": connect_timeout,
+        "read_timeout": read_timeout,
+        "retries": retries,
+        "backoff_factor": backoff_factor,
+    }
+    with _HTTP_SESSION_LOCK:
+        if options != HTTP_SESSION_OPTIONS:
+            HTTP_SESSION_OPTIONS.update(options)
+            if _HTTP_SESSION is not None:
+                _HTTP_SESSION.close()
+            _HTTP_SESSION = None
+
+
+def get_session() -> requests.Session:
+    """Get the shared HTTP session, creating it the first time it is needed.
+
+    Connections are kept alive and pooled per host, and idempotent requests
+    are retried with exponential backoff on connection errors and server
+    errors.
+    """
+    global _HTTP_SESSION  # noqa: PLW0603
+    with _HTTP_SESSION_LOCK:
+        if _HTTP_SESSION is None:
+            retry = urllib3.util.retry.Retry(
+                total=HTTP_SESSION_OPTIONS["retries"],
+                backoff_factor=HTTP_SESSION_OPTIONS["backoff_factor"],
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset(("GET", "HEAD")),
+                raise_on_status=False,
+            )
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=HTTP_SESSION_OPTIONS["pool_size"],
+                pool_maxsize=HTTP_SESSION_OPTIONS["pool_size"],
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _HTTP_SESSION = session
+        return _HTTP_SESSION
+
+
+def get_timeout() -> tuple[float, float]:
+    """Get the connect and read timeouts for requests."""
+    return (
+        HTTP_SESSION_OPTIONS["connect_timeout"],
+        HTTP_SESSION_OPTIONS["read_timeout"],
+    )
+
+
+def get(url: str, **kwargs: Any) -> requests.Response:
+    """Send a GET request using the shared HTTP session."""
+    kwargs.setdefault("timeout", get_timeout())
+    return get_session().get(url, **kwargs)
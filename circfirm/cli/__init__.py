@@ -6,14 +6,17 @@
 Author(s): Alec Delaney
 """
 
+import ast
+import concurrent.futures
 import importlib.util
+import inspect
 import os
 import pkgutil
-import shutil
 import sys
+import threading
 import time
-from collections.abc import Callable, Iterable
-from typing import Any, TypeVar
+from collections.abc import Callable, Collection, Iterable
+from typing import Any, Generic, TypeVar
 
 import click
 import click_spinner
@@ -21,14 +24,67 @@ import requests
 import yaml
 
 import circfirm
+import circfirm.backend.bootloader
 import circfirm.backend.cache
+import circfirm.backend.catalog
 import circfirm.backend.device
+import circfirm.backend.github
+import circfirm.backend.s3
+import circfirm.backend.session
 import circfirm.startup
 
 _T = TypeVar("_T")
 
 
-@click.group()
+class LazyGroup(click.Group):
+    """Command group that only imports subcommand modules when they are needed."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """Initialize the group with no lazily loaded subcommands."""
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands: dict[str, tuple[str, str]] = {}
+
+    def add_lazy_command(self, name: str, import_name: str, import_path: str) -> None:
+        """Register a subcommand to be imported from the given path when needed."""
+        self.lazy_subcommands[name] = (import_name, import_path)
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        """Get the names of all the subcommands, loaded or not."""
+        return sorted({*super().list_commands(ctx), *self.lazy_subcommands})
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> click.Command | None:
+        """Get a subcommand, importing it first if needed."""
+        if cmd_name not in self.commands and cmd_name in self.lazy_subcommands:
+            import_name, import_path = self.lazy_subcommands[cmd_name]
+            self.add_command(load_subcmd(import_name, import_path), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def format_commands(
+        self, ctx: click.Context, formatter: click.HelpFormatter
+    ) -> None:
+        """Write the subcommands and their help text without importing them."""
+        cmd_names = self.list_commands(ctx)
+        if not cmd_names:
+            return
+        limit = formatter.width - 6 - max(len(cmd_name) for cmd_name in cmd_names)
+        rows = []
+        for cmd_name in cmd_names:
+            if cmd_name in self.commands:
+                cmd = self.commands[cmd_name]
+                if cmd.hidden:
+                    continue
+                rows.append((cmd_name, cmd.get_short_help_str(limit)))
+            else:
+                _, import_path = self.lazy_subcommands[cmd_name]
+                help_text = get_subcmd_help(import_path)
+                rows.append(
+                    (cmd_name, click.utils.make_default_short_help(help_text, limit))
+                )
+        with formatter.section("Commands"):
+            formatter.write_dl(rows)
+
+
+@click.group(cls=LazyGroup)
 @click.version_option(package_name="circfirm")
 def cli() -> None:
     """Manage CircuitPython firmware from the command line."""
@@ -43,38 +99,115 @@ def maybe_support(msg: str) -> None:
         click.echo(msg)
 
 
+class Prefetch(Generic[_T]):
+    """Work for a board started in the background while waiting for the user.
+
+    A daemon thread is used so that the work never prevents exiting if the
+    user stops waiting.
+    """
+
+    def __init__(self, func: Callable[[str], _T]) -> None:
+        """Initialize the prefetch with the work to do for a board."""
+        self._func = func
+        self._board: str | None = None
+        self._future: concurrent.futures.Future[_T] | None = None
+
+    def start(self, board: str) -> None:
+        """Start the work for the given board in the background."""
+        future: concurrent.futures.Future[_T] = concurrent.futures.Future()
+
+        def run() -> None:
+            """Do the work and store the result."""
+            try:
+                future.set_result(self._func(board))
+            except Exception as err:
+                future.set_exception(err)
+
+        threading.Thread(target=run, daemon=True).start()
+        self._board = board
+        self._future = future
+
+    def wait(self, board: str) -> _T | None:
+        """Wait for the work for the given board to finish via CLI.
+
+        Any error raised by the work is raised again.  Returns None if the
+        work was not started for the board.
+        """
+        if self._future is None or self._board != board:
+            return None
+        if self._future.done():
+            return self._future.result()
+        return announce_and_await("Finishing firmware download", self._future.result)
+
+
 def get_board_id(
     circuitpy: str | None,
     bootloader: str | None,
     board: str | None,
     timeout: int = -1,
+    prefetch: Prefetch | None = None,
 ) -> tuple[str, str]:
-    """Get the board ID of a device via CLI."""
+    """Get the board ID of a device via CLI.
+
+    If the device is already in bootloader mode, the board ID is matched
+    from the bootloader.  Otherwise, it is read from the device, and the
+    given prefetch is started for it while waiting for the device to be
+    switched to bootloader mode.
+    """
     if not board:
         if not circuitpy and bootloader:
-            click.echo("CircuitPython device found, but it is in bootloader mode!")
-            click.echo(
-                "Please put the device out of bootloader mode, or use the --board-id option."
-            )
-            sys.exit(3)
+            board = get_bootloader_board_id(bootloader)
+            if board is None:
+                click.echo("CircuitPython device found, but it is in bootloader mode!")
+                click.echo(
+                    "Please put the device out of bootloader mode, or use the --board-id option."
+                )
+                sys.exit(3)
+            click.echo(f"Board ID {board} detected from the bootloader")
+            return bootloader, board
         board = circfirm.backend.device.get_board_info(circuitpy)[0]
+        if prefetch is not None:
+            prefetch.start(board)
 
         click.echo("Board ID detected, please switch the device to bootloader mode.")
-        if timeout == -1:
-            skip_timeout = True
-        else:
-            skip_timeout = False
-            start_time = time.time()
-
-        while not (bootloader := circfirm.backend.device.find_bootloader()):
-            if not skip_timeout and time.time() >= start_time + timeout:
-                raise OSError(
-                    "Bootloader mode device not found within the timeout period"
-                )
-            time.sleep(0.05)
+        bootloader = circfirm.backend.device.wait_for_bootloader(
+            None if timeout == -1 else timeout
+        )
+        if not bootloader:
+            raise OSError("Bootloader mode device not found within the timeout period")
     return bootloader, board
 
 
+def get_bootloader_board_id(bootloader: str) -> str | None:
+    """Get the board ID of a device in bootloader mode via CLI, if it can be matched.
+
+    The stored board list is used to match new bootloaders, and is fetched
+    if there is not one yet.
+    """
+    try:
+        uf2_board_id, _ = circfirm.backend.device.get_bootloader_info(bootloader)
+        model = circfirm.backend.device.get_bootloader_model(bootloader)
+    except (OSError, ValueError):
+        return None
+    board = circfirm.backend.bootloader.lookup_board_id(uf2_board_id, model)
+    if board is not None:
+        return board
+    board_list = circfirm.backend.github.read_board_list()
+    if board_list is not None:
+        board_ids = board_list.boards
+    else:
+        gh_token = get_settings()["token"]["github"]
+        try:
+            board_ids = announce_and_await(
+                "Fetching boards list",
+                circfirm.backend.github.get_board_id_list,
+                args=(gh_token,),
+            )
+        except (ValueError, requests.ConnectionError, requests.Timeout):
+            return None
+    return circfirm.backend.bootloader.resolve_board_id(uf2_board_id, model, board_ids)
+
+
 def get_connection_status() -> tuple[str | None, str | None]:
     """Get the status of a connectted CircuitPython device as a CIRCUITPY and bootloader location."""
     circuitpy = circfirm.backend.device.find_circuitpy()
@@ -95,38 +228,283 @@ def ensure_bootloader_mode(bootloader: str | None) -> None:
             sys.exit(2)
 
 
+def _download_firmware(msg: str, args: tuple[str, ...]) -> None:
+    """Download the firmware with the given arguments via CLI.
+
+    Afterwards, the least recently used firmware is evicted from the cache if
+    it is too large.
+    """
+    try:
+        announce_and_await(msg, circfirm.backend.cache.download_uf2, args=args)
+    except (
+        ConnectionError,
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+    ) as err:
+        click.echo(" failed")  # Mark as failed
+        if isinstance(err, ConnectionError):
+            click.echo(f"Error: {err.args[0]}")
+        sys.exit(4)
+    evict_firmware([args[:3]])
+
+
+def get_cache_pins() -> list[tuple[str, str | None, str | None]]:
+    """Get the cached firmware pinned in the settings, which are never evicted."""
+    try:
+        return [
+            (
+                pin["board-id"],
+                str(pin["version"]) if "version" in pin else None,
+                pin.get("language"),
+            )
+            for pin in get_settings()["cache"]["pinned"]
+        ]
+    except (KeyError, TypeError):
+        raise click.ClickException("Could not parse the cache.pinned setting")
+
+
+def evict_firmware(keep: Iterable[tuple[str, str, str]], quiet: bool = False) -> None:
+    """Evict the least recently used cached firmware if the cache is too large via CLI.
+
+    The firmware to keep is given as board IDs, versions, and languages
+    (such as those just downloaded).  Nothing is evicted if the cache has no
+    size limit, but abandoned downloads for the boards of the firmware to
+    keep are always removed.
+    """
+    keep = list(keep)
+    circfirm.backend.cache.remove_abandoned_downloads(
+        {board_id for board_id, _, _ in keep}
+    )
+    max_size = get_settings()["cache"]["max_size"]
+    if not max_size:
+        return
+    evicted = circfirm.backend.cache.evict_uf2s(max_size, get_cache_pins(), keep)
+    if evicted and not quiet:
+        megabytes = sum(entry.size for entry in evicted) / 1_000_000
+        maybe_support(
+            f"Evicted {len(evicted)} least recently used firmware files from the "
+            f"cache ({megabytes:.2f} MB freed)"
+        )
+
+
 def download_if_needed(board: str, version: str, language: str) -> None:
     """Download the firmware for a given board, version, and language via CLI."""
     if not circfirm.backend.cache.is_downloaded(board, version, language):
-        try:
-            announce_and_await(
-                "Downloading UF2",
-                circfirm.backend.cache.download_uf2,
-                args=(board, version, language),
-            )
-        except (ConnectionError, requests.exceptions.ConnectionError) as err:
-            click.echo(" failed")  # Mark as failed
-            if isinstance(err, ConnectionError):
-                click.echo(f"Error: {err.args[0]}")
-            sys.exit(4)
+        _download_firmware("Downloading UF2", (board, version, language))
     else:
         click.echo("Using cached firmware file")
+        circfirm.backend.catalog.touch_firmware(board, version, language)
+
+
+def format_copy_result(result: circfirm.backend.cache.CopyResult) -> str:
+    """Format the size, duration, and throughput of a UF2 file copy."""
+    megabytes = result.size / 1_000_000
+    rate = result.bytes_per_second / 1_000_000
+    return f"{megabytes:.2f} MB in {result.seconds:.2f} s ({rate:.2f} MB/s)"
 
 
 def copy_cache_firmware(
     board: str, version: str, language: str, bootloader: str
 ) -> None:
     """Copy the cached firmware for a given board, version, and language to the bootloader via CLI."""
-    uf2file = circfirm.backend.cache.get_uf2_filepath(board, version, language)
-    uf2filename = os.path.basename(uf2file)
-    uf2_path = os.path.join(bootloader, uf2filename)
-    announce_and_await(
-        f"Copying UF2 to {board}", shutil.copyfile, args=(uf2file, uf2_path)
+    circfirm.backend.catalog.touch_firmware(board, version, language)
+    result = announce_and_await(
+        f"Copying UF2 to {board}",
+        circfirm.backend.cache.copy_uf2,
+        args=(board, version, language, bootloader),
+        kwargs={"preallocate": get_settings()["copy"]["preallocate"]},
     )
+    maybe_support(f"Copied {format_copy_result(result)}")
     click.echo(f"CircuitPython version now upgraded to {version}")
     click.echo("Device should reboot momentarily")
 
 
+def prefetch_firmware(board: str, version: str, language: str) -> None:
+    """Download the firmware for a given board, version, and language if needed.
+
+    Nothing is output, and download errors are ignored so that the firmware
+    can be downloaded again once the device is in bootloader mode.
+    """
+    if circfirm.backend.cache.is_downloaded(board, version, language):
+        return
+    try:
+        circfirm.backend.cache.download_uf2(board, version, language)
+    except (
+        ConnectionError,
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+    ):
+        return
+    evict_firmware([(board, version, language)], quiet=True)
+
+
+def install_firmware(
+    board: str, version: str, language: str, bootloader: str, verify: bool = False
+) -> None:
+    """Install the firmware for a given board, version, and language on the bootloader via CLI.
+
+    If the firmware is not cached, it is written to the bootloader as it is
+    downloaded rather than being copied once the download finishes.  If
+    writing it to the bootloader fails, the downloaded firmware is copied
+    to it instead.  If requested, the installation is then verified.
+    """
+    start_time = time.monotonic()
+    circuitpys = _get_circuitpy_paths() if verify else set()
+    if circfirm.backend.cache.is_downloaded(board, version, language):
+        click.echo("Using cached firmware file")
+        copy_cache_firmware(board, version, language, bootloader)
+    else:
+        try:
+            _download_firmware(
+                f"Downloading UF2 to {board}", (board, version, language, bootloader)
+            )
+        except OSError as err:
+            # The download is still cached if only writing to the device failed
+            if not circfirm.backend.cache.is_downloaded(board, version, language):
+                raise click.ClickException(f"Could not download the firmware: {err}")
+            click.echo(f"Error writing to the device while downloading: {err}")
+            copy_cache_firmware(board, version, language, bootloader)
+        else:
+            click.echo(f"CircuitPython version now upgraded to {version}")
+            click.echo("Device should reboot momentarily")
+    if verify:
+        verify_firmware(board, version, language, start_time, circuitpys)
+
+
+def _check_installed_version(circuitpy: str | None, version: str) -> str | None:
+    """Check the firmware version of a rebooted device, returning why it failed if so."""
+    if circuitpy is None:
+        return "the device did not reboot within the timeout period"
+    try:
+        _, installed_version = circfirm.backend.device.get_board_info(circuitpy)
+    except (OSError, ValueError) as err:
+        return str(err)
+    if installed_version != version:
+        return f"the device reports version {installed_version}"
+    return None
+
+
+def _get_circuitpy_paths() -> set[str]:
+    """Get the locations of the connected CircuitPython devices in non-bootloader mode."""
+    return {device.path for device in circfirm.backend.device.find_circuitpys()}
+
+
+def verify_firmware(
+    board: str,
+    version: str,
+    language: str,
+    start_time: float,
+    circuitpys: Collection[str] = (),
+) -> None:
+    """Verify that the firmware was installed via CLI.
+
+    The device is waited on to reboot and then its firmware version is
+    checked.  If that fails, the firmware is installed again up to the
+    number of retries in the settings.  The start time is when the
+    installation started, and is used to report the total time taken.
+
+    Only a device with the given board ID that was not connected in
+    non-bootloader mode before the firmware was copied (the locations of
+    those that were are given) counts as the rebooted device, so that other
+    connected boards are not mistaken for it.
+    """
+    verify_settings = get_settings()["verify"]
+    timeout = verify_settings["timeout"]
+    retries = verify_settings["retries"]
+    while True:
+        copied_time = time.monotonic()
+        circuitpy = announce_and_await(
+            "Waiting for the device to reboot",
+            circfirm.backend.device.wait_for_circuitpy,
+            args=(timeout,),
+            kwargs={"board_id": board, "ignore": circuitpys},
+        )
+        error = _check_installed_version(circuitpy, version)
+        if error is None:
+            reboot_time = time.monotonic() - copied_time
+            total_time = time.monotonic() - start_time
+            click.echo(
+                f"Verified CircuitPython {version} is installed "
+                f"(rebooted in {reboot_time:.2f} s, {total_time:.2f} s in total)"
+            )
+            return
+        click.echo(f"Verification failed: {error}")
+        if retries <= 0:
+            raise click.ClickException(
+                f"Could not verify that CircuitPython {version} was installed"
+            )
+        retries -= 1
+
+        # The device may still be in bootloader mode if it did not reboot
+        bootloader = circfirm.backend.device.find_bootloader()
+        if not bootloader:
+            click.echo("Please switch the device to bootloader mode to retry.")
+            bootloader = circfirm.backend.device.wait_for_bootloader(timeout)
+            if not bootloader:
+                raise click.ClickException(
+                    "Bootloader mode device not found within the timeout period"
+                )
+        circuitpys = _get_circuitpy_paths()
+        copy_cache_firmware(board, version, language, bootloader)
+
+
+def get_bootloader_boards(board: str | None) -> dict[str, str]:
+    """Get the board ID of every connected device in bootloader mode via CLI.
+
+    If a board ID is given, it is used for all of them.  Otherwise, the board
+    ID of each is matched from its bootloader.
+    """
+    bootloaders = circfirm.backend.device.find_bootloaders()
+    if not bootloaders:
+        click.echo("No CircuitPython devices found in bootloader mode!")
+        click.echo(
+            "Check that the devices are connected, mounted, and in bootloader mode."
+        )
+        sys.exit(1)
+    if board:
+        return {bootloader.path: board for bootloader in bootloaders}
+    boards = {}
+    for bootloader in bootloaders:
+        bootloader_board = get_bootloader_board_id(bootloader.path)
+        if bootloader_board is None:
+            raise click.ClickException(
+                f"The board ID of {bootloader.path} could not be matched from its "
+                "bootloader, please use the --board-id option"
+            )
+        boards[bootloader.path] = bootloader_board
+    return boards
+
+
+def copy_cache_firmwares(
+    jobs: list[tuple[str, str, str, str]], max_workers: int
+) -> None:
+    """Copy cached firmwares to many bootloaders at the same time via CLI.
+
+    Each job is a board ID, version, language, and bootloader location, and
+    the status of each is output as it finishes.
+    """
+    copy_settings = get_settings()["copy"]
+    click.echo(f"Copying UF2 to {len(jobs)} boards...")
+    failures = 0
+    copies = circfirm.backend.cache.copy_uf2s(
+        jobs,
+        max_workers,
+        preallocate=copy_settings["preallocate"],
+        use_mmap=copy_settings["mmap"],
+    )
+    for (board, version, _, bootloader), result, error in copies:
+        if error is None:
+            status = f"done ({format_copy_result(result)})"
+        else:
+            status = f"failed ({error})"
+        click.echo(f"  * {bootloader} ({board} {version}): {status}")
+        if error is not None:
+            failures += 1
+    if failures:
+        raise click.ClickException(f"Firmware could not be copied to {failures} boards")
+    click.echo("Devices should reboot momentarily")
+
+
 def announce_and_await(
     msg: str,
     func: Callable[..., _T],
@@ -156,14 +534,84 @@ def announce_and_await(
         raise err
 
 
+def _merge_settings(defaults: dict[str, Any], settings: dict[str, Any]) -> None:
+    """Fill in any settings missing from an older settings file with the defaults."""
+    for key, default in defaults.items():
+        if key not in settings:
+            settings[key] = default
+        elif isinstance(default, dict) and isinstance(settings[key], dict):
+            _merge_settings(default, settings[key])
+
+
 def get_settings() -> dict[str, Any]:
     """Get the contents of the settings file."""
     with open(circfirm.SETTINGS_FILE, encoding="utf-8") as yamlfile:
-        return yaml.safe_load(yamlfile)
+        settings = yaml.safe_load(yamlfile)
+    with open(circfirm._SETTINGS_FILE_SRC, encoding="utf-8") as yamlfile:
+        _merge_settings(yaml.safe_load(yamlfile), settings)
+    return settings
+
+
+def configure_backend() -> None:
+    """Configure the backend using the configurable settings."""
+    settings = get_settings()
+    http_settings = settings["http"]
+    circfirm.backend.session.configure_session(
+        pool_size=http_settings["pool"],
+        connect_timeout=http_settings["timeout"]["connect"],
+        read_timeout=http_settings["timeout"]["read"],
+        retries=http_settings["retries"],
+        backoff_factor=http_settings["backoff"],
+    )
+    s3_settings = settings["s3"]
+    circfirm.backend.s3.configure_s3_client(
+        max_pool_connections=s3_settings["pool"],
+        connect_timeout=s3_settings["timeout"]["connect"],
+        read_timeout=s3_settings["timeout"]["read"],
+        endpoint_url=s3_settings["endpoint"],
+    )
+    circfirm.backend.s3.configure_listing_cache(ttl=s3_settings["ttl"])
+
+
+def get_subcmd_help(import_path: str) -> str:
+    """Get the help text of a subcommand module without importing it."""
+    module_file = (
+        os.path.join(import_path, "__init__.py")
+        if os.path.isdir(import_path)
+        else import_path
+    )
+    with open(module_file, encoding="utf-8") as srcfile:
+        module_ast = ast.parse(srcfile.read(), filename=module_file)
+    for node in module_ast.body:
+        if isinstance(node, ast.FunctionDef) and node.name == "cli":
+            docstring = ast.get_docstring(node)
+            if docstring:
+                return inspect.cleandoc(docstring).partition("\f")[0]
+    return ""
+
+
+def load_subcmd(import_name: str, import_path: str) -> click.Command:
+    """Import a subcommand module and get its command."""
+    module = sys.modules.get(import_name)
+    if module is None:
+        module_spec = importlib.util.spec_from_file_location(import_name, import_path)
+        module = importlib.util.module_from_spec(module_spec)
+        sys.modules[import_name] = module
+        try:
+            module_spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[import_name]
+            raise
+    source_cli: click.MultiCommand = getattr(module, "cli")
+    if isinstance(source_cli, click.Group):
+        subcmd = click.CommandCollection(sources=(source_cli,))
+        subcmd.help = source_cli.__doc__
+        return subcmd
+    return source_cli
 
 
 def load_subcmd_folder(path: str, super_import_name: str) -> None:
-    """Load subcommands dynamically from a folder of modules and packages."""
+    """Register subcommands from a folder of modules and packages to be loaded lazily."""
     subcmd_names = [
         (modname, ispkg) for _, modname, ispkg in pkgutil.iter_modules((path,))
     ]
@@ -175,19 +623,10 @@ def load_subcmd_folder(path: str, super_import_name: str) -> None:
     for (subcmd_name, ispkg), subcmd_path in zip(subcmd_names, subcmd_paths):
         import_name = ".".join([super_import_name, subcmd_name])
         import_path = subcmd_path if ispkg else subcmd_path + ".py"
-        module_spec = importlib.util.spec_from_file_location(import_name, import_path)
-        module = importlib.util.module_from_spec(module_spec)
-        module_spec.loader.exec_module(module)
-        source_cli: click.MultiCommand = getattr(module, "cli")
-        if isinstance(source_cli, click.Group):
-            subcmd = click.CommandCollection(sources=(source_cli,))
-            subcmd.help = source_cli.__doc__
-        else:
-            subcmd = source_cli
-        cli.add_command(subcmd, subcmd_name)
+        cli.add_lazy_command(subcmd_name, import_name, import_path)
 
 
-# Load extra commands from the rest of the circfirm.cli subpackage
+# Register extra commands from the rest of the circfirm.cli subpackage
 cli_pkg_path = os.path.dirname(os.path.abspath(__file__))
 cli_pkg_name = "circfirm.cli"
 load_subcmd_folder(cli_pkg_path, cli_pkg_name)
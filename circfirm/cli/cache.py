@@ -6,16 +6,20 @@
 Author(s): Alec Delaney
 """
 
-import os
-import pathlib
+import fnmatch
+import itertools
 import re
 import shutil
+from collections.abc import Callable, Iterable
 
 import botocore.exceptions
 import click
+import yaml
 
 import circfirm
 import circfirm.backend.cache
+import circfirm.backend.catalog
+import circfirm.backend.lock
 import circfirm.backend.s3
 import circfirm.cli
 import circfirm.startup
@@ -26,6 +30,23 @@ def cli():
     """Work with cached firmwares."""
 
 
+def compile_filter(
+    pattern: str | None, regex: bool, search: bool = False
+) -> Callable[[str], re.Match | None]:
+    """Compile a board ID, version, or language filter for clearing the cache.
+
+    Patterns that are not regex patterns are glob patterns that must match
+    the entire value.  Regex patterns must match from the beginning of the
+    value, unless searching for them anywhere in the value is requested.
+    """
+    if pattern is None:
+        pattern, regex = ".*", True
+    if not regex:
+        return re.compile(fnmatch.translate(pattern)).match
+    compiled = re.compile(pattern)
+    return compiled.search if search else compiled.match
+
+
 @cli.command()
 @click.option("-b", "--board-id", default=None, help="CircuitPython board ID")
 @click.option("-v", "--version", default=None, help="CircuitPython version")
@@ -37,75 +58,144 @@ def cli():
     default=False,
     help="The board ID, version, and language options represent regex patterns",
 )
+@click.option(
+    "-n",
+    "--dry-run",
+    is_flag=True,
+    default=False,
+    help="List the firmware versions that would be cleared without clearing them",
+)
 def clear(  # noqa: PLR0913
     board_id: str | None,
     version: str | None,
     language: str | None,
     regex: bool,
+    dry_run: bool,
 ) -> None:
     """Clear the cache, either entirely or for a specific board/version."""
-    if board_id is None and version is None and language is None:
-        shutil.rmtree(circfirm.UF2_ARCHIVE)
-        circfirm.startup.ensure_app_setup()
+    clear_all = board_id is None and version is None and language is None
+    if clear_all and not dry_run:
+        with circfirm.backend.lock.lock(circfirm.backend.lock.ARCHIVE_LOCK):
+            shutil.rmtree(circfirm.UF2_ARCHIVE)
+            circfirm.startup.ensure_app_setup()
+            circfirm.backend.catalog.clear()
         click.echo("Cache cleared!")
         return
 
-    if regex:
-        glob_pattern = "*-*-*-*"
-    else:
-        glob_pattern = "*-*" if board_id is None else f"*-{board_id}"
-        language_pattern = "-*" if language is None else f"-{language}"
-        glob_pattern += language_pattern
-        version_pattern = "-*" if version is None else f"-{version}.uf2"
-        glob_pattern += version_pattern
-
-    matching_files = pathlib.Path(circfirm.UF2_ARCHIVE).rglob(glob_pattern)
-
-    for matching_file in matching_files:
-        if regex:
-            board_id = ".*" if board_id is None else board_id
-            version = ".*" if version is None else version
-            language = ".*" if language is None else language
-
-            current_board_id = matching_file.parent.name
-            current_version, current_language = circfirm.backend.parse_firmware_info(
-                matching_file.name
-            )
+    try:
+        board_id_matches = compile_filter(board_id, regex, search=True)
+        version_matches = compile_filter(version, regex)
+        language_matches = compile_filter(language, regex)
+    except re.error as err:
+        raise click.BadParameter(f"Invalid regex pattern: {err}")
 
-            board_id_matches = re.search(board_id, current_board_id)
-            version_matches = re.match(version, current_version)
-            language_matches = re.match(language, current_language)
-            if not all([board_id_matches, version_matches, language_matches]):
-                continue
-        matching_file.unlink()
+    def matches(board_id: str, version: str, language: str) -> bool:
+        """Check whether a firmware version matches all of the filters."""
+        return bool(
+            board_id_matches(board_id)
+            and version_matches(version)
+            and language_matches(language)
+        )
 
-    # Delete board folder if empty
-    for board_folder in pathlib.Path(circfirm.UF2_ARCHIVE).glob("*"):
-        if len(os.listdir(board_folder)) == 0:
-            shutil.rmtree(board_folder)
+    matching = [
+        entry for entry in circfirm.backend.catalog.get_entries() if matches(*entry[:3])
+    ]
 
+    if dry_run:
+        for entry in matching:
+            click.echo(f"  * {entry.board_id} {entry.version} ({entry.language})")
+        megabytes = sum(entry.size for entry in matching) / 1_000_000
+        click.echo(
+            f"Would clear {len(matching)} firmware versions ({megabytes:.2f} MB)"
+        )
+        return
+
+    circfirm.backend.cache.remove_uf2s(matching)
+    circfirm.backend.cache.remove_abandoned_downloads(
+        {entry.board_id for entry in matching}, matches
+    )
     click.echo("Cache cleared of specified entries!")
 
 
+@cli.command(name="prune")
+@click.option(
+    "-k",
+    "--keep-latest",
+    default=None,
+    type=click.IntRange(min=0),
+    help="Number of the newest stable versions to keep for each board and language",
+)
+@click.option(
+    "-p",
+    "--pre-releases",
+    is_flag=True,
+    default=False,
+    help="Remove pre-release versions older than the newest stable version",
+)
+@click.option(
+    "-l",
+    "--language",
+    default=(),
+    multiple=True,
+    help="CircuitPython language/locale to keep (default: all)",
+)
+@click.option(
+    "-n",
+    "--dry-run",
+    is_flag=True,
+    default=False,
+    help="List the firmware versions that would be removed without removing them",
+)
+def cache_prune(
+    keep_latest: int | None,
+    pre_releases: bool,
+    language: tuple[str, ...],
+    dry_run: bool,
+) -> None:
+    """Remove cached firmware versions according to a retention policy.
+
+    Firmware versions pinned in the settings are always kept.
+    """
+    if keep_latest is None and not pre_releases and not language:
+        raise click.UsageError(
+            "At least one of --keep-latest, --pre-releases, or --language must be given"
+        )
+    languages = split_values(language) if language else None
+    prunable = circfirm.backend.cache.get_prunable_uf2s(
+        keep_latest, pre_releases, languages, circfirm.cli.get_cache_pins()
+    )
+    if not dry_run:
+        prunable = circfirm.backend.cache.remove_uf2s(prunable)
+
+    for entry in prunable:
+        click.echo(f"  * {entry.board_id} {entry.version} ({entry.language})")
+    megabytes = sum(entry.size for entry in prunable) / 1_000_000
+    if dry_run:
+        click.echo(
+            f"Would remove {len(prunable)} firmware versions ({megabytes:.2f} MB)"
+        )
+    else:
+        click.echo(
+            f"Removed {len(prunable)} firmware versions ({megabytes:.2f} MB reclaimed)"
+        )
+
+
 @cli.command(name="list")
 @click.option("-b", "--board-id", default=None, help="CircuitPython board ID")
 def cache_list(board_id: str | None) -> None:
     """List all the boards/versions cached."""
-    board_list = os.listdir(circfirm.UF2_ARCHIVE)
+    boards = circfirm.backend.cache.get_sorted_boards(board_id)
 
-    if not board_list:
+    if not boards and board_id is None:
         circfirm.cli.maybe_support("Versions have not been cached yet for any boards.")
         return
 
-    if board_id is not None and board_id not in board_list:
+    if not boards:
         circfirm.cli.maybe_support(
             f"No versions for board '{board_id}' are not cached."
         )
         return
 
-    specified_board = board_id if board_id is not None else None
-    boards = circfirm.backend.cache.get_sorted_boards(specified_board)
-
     for rec_boardid, rec_boardvers in boards.items():
         click.echo(f"{rec_boardid}")
         for rec_boardver, rec_boardlangs in rec_boardvers.items():
@@ -113,25 +203,151 @@ def cache_list(board_id: str | None) -> None:
                 click.echo(f"  * {rec_boardver} ({rec_boardlang})")
 
 
-@cli.command(name="save")
-@click.argument("board-id")
-@click.argument("version")
-@click.option("-l", "--language", default="en_US", help="CircuitPython language/locale")
-def cache_save(board_id: str, version: str, language: str) -> None:
-    """Download a version of CircuitPython to the cache."""
+@cli.command(name="rebuild")
+def cache_rebuild() -> None:
+    """Rebuild the catalog of cached firmware from the archive."""
+    count = circfirm.backend.catalog.rebuild()
+    click.echo(f"Cataloged {count} firmware files")
+
+
+def split_values(values: Iterable[str]) -> list[str]:
+    """Split comma-separated values into a single list without duplicates."""
+    split: dict[str, None] = {}
+    for value in values:
+        for item in str(value).split(","):
+            if item.strip():
+                split[item.strip()] = None
+    return list(split)
+
+
+def read_manifest(
+    manifest: str, with_versions: bool = True
+) -> list[tuple[str, str | None, str]]:
+    """Read the board IDs, versions, and languages listed in a manifest file.
+
+    The manifest is a YAML list of entries, each with a ``board-id`` and
+    optionally a ``version`` and ``language``.  Each of these can be a single
+    value or a list of values, and every combination of them is used.
+    """
+    with open(manifest, encoding="utf-8") as manifest_file:
+        entries = yaml.safe_load(manifest_file) or []
+    jobs: list[tuple[str, str | None, str]] = []
     try:
-        circfirm.cli.announce_and_await(
-            f"Caching firmware version {version} for {board_id}",
-            circfirm.backend.cache.download_uf2,
-            args=(board_id, version, language),
+        for entry in entries:
+            values = {
+                key: entry[key] if isinstance(entry[key], list) else [entry[key]]
+                for key in ("board-id", "version", "language")
+                if key in entry
+            }
+            board_ids = split_values(values["board-id"])
+            versions = split_values(values["version"]) if with_versions else [None]
+            languages = split_values(values.get("language", ["en_US"]))
+            jobs.extend(itertools.product(board_ids, versions, languages))
+    except (KeyError, TypeError):
+        raise click.ClickException(f"Could not parse the manifest file {manifest}")
+    return jobs
+
+
+def save_many(jobs: list[tuple[str, str, str]], max_workers: int) -> None:
+    """Download many versions of CircuitPython to the cache in parallel via CLI."""
+    pending = [job for job in jobs if not circfirm.backend.cache.is_downloaded(*job)]
+    failures: list[tuple[tuple[str, str, str], Exception]] = []
+    with click.progressbar(
+        length=len(pending), label=f"Caching {len(pending)} firmware versions"
+    ) as progress:
+        for job, error in circfirm.backend.cache.download_uf2s(pending, max_workers):
+            if error is not None:
+                failures.append((job, error))
+            progress.update(1)
+    circfirm.cli.evict_firmware(jobs)
+
+    click.echo(
+        f"Cached {len(pending) - len(failures)} firmware versions "
+        f"({len(jobs) - len(pending)} already cached, {len(failures)} failed)"
+    )
+    for (board_id, version, language), error in failures:
+        click.echo(f"  * {board_id} {version} ({language}): {error}")
+    if failures:
+        raise click.ClickException("Some firmware versions could not be cached")
+
+
+@cli.command(name="save")
+@click.argument("board-id", required=False)
+@click.argument("version", required=False)
+@click.option(
+    "-l",
+    "--language",
+    default=("en_US",),
+    multiple=True,
+    help="CircuitPython language/locale",
+)
+@click.option(
+    "-m",
+    "--manifest",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False),
+    help="YAML file listing board IDs, versions, and languages to cache",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=8,
+    type=click.IntRange(min=1),
+    help="Number of firmware versions to download at the same time",
+)
+def cache_save(
+    board_id: str | None,
+    version: str | None,
+    language: tuple[str, ...],
+    manifest: str | None,
+    jobs: int,
+) -> None:
+    """Download a version of CircuitPython to the cache.
+
+    The board ID, version, and language can each be given as comma-separated
+    lists, in which case every combination of them is downloaded in parallel.
+    """
+    if manifest is None and (board_id is None or version is None):
+        raise click.UsageError("A board ID and version must be given")
+    circfirm.cli.configure_backend()
+
+    save_jobs = []
+    if board_id is not None and version is not None:
+        save_jobs = list(
+            itertools.product(
+                split_values((board_id,)),
+                split_values((version,)),
+                split_values(language),
+            )
         )
-    except ConnectionError as err:
-        raise click.exceptions.ClickException(err.args[0])
+    if manifest is not None:
+        save_jobs = list(dict.fromkeys(save_jobs + read_manifest(manifest)))
+
+    if len(save_jobs) == 1 and manifest is None:
+        board_id, version, language = save_jobs[0]
+        try:
+            circfirm.cli.announce_and_await(
+                f"Caching firmware version {version} for {board_id}",
+                circfirm.backend.cache.download_uf2,
+                args=(board_id, version, language),
+            )
+        except ConnectionError as err:
+            raise click.exceptions.ClickException(err.args[0])
+        circfirm.cli.evict_firmware([(board_id, version, language)])
+        return
+
+    save_many(save_jobs, jobs)
 
 
 @cli.command(name="latest")
-@click.argument("board-id")
-@click.option("-l", "--language", default="en_US", help="CircuitPython language/locale")
+@click.argument("board-id", required=False)
+@click.option(
+    "-l",
+    "--language",
+    default=("en_US",),
+    multiple=True,
+    help="CircuitPython language/locale",
+)
 @click.option(
     "-p",
     "--pre-release",
@@ -139,20 +355,99 @@ def cache_save(board_id: str, version: str, language: str) -> None:
     default=False,
     help="Whether pre-release versions should be considered",
 )
-def cache_latest(board_id: str, language: str, pre_release: bool) -> None:
-    """Download the latest version of CircuitPython to the cache."""
-    try:
-        version = circfirm.backend.s3.get_latest_board_version(
-            board_id, language, pre_release
-        )
-        circfirm.cli.announce_and_await(
-            f"Caching firmware version {version} for {board_id}",
-            circfirm.backend.cache.download_uf2,
-            args=(board_id, version, language),
-        )
-    except ConnectionError as err:
-        raise click.exceptions.ClickException(err.args[0])
-    except botocore.exceptions.ConnectionError:
-        raise click.exceptions.ClickException(
-            "Could not connect to the S3 bucket - check network connection"
+@click.option(
+    "-m",
+    "--manifest",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False),
+    help="YAML file listing board IDs and languages to cache",
+)
+@click.option(
+    "-f",
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="Ignore any cached version listings",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=8,
+    type=click.IntRange(min=1),
+    help="Number of firmware versions to download at the same time",
+)
+def cache_latest(  # noqa: PLR0913
+    board_id: str | None,
+    language: tuple[str, ...],
+    pre_release: bool,
+    manifest: str | None,
+    jobs: int,
+    refresh: bool,
+) -> None:
+    """Download the latest version of CircuitPython to the cache.
+
+    The board ID and language can each be given as comma-separated lists, in
+    which case every combination of them is downloaded in parallel.
+    """
+    if manifest is None and board_id is None:
+        raise click.UsageError("A board ID must be given")
+    circfirm.cli.configure_backend()
+
+    latest_jobs = []
+    if board_id is not None:
+        latest_jobs = list(
+            itertools.product(split_values((board_id,)), split_values(language))
         )
+    if manifest is not None:
+        latest_jobs += [
+            (manifest_board_id, manifest_language)
+            for manifest_board_id, _, manifest_language in read_manifest(
+                manifest, with_versions=False
+            )
+        ]
+        latest_jobs = list(dict.fromkeys(latest_jobs))
+
+    if len(latest_jobs) == 1 and manifest is None:
+        board_id, language = latest_jobs[0]
+        try:
+            version = circfirm.backend.s3.get_latest_board_version(
+                board_id, language, pre_release, refresh=refresh
+            )
+            circfirm.cli.announce_and_await(
+                f"Caching firmware version {version} for {board_id}",
+                circfirm.backend.cache.download_uf2,
+                args=(board_id, version, language),
+            )
+        except ConnectionError as err:
+            raise click.exceptions.ClickException(err.args[0])
+        except botocore.exceptions.ConnectionError:
+            raise click.exceptions.ClickException(
+                "Could not connect to the S3 bucket - check network connection"
+            )
+        circfirm.cli.evict_firmware([(board_id, version, language)])
+        return
+
+    save_jobs = []
+    failures: list[tuple[tuple[str, str], Exception | None]] = []
+    with click.progressbar(
+        length=len(latest_jobs), label="Determining latest versions"
+    ) as progress:
+        for (
+            (latest_board_id, latest_language),
+            version,
+            error,
+        ) in circfirm.backend.s3.get_latest_board_versions(
+            latest_jobs, pre_release, jobs, refresh=refresh
+        ):
+            if version is None:
+                failures.append(((latest_board_id, latest_language), error))
+            else:
+                save_jobs.append((latest_board_id, version, latest_language))
+            progress.update(1)
+
+    for (failed_board_id, failed_language), error in failures:
+        reason = "no versions found" if error is None else str(error)
+        click.echo(f"  * {failed_board_id} ({failed_language}): {reason}")
+    save_many(save_jobs, jobs)
+    if failures:
+        raise click.ClickException("Some latest versions could not be determined")
@@ -52,6 +52,23 @@ def config_view(setting: str) -> None:
     click.echo(output)
 
 
+def parse_list_value(value: str | bool) -> list:
+    """Parse the value for a list setting, which is given as a YAML list.
+
+    A TypeError is raised if the value is not a YAML list, rather than
+    splitting the value into a list of characters.
+    """
+    if isinstance(value, bool):
+        raise TypeError
+    try:
+        parsed = yaml.safe_load(value)
+    except yaml.YAMLError as err:
+        raise TypeError from err
+    if not isinstance(parsed, list):
+        raise TypeError
+    return parsed
+
+
 @cli.command(name="edit")
 @click.argument("setting", default="")
 @click.argument("value", default="")
@@ -98,6 +115,8 @@ def config_edit(
             raise ValueError
         if prev_value_type == bool and value not in (True, False):
             raise TypeError
+        if prev_value_type == list:
+            value = parse_list_value(value)
         target_setting[config_args[-1]] = prev_value_type(value)
     except KeyError:
         raise click.ClickException(f"Setting {setting} does not exist")
@@ -6,6 +6,8 @@
 Author(s): Alec Delaney
 """
 
+import sys
+
 import click
 
 import circfirm.backend.device
@@ -22,18 +24,57 @@ def get_board_info() -> tuple[str, str]:
     return circfirm.backend.device.get_board_info(circuitpy)
 
 
+def get_all_board_info() -> list[circfirm.backend.device.Device]:
+    """Get the board info of every connected board via the CLI."""
+    devices = circfirm.backend.device.find_devices()
+    if not devices:
+        click.echo("CircuitPython device not found!")
+        click.echo("Check that the device is connected and mounted.")
+        sys.exit(1)
+    circuitpys = [device for device in devices if not device.bootloader]
+    if not circuitpys:
+        raise click.ClickException(
+            "Board must be in CIRCUITPY mode in order to detect board information"
+        )
+    return circuitpys
+
+
 @click.group()
 def cli() -> None:
     """Check the information about the currently connected board."""
 
 
 @cli.command(name="board-id")
-def current_board_id() -> None:
+@click.option(
+    "-a",
+    "--all",
+    "all_devices",
+    is_flag=True,
+    default=False,
+    help="Check every connected board, along with its location",
+)
+def current_board_id(all_devices: bool) -> None:
     """Get the board ID of the currently connected board."""
+    if all_devices:
+        for device in get_all_board_info():
+            click.echo(f"{device.path}: {device.board_id or 'unknown'}")
+        return
     click.echo(get_board_info()[0])
 
 
 @cli.command(name="version")
-def current_version() -> None:
+@click.option(
+    "-a",
+    "--all",
+    "all_devices",
+    is_flag=True,
+    default=False,
+    help="Check every connected board, along with its location",
+)
+def current_version(all_devices: bool) -> None:
     """Get the CircuitPython version of the currently connected board."""
+    if all_devices:
+        for device in get_all_board_info():
+            click.echo(f"{device.path}: {device.version or 'unknown'}")
+        return
     click.echo(get_board_info()[1])
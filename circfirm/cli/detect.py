@@ -16,21 +16,60 @@ def cli() -> None:
     """Detect connected CircuitPython boards."""
 
 
+def format_device(device: circfirm.backend.device.Device) -> str:
+    """Format the location, board ID, and version of a connected board."""
+    board_id = device.board_id or "unknown board"
+    version = device.version or "unknown version"
+    return f"{device.path} ({board_id} {version})"
+
+
 @cli.command(name="circuitpy")
-def detect_circuitpy() -> None:
+@click.option(
+    "-a",
+    "--all",
+    "all_devices",
+    is_flag=True,
+    default=False,
+    help="Detect every connected board in this mode",
+)
+def detect_circuitpy(all_devices: bool) -> None:
     """Detect a connected board in CIRCUITPY or equivalent mode."""
-    circuitpy = circfirm.backend.device.find_circuitpy()
-    if not circuitpy:
+    if all_devices:
+        circuitpys = [
+            format_device(device)
+            for device in circfirm.backend.device.find_circuitpys()
+        ]
+    else:
+        circuitpy = circfirm.backend.device.find_circuitpy()
+        circuitpys = [circuitpy] if circuitpy else []
+    if not circuitpys:
         click.echo("No board connected in CIRCUITPY or equivalent mode")
         return
-    click.echo(circuitpy)
+    for circuitpy in circuitpys:
+        click.echo(circuitpy)
 
 
 @cli.command(name="bootloader")
-def detect_bootloader() -> None:
+@click.option(
+    "-a",
+    "--all",
+    "all_devices",
+    is_flag=True,
+    default=False,
+    help="Detect every connected board in this mode",
+)
+def detect_bootloader(all_devices: bool) -> None:
     """Detect a connected board in bootloader mode."""
-    bootloader = circfirm.backend.device.find_bootloader()
-    if not bootloader:
+    if all_devices:
+        bootloaders = [
+            format_device(device)
+            for device in circfirm.backend.device.find_bootloaders()
+        ]
+    else:
+        bootloader = circfirm.backend.device.find_bootloader()
+        bootloaders = [bootloader] if bootloader else []
+    if not bootloaders:
         click.echo("No board connected in bootloader mode")
         return
-    click.echo(bootloader)
+    for bootloader in bootloaders:
+        click.echo(bootloader)
@@ -0,0 +1,51 @@
+# SPDX-FileCopyrightText: 2026 Alec Delaney
+# SPDX-License-Identifier: MIT
+
+"""CLI functionality for the index subcommand.
+
+Author(s): Alec Delaney
+"""
+
+import botocore.exceptions
+import click
+
+import circfirm.backend.index
+import circfirm.backend.s3
+import circfirm.cli
+
+
+@click.group()
+def cli():
+    """Work with the local index of released firmware."""
+
+
+@cli.command(name="build")
+def index_build() -> None:
+    """Build the index of released firmware from the S3 bucket."""
+    circfirm.cli.configure_backend()
+    try:
+        num_entries = circfirm.cli.announce_and_await(
+            "Building the release index", circfirm.backend.s3.build_index
+        )
+    except botocore.exceptions.ConnectionError:
+        raise click.exceptions.ClickException(
+            "Could not connect to the S3 bucket - check network connection"
+        )
+    click.echo(f"Indexed {num_entries} firmware files")
+
+
+@cli.command(name="info")
+def index_info() -> None:
+    """Show when the index of released firmware was built."""
+    build_time = circfirm.backend.index.get_build_time()
+    if build_time is None:
+        click.echo("The release index has not been built.")
+        return
+    click.echo(f"The release index was built on {build_time:%Y-%m-%d %H:%M:%S}.")
+
+
+@cli.command(name="clear")
+def index_clear() -> None:
+    """Delete the index of released firmware."""
+    circfirm.backend.index.delete_index()
+    click.echo("Release index cleared!")
@@ -26,15 +26,64 @@ import circfirm.cli
     default=-1,
     help="Set a timeout in seconds for the switch to bootloader mode",
 )
-def cli(version: str, language: str, board_id: str | None, timeout: int) -> None:
+@click.option(
+    "-a",
+    "--all-connected",
+    is_flag=True,
+    default=False,
+    help="Install on every connected board in bootloader mode",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=8,
+    type=click.IntRange(min=1),
+    help="Number of boards to install on at the same time",
+)
+@click.option(
+    "-c",
+    "--verify",
+    is_flag=True,
+    default=False,
+    help="Wait for the board to reboot and check the installed version",
+)
+def cli(  # noqa: PLR0913
+    version: str,
+    language: str,
+    board_id: str | None,
+    timeout: int,
+    all_connected: bool,
+    jobs: int,
+    verify: bool,
+) -> None:
     """Install the specified version of CircuitPython."""
+    circfirm.cli.configure_backend()
+    if all_connected:
+        if verify:
+            raise click.UsageError(
+                "Installations cannot be verified for every connected board"
+            )
+        boards = circfirm.cli.get_bootloader_boards(board_id)
+        for board in sorted(set(boards.values())):
+            circfirm.cli.download_if_needed(board, version, language)
+        circfirm.cli.copy_cache_firmwares(
+            [
+                (board, version, language, bootloader)
+                for bootloader, board in boards.items()
+            ],
+            jobs,
+        )
+        return
     circuitpy, bootloader = circfirm.cli.get_connection_status()
+    prefetch = circfirm.cli.Prefetch(
+        lambda board: circfirm.cli.prefetch_firmware(board, version, language)
+    )
     try:
         bootloader, board_id = circfirm.cli.get_board_id(
-            circuitpy, bootloader, board_id, timeout
+            circuitpy, bootloader, board_id, timeout, prefetch
         )
     except OSError as err:
         raise click.ClickException(err.args[0])
     circfirm.cli.ensure_bootloader_mode(bootloader)
-    circfirm.cli.download_if_needed(board_id, version, language)
-    circfirm.cli.copy_cache_firmware(board_id, version, language, bootloader)
+    prefetch.wait(board_id)
+    circfirm.cli.install_firmware(board_id, version, language, bootloader, verify)
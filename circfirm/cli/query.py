@@ -27,8 +27,16 @@ def cli():
 @click.option(
     "-r", "--regex", default=".*", help="Regex pattern to use for board IDs (search)"
 )
-def query_board_ids(regex: str) -> None:
+@click.option(
+    "-f",
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="Ignore the stored board list",
+)
+def query_board_ids(regex: str, refresh: bool) -> None:
     """Query the local CircuitPython board list."""
+    circfirm.cli.configure_backend()
     settings = circfirm.cli.get_settings()
     gh_token = settings["token"]["github"]
     do_output = not settings["output"]["supporting"]["silence"]
@@ -43,28 +51,30 @@ def query_board_ids(regex: str) -> None:
         if do_output:
             boards = circfirm.cli.announce_and_await(
                 "Fetching boards list",
-                circfirm.backend.github.get_board_id_list,
+                circfirm.backend.github.iter_board_ids,
                 args=(gh_token,),
+                kwargs={"refresh": refresh},
             )
         else:
-            boards = circfirm.backend.github.get_board_id_list(gh_token)
+            boards = circfirm.backend.github.iter_board_ids(gh_token, refresh=refresh)
+        # Board IDs are output as they are read from the response
+        for board in boards:
+            board_id = board.strip()
+            try:
+                result = re.search(regex, board_id)
+            except re.PatternError:
+                raise click.exceptions.ClickException(
+                    "Regex pattern error - please check the regex syntax"
+                )
+            if result:
+                click.echo(board_id)
     except ValueError as err:
         raise click.ClickException(err.args[0])
-    except requests.ConnectionError:
+    except (requests.ConnectionError, requests.Timeout):
         print("Triggered!")
         raise click.ClickException(
             "Issue with requesting information from git repository, check network connection"
         )
-    for board in boards:
-        board_id = board.strip()
-        try:
-            result = re.search(regex, board_id)
-        except re.PatternError:
-            raise click.exceptions.ClickException(
-                "Regex pattern error - please check the regex syntax"
-            )
-        if result:
-            click.echo(board_id)
 
 
 @cli.command(name="versions")
@@ -73,11 +83,19 @@ def query_board_ids(regex: str) -> None:
 @click.option(
     "-r", "--regex", default=".*", help="Regex pattern to use for versions (match)"
 )
-def query_versions(board_id: str, language: str, regex: str) -> None:
+@click.option(
+    "-f",
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="Ignore any cached version listings",
+)
+def query_versions(board_id: str, language: str, regex: str, refresh: bool) -> None:
     """Query the CircuitPython versions available for a board."""
+    circfirm.cli.configure_backend()
     try:
         versions = circfirm.backend.s3.get_board_versions(
-            board_id, language, regex=regex
+            board_id, language, regex=regex, refresh=refresh
         )
     except botocore.exceptions.ConnectionError as err:
         raise click.exceptions.ClickException(err.args[0])
@@ -99,11 +117,21 @@ def query_versions(board_id: str, language: str, regex: str) -> None:
     default=False,
     help="Consider pre-release versions",
 )
-def query_latest(board_id: str, language: str, pre_release: bool) -> None:
+@click.option(
+    "-f",
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="Ignore any cached version listings",
+)
+def query_latest(
+    board_id: str, language: str, pre_release: bool, refresh: bool
+) -> None:
     """Query the latest CircuitPython versions available."""
+    circfirm.cli.configure_backend()
     try:
         version = circfirm.backend.s3.get_latest_board_version(
-            board_id, language, pre_release
+            board_id, language, pre_release, refresh=refresh
         )
     except botocore.exceptions.ConnectionError as err:
         raise click.exceptions.ClickException(err.args[0])
@@ -0,0 +1,209 @@
+# SPDX-FileCopyrightText: 2026 Alec Delaney
+# SPDX-License-Identifier: MIT
+
+"""CLI functionality for the station subcommand.
+
+Author(s): Alec Delaney
+"""
+
+from typing import NamedTuple
+
+import botocore.exceptions
+import click
+import yaml
+
+import circfirm.backend.cache
+import circfirm.backend.catalog
+import circfirm.backend.device
+import circfirm.backend.s3
+import circfirm.cli
+
+
+class StationPolicy(NamedTuple):
+    """The firmware to install on boards with a given bootloader board ID.
+
+    A bootloader board ID of None matches any board.
+    """
+
+    bootloader_id: str | None
+    board_id: str
+    version: str | None
+    language: str
+
+
+def read_policy(policy_file: str) -> list[StationPolicy]:
+    """Read the policies listed in a policy file.
+
+    The policy file is a YAML list of entries, each with a ``board-id`` and
+    optionally a ``bootloader-id``, ``version``, and ``language``.
+    """
+    with open(policy_file, encoding="utf-8") as policyfile:
+        entries = yaml.safe_load(policyfile) or []
+    try:
+        return [
+            StationPolicy(
+                entry.get("bootloader-id"),
+                entry["board-id"],
+                str(entry["version"]) if "version" in entry else None,
+                entry.get("language", "en_US"),
+            )
+            for entry in entries
+        ]
+    except (KeyError, TypeError, AttributeError):
+        raise click.ClickException(f"Could not parse the policy file {policy_file}")
+
+
+def prepare_policy(
+    policy: StationPolicy, pre_release: bool, refresh: bool
+) -> StationPolicy:
+    """Resolve the version of a policy and download its firmware via CLI."""
+    version = policy.version
+    if version is None:
+        try:
+            version = circfirm.backend.s3.get_latest_board_version(
+                policy.board_id, policy.language, pre_release, refresh=refresh
+            )
+        except botocore.exceptions.ConnectionError as err:
+            raise click.exceptions.ClickException(err.args[0])
+        if version is None:
+            raise click.ClickException(f"No versions exist for {policy.board_id}")
+    circfirm.cli.download_if_needed(policy.board_id, version, policy.language)
+    return policy._replace(version=version)
+
+
+def copy_policy_firmware(
+    policy: StationPolicy,
+    bootloader: circfirm.backend.device.Device,
+    preallocate: bool,
+    pre_release: bool,
+    refresh: bool,
+) -> circfirm.backend.cache.CopyResult:
+    """Copy the firmware of a prepared policy to a device in bootloader mode via CLI.
+
+    The firmware is marked as used, so that it is evicted from the cache
+    last.  If it was removed from the cache since the policy was prepared
+    (such as by another command), the policy is prepared again.
+    """
+    firmware = (policy.board_id, policy.version, policy.language)
+
+    def copy_firmware() -> circfirm.backend.cache.CopyResult:
+        """Copy the firmware to the device."""
+        circfirm.backend.catalog.touch_firmware(*firmware)
+        return circfirm.cli.announce_and_await(
+            f"Copying UF2 to {policy.board_id} at {bootloader.path}",
+            circfirm.backend.cache.copy_uf2,
+            args=(*firmware, bootloader.path),
+            kwargs={"preallocate": preallocate},
+        )
+
+    try:
+        return copy_firmware()
+    except FileNotFoundError:
+        if circfirm.backend.cache.is_downloaded(*firmware):
+            raise
+    prepare_policy(policy, pre_release, refresh)
+    return copy_firmware()
+
+
+def match_policy(
+    policies: list[StationPolicy], bootloader: circfirm.backend.device.Device
+) -> StationPolicy | None:
+    """Get the first policy matching a device in bootloader mode, if any."""
+    for policy in policies:
+        if policy.bootloader_id in {None, bootloader.board_id}:
+            return policy
+    return None
+
+
+@click.command()
+@click.option(
+    "-b",
+    "--board-id",
+    default=None,
+    help="Board ID to install for any connected board",
+)
+@click.option(
+    "-v",
+    "--version",
+    default=None,
+    help="CircuitPython version to install (default: latest)",
+)
+@click.option("-l", "--language", default="en_US", help="CircuitPython language/locale")
+@click.option(
+    "-m",
+    "--policy",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False),
+    help="YAML file matching bootloader board IDs to the firmware to install",
+)
+@click.option(
+    "-p",
+    "--pre-release",
+    is_flag=True,
+    default=False,
+    help="Whether pre-release versions should be considered",
+)
+@click.option(
+    "-f",
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="Ignore any cached version listings",
+)
+@click.option(
+    "-n",
+    "--count",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Stop after installing on this many boards",
+)
+def cli(  # noqa: PLR0913
+    board_id: str | None,
+    version: str | None,
+    language: str,
+    policy: str | None,
+    pre_release: bool,
+    refresh: bool,
+    count: int | None,
+) -> None:
+    """Install CircuitPython on boards as they are connected in bootloader mode."""
+    policies = read_policy(policy) if policy is not None else []
+    if board_id is not None:
+        policies.append(StationPolicy(None, board_id, version, language))
+    if not policies:
+        raise click.UsageError("A board ID or policy file must be given")
+
+    circfirm.cli.configure_backend()
+    policies = [
+        prepare_policy(station_policy, pre_release, refresh)
+        for station_policy in policies
+    ]
+
+    preallocate = circfirm.cli.get_settings()["copy"]["preallocate"]
+    click.echo("Waiting for boards in bootloader mode (press Ctrl+C to stop)")
+    installed = 0
+    try:
+        for bootloader in circfirm.backend.device.watch_bootloaders():
+            station_policy = match_policy(policies, bootloader)
+            if station_policy is None:
+                click.echo(
+                    f"Skipping {bootloader.path}, as no policy matches bootloader "
+                    f"board ID {bootloader.board_id}"
+                )
+                continue
+            try:
+                result = copy_policy_firmware(
+                    station_policy, bootloader, preallocate, pre_release, refresh
+                )
+            except OSError as err:
+                click.echo(f"Error: {err}")
+                continue
+            circfirm.cli.maybe_support(
+                f"Copied {circfirm.cli.format_copy_result(result)}"
+            )
+            installed += 1
+            if count is not None and installed >= count:
+                break
+    except KeyboardInterrupt:
+        click.echo()
+    click.echo(f"CircuitPython installed on {installed} boards")
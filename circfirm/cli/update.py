@@ -12,6 +12,7 @@ import packaging.version
 
 import circfirm.backend.device
 import circfirm.backend.s3
+import circfirm.cli
 
 
 @click.command()
@@ -49,6 +50,34 @@ import circfirm.backend.s3
     default=False,
     help="Upgrade up to patch version updates",
 )
+@click.option(
+    "-f",
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="Ignore any cached version listings",
+)
+@click.option(
+    "-a",
+    "--all-connected",
+    is_flag=True,
+    default=False,
+    help="Update every connected board in bootloader mode",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=8,
+    type=click.IntRange(min=1),
+    help="Number of boards to update at the same time",
+)
+@click.option(
+    "-c",
+    "--verify",
+    is_flag=True,
+    default=False,
+    help="Wait for the board to reboot and check the updated version",
+)
 def cli(  # noqa: PLR0913
     board_id: str | None,
     language: str,
@@ -56,8 +85,26 @@ def cli(  # noqa: PLR0913
     pre_release: bool,
     limit_to_minor: bool,
     limit_to_patch: bool,
+    refresh: bool,
+    all_connected: bool,
+    jobs: int,
+    verify: bool,
 ) -> None:
     """Update a connected board to the latest CircuitPython version."""
+    circfirm.cli.configure_backend()
+    if all_connected:
+        if limit_to_minor or limit_to_patch:
+            raise click.UsageError(
+                "Updates cannot be limited for every connected board, as installed "
+                "versions cannot be checked in bootloader mode"
+            )
+        if verify:
+            raise click.UsageError(
+                "Updates cannot be verified for every connected board"
+            )
+        update_all_connected(board_id, language, pre_release, refresh, jobs)
+        return
+
     circuitpy, bootloader = circfirm.cli.get_connection_status()
     if circuitpy:
         _, current_version = circfirm.backend.device.get_board_info(circuitpy)
@@ -69,15 +116,61 @@ def cli(  # noqa: PLR0913
             "The latest version will be installed regardless of the currently installed version."
         )
         current_version = "0.0.0"
+    prefetch = circfirm.cli.Prefetch(
+        lambda board: prefetch_update(
+            board,
+            language,
+            current_version,
+            pre_release,
+            limit_to_minor,
+            limit_to_patch,
+            refresh,
+        )
+    )
     try:
         bootloader, board_id = circfirm.cli.get_board_id(
-            circuitpy, bootloader, board_id, timeout
+            circuitpy, bootloader, board_id, timeout, prefetch
         )
     except OSError as err:
         raise click.ClickException(err.args[0])
 
+    new_version = prefetch.wait(board_id)
+    if new_version is None:
+        new_version = get_update_version(
+            board_id,
+            language,
+            current_version,
+            pre_release,
+            limit_to_minor,
+            limit_to_patch,
+            refresh,
+        )
+    if packaging.version.Version(current_version) >= packaging.version.Version(
+        new_version
+    ):
+        click.echo(
+            f"Current version ({current_version}) is at or higher than proposed new update ({new_version})"
+        )
+        return
+
+    circfirm.cli.ensure_bootloader_mode(bootloader)
+    circfirm.cli.install_firmware(board_id, new_version, language, bootloader, verify)
+
+
+def get_update_version(  # noqa: PLR0913
+    board_id: str,
+    language: str,
+    current_version: str,
+    pre_release: bool,
+    limit_to_minor: bool,
+    limit_to_patch: bool,
+    refresh: bool,
+) -> str:
+    """Get the version of CircuitPython to update a board to."""
     try:
-        new_versions = circfirm.backend.s3.get_board_versions(board_id, language)
+        new_versions = circfirm.backend.s3.get_board_versions(
+            board_id, language, refresh=refresh
+        )
     except botocore.exceptions.ConnectionError as err:
         raise click.exceptions.ClickException(err.args[0])
 
@@ -108,15 +201,56 @@ def cli(  # noqa: PLR0913
             "No versions exist that meet the given update criteria"
         )
 
-    new_version = new_versions[0]
-    if packaging.version.Version(current_version) >= packaging.version.Version(
+    return new_versions[0]
+
+
+def prefetch_update(  # noqa: PLR0913
+    board_id: str,
+    language: str,
+    current_version: str,
+    pre_release: bool,
+    limit_to_minor: bool,
+    limit_to_patch: bool,
+    refresh: bool,
+) -> str:
+    """Get the version to update a board to, and download it if it is newer."""
+    new_version = get_update_version(
+        board_id,
+        language,
+        current_version,
+        pre_release,
+        limit_to_minor,
+        limit_to_patch,
+        refresh,
+    )
+    if packaging.version.Version(current_version) < packaging.version.Version(
         new_version
     ):
-        click.echo(
-            f"Current version ({current_version}) is at or higher than proposed new update ({new_version})"
-        )
-        return
+        circfirm.cli.prefetch_firmware(board_id, new_version, language)
+    return new_version
 
-    circfirm.cli.ensure_bootloader_mode(bootloader)
-    circfirm.cli.download_if_needed(board_id, new_version, language)
-    circfirm.cli.copy_cache_firmware(board_id, new_version, language, bootloader)
+
+def update_all_connected(
+    board_id: str | None, language: str, pre_release: bool, refresh: bool, jobs: int
+) -> None:
+    """Update every connected board in bootloader mode to the latest version."""
+    boards = circfirm.cli.get_bootloader_boards(board_id)
+    latest_versions: dict[str, str] = {}
+    for board in sorted(set(boards.values())):
+        try:
+            latest_version = circfirm.backend.s3.get_latest_board_version(
+                board, language, pre_release, refresh=refresh
+            )
+        except botocore.exceptions.ConnectionError as err:
+            raise click.exceptions.ClickException(err.args[0])
+        if latest_version is None:
+            raise click.ClickException(f"No versions exist for {board}")
+        latest_versions[board] = latest_version
+        circfirm.cli.download_if_needed(board, latest_version, language)
+    circfirm.cli.copy_cache_firmwares(
+        [
+            (board, latest_versions[board], language, bootloader)
+            for bootloader, board in boards.items()
+        ],
+        jobs,
+    )
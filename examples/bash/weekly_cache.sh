@@ -1,21 +1,11 @@
 # SPDX-FileCopyrightText: 2024 Alec Delaney, for Adafruit Industries
 # SPDX-License-Identifier: Unlicense
 
-# Store the board IDs in an array
-BOARD_IDS=(
-    "feather_m4_express"
-    "feather_m0_express"
-    "circuitplayground_express"
-)
+# Store the board IDs in a comma-separated list
+BOARD_IDS="feather_m4_express,feather_m0_express,circuitplayground_express"
 
-# Iterate for each board ID
-for BOARD_ID in ${BOARD_IDS[*]}; do
-    # Get the latest CircuitPython version for the board
-    LATEST_VERSION=$(circfirm query latest $BOARD_ID)
-
-    # Cache the determined version for the board
-    circfirm cache save $BOARD_ID $LATEST_VERSION
-done
+# Cache the latest CircuitPython version for every board, downloading in parallel
+circfirm cache latest $BOARD_IDS
 
 # To make this script weekly, you can use crontab.
 # The following line would run this script every Sunday at 9:00 am:
@@ -0,0 +1,117 @@
+# SPDX-FileCopyrightText: 2026 Alec Delaney
+# SPDX-License-Identifier: MIT
+
+"""Tests the backend bootloader mapping functionality.
+
+Author(s): Alec Delaney
+"""
+
+import pathlib
+
+import pytest
+
+import circfirm
+import circfirm.backend.bootloader
+
+BOARD_IDS = [
+    "pygamer",
+    "pygamer_advance",
+    "feather_m4_express",
+    "adafruit_feather_rp2040",
+    "sparkfun_feather_rp2040",
+    "metro_m4_express",
+]
+
+
+@pytest.fixture
+def mock_bootloader_map(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+) -> pathlib.Path:
+    """Run with the bootloader mapping stored in a temporary folder."""  # noqa: D401
+    map_file = tmp_path / "bootloaders.yaml"
+    monkeypatch.setattr(circfirm, "BOOTLOADER_MAP", str(map_file))
+    return map_file
+
+
+@pytest.mark.parametrize(
+    "model,expected_board_id",
+    (
+        ("PyGamer", "pygamer"),
+        ("Feather M4 Express", "feather_m4_express"),
+        ("Metro M4 Express", "metro_m4_express"),
+        ("Raspberry Pi RP2", None),
+        ("Feather RP2040", None),
+        (None, None),
+    ),
+)
+def test_match_board_id(model: str | None, expected_board_id: str | None) -> None:
+    """Tests matching UF2 bootloader models to CircuitPython board IDs."""
+    board_id = circfirm.backend.bootloader.match_board_id(model, BOARD_IDS)
+    assert board_id == expected_board_id
+
+
+def test_resolve_board_id(mock_bootloader_map: pathlib.Path) -> None:
+    """Tests that matched bootloaders are stored in the mapping."""
+    uf2_board_id = "SAMD51J19A-PyGamer-M4"
+    assert circfirm.backend.bootloader.lookup_board_id(uf2_board_id, "PyGamer") is None
+
+    board_id = circfirm.backend.bootloader.resolve_board_id(
+        uf2_board_id, "PyGamer", BOARD_IDS
+    )
+    assert board_id == "pygamer"
+    assert (
+        circfirm.backend.bootloader.lookup_board_id(uf2_board_id, "PyGamer")
+        == "pygamer"
+    )
+
+    # Test that the stored mapping is used instead of the board list
+    assert (
+        circfirm.backend.bootloader.resolve_board_id(uf2_board_id, "PyGamer", [])
+        == "pygamer"
+    )
+
+    # Test that other models sharing the bootloader board ID are matched
+    # separately
+    assert circfirm.backend.bootloader.lookup_board_id(uf2_board_id, None) is None
+    board_id = circfirm.backend.bootloader.resolve_board_id(
+        uf2_board_id, "PyGamer Advance", BOARD_IDS
+    )
+    assert board_id == "pygamer_advance"
+
+    # Test that bootloaders without a model are not matched or stored
+    assert (
+        circfirm.backend.bootloader.resolve_board_id(uf2_board_id, None, BOARD_IDS)
+        is None
+    )
+    assert circfirm.backend.bootloader.resolve_board_id("RPI-RP2", None, []) is None
+    assert circfirm.backend.bootloader.read_bootloader_map() == {
+        (uf2_board_id, "PyGamer"): "pygamer",
+        (uf2_board_id, "PyGamer Advance"): "pygamer_advance",
+    }
+
+
+def test_read_bootloader_map_edited(mock_bootloader_map: pathlib.Path) -> None:
+    """Tests reading a mapping edited by the user."""
+    mock_bootloader_map.write_text("RPI-RP2: raspberry_pi_pico\n", encoding="utf-8")
+    assert circfirm.backend.bootloader.lookup_board_id("RPI-RP2", "RP2") == (
+        "raspberry_pi_pico"
+    )
+
+    # Test that models listed for a bootloader board ID are used first, and
+    # that the mapping is stored the same way
+    mock_bootloader_map.write_text(
+        "RPI-RP2:\n  Pico W: raspberry_pi_pico_w\n  null: raspberry_pi_pico\n",
+        encoding="utf-8",
+    )
+    assert circfirm.backend.bootloader.lookup_board_id("RPI-RP2", "Pico W") == (
+        "raspberry_pi_pico_w"
+    )
+    assert circfirm.backend.bootloader.lookup_board_id("RPI-RP2", "RP2") == (
+        "raspberry_pi_pico"
+    )
+    bootloader_map = circfirm.backend.bootloader.read_bootloader_map()
+    circfirm.backend.bootloader.write_bootloader_map(bootloader_map)
+    assert circfirm.backend.bootloader.read_bootloader_map() == bootloader_map
+
+    mock_bootloader_map.write_text("- not a mapping\n", encoding="utf-8")
+    assert circfirm.backend.bootloader.read_bootloader_map() == {}
@@ -6,12 +6,46 @@
 Author(s): Alec Delaney
 """
 
+import os
 import pathlib
 import shutil
+import threading
+from collections.abc import Iterator
+from typing import NoReturn
 
 import pytest
+import requests
 
 import circfirm.backend.cache
+import circfirm.backend.catalog
+import circfirm.backend.lock
+import circfirm.backend.session
+
+
+class MockStreamedResponse:
+    """Mock streamed response for a UF2 download."""
+
+    def __init__(
+        self, chunks: list[bytes], content_length: int, interrupted: bool = False
+    ) -> None:
+        """Store the chunks to be streamed."""
+        self.status_code = 200
+        self.headers = {"Content-Length": str(content_length)}
+        self.chunks = chunks
+        self.interrupted = interrupted
+
+    def __enter__(self) -> "MockStreamedResponse":
+        """Enter the context manager."""
+        return self
+
+    def __exit__(self, *args) -> None:
+        """Exit the context manager."""
+
+    def iter_content(self, chunk_size: int) -> Iterator[bytes]:
+        """Stream the chunks, possibly interrupting partway through."""
+        yield from self.chunks
+        if self.interrupted:
+            raise requests.exceptions.ChunkedEncodingError
 
 
 def test_get_board_folder() -> None:
@@ -68,3 +102,399 @@ def test_download_uf2() -> None:
 
     # Clean up post tests
     shutil.rmtree(expected_path.parent)
+
+
+@pytest.mark.parametrize(
+    "response",
+    (
+        MockStreamedResponse([b"UF2", b"data"], 10),
+        MockStreamedResponse([b"UF2", b"data"], 7, interrupted=True),
+    ),
+)
+def test_download_uf2_incomplete(
+    monkeypatch: pytest.MonkeyPatch, response: MockStreamedResponse
+) -> None:
+    """Tests that an incomplete download does not leave a file in the archive."""
+    board_id = "feather_m4_express"
+    version = "7.0.0"
+    rmdir = pathlib.Path.rmdir
+
+    def mock_rmdir(path: pathlib.Path) -> None:
+        """Check that the archive is locked while removing the board folder."""
+        archive_lock = circfirm.backend.lock.ARCHIVE_LOCK
+        with circfirm.backend.lock.try_lock(archive_lock, exclusive=False) as acquired:
+            assert not acquired
+        rmdir(path)
+
+    monkeypatch.setattr(
+        circfirm.backend.session, "get", lambda *args, **kwargs: response
+    )
+    monkeypatch.setattr(pathlib.Path, "rmdir", mock_rmdir)
+
+    with pytest.raises(ConnectionError):
+        circfirm.backend.cache.download_uf2(board_id, version)
+    assert not circfirm.backend.cache.is_downloaded(board_id, version)
+    assert not circfirm.backend.cache.get_board_folder(board_id).exists()
+
+
+def test_download_uf2_streamed(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that a complete download is moved into place in the archive."""
+    board_id = "feather_m4_express"
+    version = "7.0.0"
+    chunks = [b"UF2", b"data"]
+    response = MockStreamedResponse(chunks, 7)
+    monkeypatch.setattr(
+        circfirm.backend.session, "get", lambda *args, **kwargs: response
+    )
+
+    # Abandoned downloads of the file are replaced
+    uf2_file = circfirm.backend.cache.get_uf2_filepath(board_id, version)
+    uf2_file.parent.mkdir(parents=True)
+    (uf2_file.parent / f".{uf2_file.name}.abandoned.part").write_bytes(b"UF2")
+
+    try:
+        circfirm.backend.cache.download_uf2(board_id, version)
+        assert uf2_file.read_bytes() == b"".join(chunks)
+        assert list(uf2_file.parent.iterdir()) == [uf2_file]
+    finally:
+        shutil.rmtree(circfirm.backend.cache.get_board_folder(board_id))
+
+
+def test_download_uf2_tee(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+) -> None:
+    """Tests writing a download to a device in bootloader mode as it is streamed."""
+    board_id = "feather_m4_express"
+    version = "7.0.0"
+    chunks = [b"UF2", b"data"]
+    response = MockStreamedResponse(chunks, 7)
+    monkeypatch.setattr(
+        circfirm.backend.session, "get", lambda *args, **kwargs: response
+    )
+
+    try:
+        circfirm.backend.cache.download_uf2(board_id, version, "en_US", str(tmp_path))
+        uf2_file = circfirm.backend.cache.get_uf2_filepath(board_id, version)
+        assert uf2_file.read_bytes() == b"".join(chunks)
+        assert (tmp_path / uf2_file.name).read_bytes() == b"".join(chunks)
+    finally:
+        shutil.rmtree(circfirm.backend.cache.get_board_folder(board_id))
+
+    # Test that an incomplete download is removed from the device
+    response = MockStreamedResponse(chunks, 10)
+    (tmp_path / uf2_file.name).unlink()
+    with pytest.raises(ConnectionError):
+        circfirm.backend.cache.download_uf2(board_id, version, "en_US", str(tmp_path))
+    assert not circfirm.backend.cache.is_downloaded(board_id, version)
+    assert not (tmp_path / uf2_file.name).exists()
+
+
+def test_download_uf2_tee_device_error(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+) -> None:
+    """Tests that a complete download is archived if writing to the device fails."""
+    board_id = "feather_m4_express"
+    version = "7.0.0"
+    response = MockStreamedResponse([b"UF2", b"data"], 7)
+    monkeypatch.setattr(
+        circfirm.backend.session, "get", lambda *args, **kwargs: response
+    )
+
+    def mock_write_chunks(self: circfirm.backend.cache._TeeWriter) -> None:
+        """Fail to write any of the chunks."""
+        while self._chunks.get() is not None:
+            self._error = OSError("Device disconnected")
+
+    monkeypatch.setattr(
+        circfirm.backend.cache._TeeWriter, "_write_chunks", mock_write_chunks
+    )
+
+    try:
+        with pytest.raises(OSError, match="Device disconnected"):
+            circfirm.backend.cache.download_uf2(
+                board_id, version, "en_US", str(tmp_path)
+            )
+        assert circfirm.backend.cache.is_downloaded(board_id, version)
+        assert not list(tmp_path.iterdir())
+    finally:
+        shutil.rmtree(circfirm.backend.cache.get_board_folder(board_id))
+
+    # Test that the download is also archived if the device file cannot be opened
+    try:
+        with pytest.raises(FileNotFoundError):
+            circfirm.backend.cache.download_uf2(
+                board_id, version, "en_US", str(tmp_path / "disconnected")
+            )
+        assert circfirm.backend.cache.is_downloaded(board_id, version)
+    finally:
+        shutil.rmtree(circfirm.backend.cache.get_board_folder(board_id))
+
+
+@pytest.mark.parametrize("preallocate", (True, False))
+def test_copy_uf2(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: pathlib.Path,
+    mock_with_firmwares_archived: None,
+    preallocate: bool,
+) -> None:
+    """Tests copying a downloaded UF2 file to a device in bootloader mode."""
+
+    def mock_posix_fallocate(*args) -> NoReturn:
+        """Fail instead of possibly writing zeros to the device."""
+        raise AssertionError("posix_fallocate() was used")
+
+    monkeypatch.setattr(os, "posix_fallocate", mock_posix_fallocate, raising=False)
+    uf2_file = circfirm.backend.cache.get_uf2_filepath("pygamer", "7.0.0")
+    result = circfirm.backend.cache.copy_uf2(
+        "pygamer", "7.0.0", "en_US", str(tmp_path), preallocate=preallocate
+    )
+    assert (tmp_path / uf2_file.name).read_bytes() == uf2_file.read_bytes()
+    assert result.size == uf2_file.stat().st_size
+    assert result.bytes_per_second > 0
+
+
+@pytest.mark.parametrize("use_mmap", (True, False))
+def test_copy_uf2s(
+    tmp_path: pathlib.Path, mock_with_firmwares_archived: None, use_mmap: bool
+) -> None:
+    """Tests copying downloaded UF2 files to many devices in bootloader mode."""
+    uf2_file = circfirm.backend.cache.get_uf2_filepath("pygamer", "7.0.0")
+    bootloaders = [tmp_path / f"bootloader{index}" for index in range(3)]
+    for bootloader in bootloaders:
+        bootloader.mkdir()
+    jobs = [
+        ("pygamer", "7.0.0", "en_US", str(bootloader)) for bootloader in bootloaders
+    ]
+    jobs.append(("pygamer", "doesnotexist", "en_US", str(bootloaders[0])))
+
+    results = {
+        job: (result, error)
+        for job, result, error in circfirm.backend.cache.copy_uf2s(
+            jobs, use_mmap=use_mmap
+        )
+    }
+    assert set(results) == set(jobs)
+    for job in jobs[:-1]:
+        result, error = results[job]
+        assert error is None
+        assert result.size == uf2_file.stat().st_size
+        copied_file = pathlib.Path(job[3], uf2_file.name)
+        assert copied_file.read_bytes() == uf2_file.read_bytes()
+    result, error = results[jobs[-1]]
+    assert result is None
+    assert isinstance(error, OSError)
+
+
+def test_evict_uf2s(mock_with_firmwares_archived: None) -> None:
+    """Tests evicting the least recently used UF2 files from the archive."""
+    archive = pathlib.Path(circfirm.UF2_ARCHIVE)
+    firmware_files = list(archive.glob("*/*.uf2"))
+    total_size = sum(file.stat().st_size for file in firmware_files)
+    assert circfirm.backend.cache.evict_uf2s(total_size) == []
+
+    # Pinned and recently used firmware files are evicted last
+    pins = [("feather_m4_express", None, None), ("pygamer", "7.0.0", "fr")]
+    pinned_files = [
+        *archive.glob("feather_m4_express/*.uf2"),
+        circfirm.backend.cache.get_uf2_filepath("pygamer", "7.0.0", "fr"),
+    ]
+    used_file = circfirm.backend.cache.get_uf2_filepath("pygamer", "7.2.0")
+    circfirm.backend.catalog.touch_firmware("pygamer", "7.2.0", "en_US")
+    max_size = sum(file.stat().st_size for file in pinned_files)
+    max_size += used_file.stat().st_size
+    evicted = circfirm.backend.cache.evict_uf2s(max_size, pins)
+    assert sorted(archive.glob("*/*.uf2")) == sorted([*pinned_files, used_file])
+    assert len(evicted) == len(firmware_files) - len(pinned_files) - 1
+    assert not (archive / "feather_m0_express").exists()
+    assert circfirm.backend.catalog.get_entries("feather_m0_express") == []
+
+    # Firmware files to keep are not evicted
+    circfirm.backend.cache.evict_uf2s(0, pins, keep=[("pygamer", "7.2.0", "en_US")])
+    assert used_file.exists()
+    circfirm.backend.cache.evict_uf2s(0, pins)
+    assert not used_file.exists()
+    assert sorted(archive.glob("*/*.uf2")) == sorted(pinned_files)
+
+
+def test_get_prunable_uf2s(mock_with_firmwares_archived: None) -> None:
+    """Tests getting the UF2 files a retention policy would remove."""
+    stable_file = circfirm.backend.cache.get_uf2_filepath("pygamer", "7.2.0")
+    for version in ("7.1.0-beta.1", "8.0.0-beta.1"):
+        shutil.copyfile(
+            stable_file, circfirm.backend.cache.get_uf2_filepath("pygamer", version)
+        )
+
+    def get_prunable(**kwargs) -> list[tuple[str, str, str]]:
+        """Get the board IDs, versions, and languages of the prunable UF2 files."""
+        prunable = circfirm.backend.cache.get_prunable_uf2s(**kwargs)
+        return [entry[:3] for entry in prunable]
+
+    assert get_prunable() == []
+
+    # Only the newest stable versions are kept, and pre-releases are kept too
+    prunable = get_prunable(keep_latest=2)
+    assert sorted(prunable) == sorted(
+        entry[:3]
+        for entry in circfirm.backend.catalog.get_entries()
+        if entry.version == "7.0.0"
+    )
+
+    # Only pre-releases older than the newest stable version are removed
+    assert get_prunable(pre_releases=True) == [("pygamer", "7.1.0-beta.1", "en_US")]
+
+    # Only the allowed languages are kept, and pinned versions are never removed
+    prunable = get_prunable(
+        languages=["en_US", "fr"],
+        pins=[("feather_m0_express", None, None), ("pygamer", "7.0.0", None)],
+    )
+    assert prunable == [
+        ("feather_m4_express", "7.2.0", "zh_Latn_pinyin"),
+        ("feather_m4_express", "7.1.0", "zh_Latn_pinyin"),
+        ("feather_m4_express", "7.0.0", "zh_Latn_pinyin"),
+        ("pygamer", "7.2.0", "zh_Latn_pinyin"),
+        ("pygamer", "7.1.0", "zh_Latn_pinyin"),
+    ]
+
+
+def test_remove_uf2s(mock_with_firmwares_archived: None) -> None:
+    """Tests removing many UF2 files from the archive in one pass."""
+    entries = circfirm.backend.catalog.get_entries("feather_m0_express")
+    entries += circfirm.backend.catalog.get_entries("pygamer")[:1]
+    assert circfirm.backend.cache.remove_uf2s(entries) == entries
+    assert not circfirm.backend.cache.get_board_folder("feather_m0_express").exists()
+    assert circfirm.backend.catalog.get_entries("feather_m0_express") == []
+    assert entries[-1] not in circfirm.backend.catalog.get_entries("pygamer")
+
+
+def test_remove_abandoned_downloads(mock_with_firmwares_archived: None) -> None:
+    """Tests removing the temporary files of abandoned downloads from the archive."""
+    temp_files = []
+    for board_id, version, language in (
+        ("pygamer", "7.0.0", "en_US"),
+        ("pygamer", "8.0.0", "fr"),
+        ("feather_m4_express", "8.0.0", "en_US"),
+        ("feather_rp2040", "8.0.0", "en_US"),
+    ):
+        uf2_file = circfirm.backend.cache.get_uf2_filepath(board_id, version, language)
+        uf2_file.parent.mkdir(exist_ok=True)
+        temp_file = uf2_file.parent / f".{uf2_file.name}.a1b2c3d4.part"
+        temp_file.write_bytes(b"UF2")
+        temp_files.append(temp_file)
+    uf2_files = sorted(pathlib.Path(circfirm.UF2_ARCHIVE).glob("*/*.uf2"))
+
+    board_ids = ["pygamer", "feather_m4_express", "feather_rp2040"]
+
+    # Only downloads that match are removed
+    removed = circfirm.backend.cache.remove_abandoned_downloads(
+        board_ids, lambda board_id, version, language: language == "fr"
+    )
+    assert removed == [temp_files[1]]
+
+    # Only the folders of the given boards are checked
+    removed = circfirm.backend.cache.remove_abandoned_downloads(["feather_m4_express"])
+    assert removed == [temp_files[2]]
+
+    # Downloads in progress elsewhere are kept
+    in_progress = circfirm.backend.get_uf2_filename("pygamer", "7.0.0", "en_US")
+    with circfirm.backend.lock.lock(in_progress):
+        removed = circfirm.backend.cache.remove_abandoned_downloads(board_ids)
+    assert removed == [temp_files[3]]
+    assert temp_files[0].exists()
+    assert not circfirm.backend.cache.get_board_folder("feather_rp2040").exists()
+    assert sorted(pathlib.Path(circfirm.UF2_ARCHIVE).glob("*/*.uf2")) == uf2_files
+
+
+def test_download_uf2_single_flight(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+) -> None:
+    """Tests that a download in progress elsewhere is waited on instead of repeated."""
+    board_id = "feather_m4_express"
+    version = "7.0.0"
+    filename = circfirm.backend.get_uf2_filename(board_id, version, "en_US")
+    requests_made = []
+
+    def mock_get(*args, **kwargs) -> MockStreamedResponse:
+        """Mock downloading the UF2 file."""
+        requests_made.append(args)
+        return MockStreamedResponse([b"UF2"], 3)
+
+    waiting = threading.Event()
+    acquire = circfirm.backend.lock._acquire
+
+    def mock_acquire(fd: int, exclusive: bool) -> None:
+        """Signal that the lock is being waited on, then acquire it."""
+        waiting.set()
+        acquire(fd, exclusive)
+
+    monkeypatch.setattr(circfirm.backend.session, "get", mock_get)
+    monkeypatch.setattr(circfirm.backend.lock, "_acquire", mock_acquire)
+
+    try:
+        # The download finishes elsewhere while waiting, so it is only copied
+        with circfirm.backend.lock.lock(filename):
+            thread = threading.Thread(
+                target=circfirm.backend.cache.download_uf2,
+                args=(board_id, version, "en_US", str(tmp_path)),
+            )
+            thread.start()
+            waiting.wait()
+            uf2_file = circfirm.backend.cache.get_uf2_filepath(board_id, version)
+            uf2_file.parent.mkdir(parents=True)
+            uf2_file.write_bytes(b"UF2")
+        thread.join()
+        assert requests_made == []
+        assert (tmp_path / filename).read_bytes() == b"UF2"
+
+        # The file is downloaded again if it is not being downloaded elsewhere
+        circfirm.backend.cache.download_uf2(board_id, version)
+        assert len(requests_made) == 1
+    finally:
+        shutil.rmtree(circfirm.backend.cache.get_board_folder(board_id))
+
+
+def test_download_uf2s_overlap(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that downloads of different files run at the same time.
+
+    Downloads that are streaming also do not hold up removals from the
+    archive.
+    """
+    board_id = "feather_m4_express"
+    jobs = [(board_id, "7.0.0", "en_US"), (board_id, "7.1.0", "en_US")]
+    # Each download only finishes once both of them have started streaming,
+    # and the archive has been locked for a removal while they are streaming
+    barrier = threading.Barrier(len(jobs), timeout=5)
+    removal_lock = threading.Lock()
+
+    def mock_acquire(fd: int, exclusive: bool) -> NoReturn:
+        """Fail instead of waiting for a lock."""
+        raise AssertionError("A lock was waited on")
+
+    class MockBarrierResponse(MockStreamedResponse):
+        """Mock streamed response that waits for the other download."""
+
+        def iter_content(self, chunk_size: int) -> Iterator[bytes]:
+            """Wait for the other download, then stream the chunks."""
+            barrier.wait()
+            with (
+                removal_lock,
+                circfirm.backend.lock.lock(circfirm.backend.lock.ARCHIVE_LOCK),
+            ):
+                pass
+            barrier.wait()
+            yield from super().iter_content(chunk_size)
+
+    monkeypatch.setattr(circfirm.backend.lock, "_acquire", mock_acquire)
+
+    monkeypatch.setattr(
+        circfirm.backend.session,
+        "get",
+        lambda *args, **kwargs: MockBarrierResponse([b"UF2"], 3),
+    )
+
+    try:
+        results = dict(circfirm.backend.cache.download_uf2s(jobs, len(jobs)))
+        assert results == dict.fromkeys(jobs)
+        for job in jobs:
+            assert circfirm.backend.cache.is_downloaded(*job)
+    finally:
+        shutil.rmtree(circfirm.backend.cache.get_board_folder(board_id))
@@ -0,0 +1,166 @@
+# SPDX-FileCopyrightText: 2026 Alec Delaney
+# SPDX-License-Identifier: MIT
+
+"""Tests the backend cached firmware catalog functionality.
+
+Author(s): Alec Delaney
+"""
+
+import os
+import pathlib
+import shutil
+import threading
+
+import pytest
+
+import circfirm
+import circfirm.backend.catalog
+
+FIRMWARE_NAME = "adafruit-circuitpython-{board_id}-{language}-{version}.uf2"
+
+
+@pytest.fixture
+def mock_archive(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+) -> pathlib.Path:
+    """Run with an empty archive and catalog."""  # noqa: D401
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    monkeypatch.setattr(circfirm, "UF2_ARCHIVE", str(archive))
+    monkeypatch.setattr(circfirm, "ARCHIVE_CATALOG", str(tmp_path / "catalog.sqlite3"))
+    return archive
+
+
+def add_file(archive: pathlib.Path, board_id: str, version: str, language: str) -> None:
+    """Add a firmware file to the archive."""
+    board_folder = archive / board_id
+    board_folder.mkdir(exist_ok=True)
+    filename = FIRMWARE_NAME.format(
+        board_id=board_id, version=version, language=language
+    )
+    (board_folder / filename).write_bytes(b"UF2" * len(version))
+
+
+def test_sync(mock_archive: pathlib.Path) -> None:
+    """Tests keeping the catalog up to date with the archive."""
+    assert circfirm.backend.catalog.get_entries() == []
+
+    # Added files are picked up, and other files are skipped
+    add_file(mock_archive, "pygamer", "8.0.0", "fr")
+    add_file(mock_archive, "pygamer", "8.0.0", "en_US")
+    add_file(mock_archive, "feather_m4_express", "9.0.0-beta.1", "en_US")
+    (mock_archive / "pygamer" / ".partial.uf2").write_bytes(b"UF2")
+    (mock_archive / "pygamer" / "notes.txt").write_text("junktext")
+    assert circfirm.backend.catalog.get_entries() == [
+        ("feather_m4_express", "9.0.0-beta.1", "en_US", 36),
+        ("pygamer", "8.0.0", "en_US", 15),
+        ("pygamer", "8.0.0", "fr", 15),
+    ]
+    assert circfirm.backend.catalog.get_entries("pygamer") == [
+        ("pygamer", "8.0.0", "en_US", 15),
+        ("pygamer", "8.0.0", "fr", 15),
+    ]
+
+    # Deleted files and board folders are dropped
+    next((mock_archive / "pygamer").glob("*-fr-*")).unlink()
+    shutil.rmtree(mock_archive / "feather_m4_express")
+    assert circfirm.backend.catalog.get_entries() == [
+        ("pygamer", "8.0.0", "en_US", 15),
+    ]
+
+
+def test_create_concurrently(mock_archive: pathlib.Path) -> None:
+    """Tests that connections opened at the same time create the catalog once."""
+    add_file(mock_archive, "pygamer", "8.0.0", "en_US")
+    barrier = threading.Barrier(8, timeout=5)
+    errors = []
+
+    def get_entries() -> None:
+        """Get the catalog entries once every thread is ready."""
+        barrier.wait()
+        try:
+            circfirm.backend.catalog.get_entries()
+        except Exception as err:
+            errors.append(err)
+
+    threads = [threading.Thread(target=get_entries) for _ in range(barrier.parties)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert circfirm.backend.catalog.get_entries() == [
+        ("pygamer", "8.0.0", "en_US", 15),
+    ]
+
+
+def test_sync_restored_folder(
+    mock_archive: pathlib.Path, tmp_path: pathlib.Path
+) -> None:
+    """Tests that a board folder restored with its old modification time is scanned."""
+    add_file(mock_archive, "pygamer", "8.0.0", "en_US")
+    backup = tmp_path / "backup"
+    shutil.copytree(mock_archive / "pygamer", backup)
+    add_file(mock_archive, "pygamer", "9.0.0", "en_US")
+    entries = circfirm.backend.catalog.get_entries()
+    assert [entry.version for entry in entries] == ["8.0.0", "9.0.0"]
+
+    shutil.rmtree(mock_archive / "pygamer")
+    shutil.copytree(backup, mock_archive / "pygamer")
+    assert circfirm.backend.catalog.get_entries() == [
+        ("pygamer", "8.0.0", "en_US", 15),
+    ]
+
+
+def test_add_remove_firmware(mock_archive: pathlib.Path) -> None:
+    """Tests updating the catalog when firmware files are added and removed."""
+    add_file(mock_archive, "pygamer", "8.0.0", "en_US")
+    circfirm.backend.catalog.sync()
+
+    add_file(mock_archive, "pygamer", "9.0.0", "en_US")
+    circfirm.backend.catalog.add_firmware("pygamer", "9.0.0", "en_US", 15)
+    assert circfirm.backend.catalog.get_entries() == [
+        ("pygamer", "8.0.0", "en_US", 15),
+        ("pygamer", "9.0.0", "en_US", 15),
+    ]
+
+    next((mock_archive / "pygamer").glob("*-8.0.0.uf2")).unlink()
+    circfirm.backend.catalog.remove_firmware([("pygamer", "8.0.0", "en_US")])
+    assert circfirm.backend.catalog.get_entries() == [
+        ("pygamer", "9.0.0", "en_US", 15),
+    ]
+
+
+def test_rebuild(mock_archive: pathlib.Path) -> None:
+    """Tests rebuilding the catalog from the archive."""
+    add_file(mock_archive, "pygamer", "8.0.0", "en_US")
+    add_file(mock_archive, "pygamer", "9.0.0", "en_US")
+    circfirm.backend.catalog.sync()
+
+    # Entries for files that do not exist are removed by rebuilding
+    circfirm.backend.catalog.add_firmware("pygamer", "7.0.0", "en_US", 15)
+    entries = circfirm.backend.catalog.get_entries()
+    assert [entry.version for entry in entries] == ["7.0.0", "8.0.0", "9.0.0"]
+    count = circfirm.backend.catalog.rebuild()
+    entries = circfirm.backend.catalog.get_entries()
+    assert count == len(entries)
+    assert entries == [
+        ("pygamer", "8.0.0", "en_US", 15),
+        ("pygamer", "9.0.0", "en_US", 15),
+    ]
+
+
+def test_least_recently_used(mock_archive: pathlib.Path) -> None:
+    """Tests ordering the catalog by when firmware files were last used."""
+    add_file(mock_archive, "pygamer", "8.0.0", "en_US")
+    add_file(mock_archive, "pygamer", "9.0.0", "en_US")
+    circfirm.backend.catalog.touch_firmware("pygamer", "8.0.0", "en_US")
+    entries = circfirm.backend.catalog.get_least_recently_used()
+    assert [entry.version for entry in entries] == ["9.0.0", "8.0.0"]
+
+    # The last use is kept when the board folder is scanned again, and new
+    # files are last used when they were modified
+    add_file(mock_archive, "pygamer", "7.0.0", "en_US")
+    os.utime(next((mock_archive / "pygamer").glob("*-7.0.0.uf2")), (0, 0))
+    entries = circfirm.backend.catalog.get_least_recently_used()
+    assert [entry.version for entry in entries] == ["7.0.0", "9.0.0", "8.0.0"]
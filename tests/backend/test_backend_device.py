@@ -6,6 +6,14 @@
 Author(s): Alec Delaney
 """
 
+import concurrent.futures
+import pathlib
+import platform
+import shutil
+import time
+import types
+
+import psutil
 import pytest
 
 import circfirm.backend.device
@@ -61,3 +69,191 @@ def test_get_board_info(mock_with_circuitpy: None) -> None:
         bootfile.write("junktext\nBoard ID:feather_m4_express")
     with pytest.raises(ValueError):
         circfirm.backend.device.get_board_info(mount_location)
+
+
+def test_wait_for_bootloader(mock_with_circuitpy: None) -> None:
+    """Tests waiting for a CircuitPython device to be put in bootloader mode."""
+    mount_location = tests.helpers.get_mount()
+    tests.helpers.start_bootloader_copy_thread()
+    bootloader = circfirm.backend.device.wait_for_bootloader(10)
+    assert bootloader == mount_location
+    tests.helpers.delete_mount_node(circfirm.UF2INFO_FILE)
+
+
+def test_wait_for_bootloader_timeout(mock_with_no_device: None) -> None:
+    """Tests waiting for a CircuitPython device in bootloader mode that never connects."""
+    timeout = 0.5
+    start_time = time.monotonic()
+    bootloader = circfirm.backend.device.wait_for_bootloader(timeout)
+    assert bootloader is None
+    assert time.monotonic() - start_time >= timeout
+
+
+def test_mount_watcher() -> None:
+    """Tests waiting for the mounted filesystems to change when they do not."""
+    with circfirm.backend.device.MountWatcher() as watcher:
+        assert watcher.is_watching == (platform.system() == "Linux")
+        assert not watcher.wait(0.1)
+    assert not watcher.is_watching
+
+
+@pytest.mark.skipif(
+    platform.system() == "Windows",
+    reason="Windows partitions are filtered by drive type",
+)
+def test_find_device_filesystems(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+) -> None:
+    """Tests that only partitions with device filesystems are probed."""
+    partitions = []
+    for fstype in ("nfs4", "overlay", "fuse.sshfs", "vfat"):
+        mountpoint = tmp_path / fstype
+        mountpoint.mkdir()
+        (mountpoint / circfirm.UF2INFO_FILE).touch()
+        partitions.append(
+            types.SimpleNamespace(
+                device=fstype, mountpoint=str(mountpoint), fstype=fstype, opts="rw"
+            )
+        )
+    monkeypatch.setattr(psutil, "disk_partitions", lambda: partitions)
+
+    bootloader = circfirm.backend.device.find_bootloader()
+    assert bootloader == str(tmp_path / "vfat")
+
+
+def test_probe_mounts_stuck(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+) -> None:
+    """Tests that unresponsive mount points do not block probing."""
+    stuck_mountpoint = str(tmp_path / "stuck")
+    stuck_probe = concurrent.futures.Future()
+    (tmp_path / circfirm.UF2INFO_FILE).touch()
+    mountpoints = [stuck_mountpoint, str(tmp_path)]
+    probe_files = (circfirm.UF2INFO_FILE,)
+    start_probe = circfirm.backend.device._start_probe
+    probed = []
+
+    def mock_start_probe(
+        mountpoint: str, filenames: tuple[str, ...]
+    ) -> concurrent.futures.Future:
+        """Start a probe that never finishes for the stuck mount point."""
+        probed.append(mountpoint)
+        if mountpoint == stuck_mountpoint:
+            return stuck_probe
+        return start_probe(mountpoint, filenames)
+
+    monkeypatch.setattr(circfirm.backend.device, "_start_probe", mock_start_probe)
+    monkeypatch.setattr(circfirm.backend.device, "PROBE_TIMEOUT", 0.1)
+
+    try:
+        # The stuck mount point is skipped after timing out
+        found = circfirm.backend.device._probe_mounts(mountpoints, probe_files)
+        assert found == [(str(tmp_path), circfirm.UF2INFO_FILE)]
+        assert probed == mountpoints
+
+        # The stuck mount point is not probed again while its probe is running
+        probed.clear()
+        found = circfirm.backend.device._probe_mounts(mountpoints, probe_files)
+        assert found == [(str(tmp_path), circfirm.UF2INFO_FILE)]
+        assert probed == [str(tmp_path)]
+
+        # The mount point is probed again once its probe finishes
+        stuck_probe.set_result(None)
+        probed.clear()
+        circfirm.backend.device._probe_mounts(mountpoints, probe_files)
+        assert probed == mountpoints
+    finally:
+        circfirm.backend.device._STUCK_PROBES.clear()
+
+
+def test_get_bootloader_info(mock_with_bootloader: None) -> None:
+    """Tests getting the board ID and bootloader version from the UF2 info file."""
+    # Test successful parsing
+    mount_location = tests.helpers.get_mount()
+    board_id, version = circfirm.backend.device.get_bootloader_info(mount_location)
+    assert board_id == "SAMD51J19A-PyGamer-M4"
+    assert version == "3.6.0"
+
+    # Test unsuccessful parsing
+    with open(
+        tests.helpers.get_mount_node(circfirm.UF2INFO_FILE), mode="w", encoding="utf-8"
+    ) as infofile:
+        infofile.write("junktext")
+    with pytest.raises(ValueError):
+        circfirm.backend.device.get_bootloader_info(mount_location)
+
+
+def test_find_devices(mock_with_many_devices: dict[str, list[str]]) -> None:
+    """Tests finding every connected CircuitPython device in one scan."""
+    # Devices with unparsable information are still found
+    bad_circuitpy = mock_with_many_devices["circuitpy"][1]
+    pathlib.Path(bad_circuitpy, circfirm.BOOTOUT_FILE).write_text("junktext")
+
+    devices = circfirm.backend.device.find_devices()
+    circuitpy_paths = mock_with_many_devices["circuitpy"]
+    bootloader_paths = mock_with_many_devices["bootloader"]
+    assert devices == [
+        (circuitpy_paths[0], False, "feather_m4_express", "8.0.0-beta.6"),
+        (circuitpy_paths[1], False, None, None),
+        (bootloader_paths[0], True, "SAMD51J19A-PyGamer-M4", "3.6.0"),
+        (bootloader_paths[1], True, "SAMD51J19A-PyGamer-M4", "3.6.0"),
+    ]
+
+    circuitpys = circfirm.backend.device.find_circuitpys()
+    assert [device.path for device in circuitpys] == circuitpy_paths
+    bootloaders = circfirm.backend.device.find_bootloaders()
+    assert [device.path for device in bootloaders] == bootloader_paths
+
+
+def test_watch_bootloaders(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests watching for CircuitPython devices in bootloader mode being connected."""
+    first = circfirm.backend.device.Device("first", True, None, None)
+    second = circfirm.backend.device.Device("second", True, None, None)
+    scans = iter([[first], [first, second], [second], [first, second]])
+    monkeypatch.setattr(
+        circfirm.backend.device, "find_bootloaders", lambda: next(scans)
+    )
+    monkeypatch.setattr(circfirm.backend.device, "WAIT_MAX_INTERVAL", 0.01)
+
+    watcher = circfirm.backend.device.watch_bootloaders()
+    # Already connected devices are yielded, and reconnected devices are yielded again
+    assert [next(watcher) for _ in range(3)] == [first, second, first]
+    watcher.close()
+
+
+def test_get_bootloader_model(tmp_path: pathlib.Path) -> None:
+    """Tests getting the model name from the UF2 info file."""
+    uf2info_file = tmp_path / circfirm.UF2INFO_FILE
+    shutil.copyfile(pathlib.Path("tests/assets", circfirm.UF2INFO_FILE), uf2info_file)
+    assert circfirm.backend.device.get_bootloader_model(str(tmp_path)) == "PyGamer"
+
+    uf2info_file.write_text("junktext")
+    assert circfirm.backend.device.get_bootloader_model(str(tmp_path)) is None
+
+
+def test_wait_for_circuitpy_timeout(mock_with_no_device: None) -> None:
+    """Tests waiting for a CircuitPython device that never reboots."""
+    timeout = 0.5
+    start_time = time.monotonic()
+    circuitpy = circfirm.backend.device.wait_for_circuitpy(timeout)
+    assert circuitpy is None
+    assert time.monotonic() - start_time >= timeout
+
+
+def test_wait_for_circuitpy_matching(
+    mock_with_many_devices: dict[str, list[str]],
+) -> None:
+    """Tests waiting for a CircuitPython device that was not already connected."""
+    circuitpys = mock_with_many_devices["circuitpy"]
+    circuitpy = circfirm.backend.device.wait_for_circuitpy(
+        0.5, board_id="feather_m4_express", ignore=circuitpys[:1]
+    )
+    assert circuitpy == circuitpys[1]
+
+    # Devices that were already connected or have other board IDs are skipped
+    circuitpy = circfirm.backend.device.wait_for_circuitpy(0.5, ignore=circuitpys)
+    assert circuitpy is None
+    circuitpy = circfirm.backend.device.wait_for_circuitpy(
+        0.5, board_id="pygamer", ignore=circuitpys[:1]
+    )
+    assert circuitpy is None
@@ -6,13 +6,65 @@
 Author(s): Alec Delaney
 """
 
+import io
+import json
 import os
+import pathlib
 
 import pytest
+import requests
 
+import circfirm
 import circfirm.backend.github
+import circfirm.backend.session
 import tests.helpers
 
+FAKE_TREES = {
+    "ports": [
+        {"path": "README.md", "type": "blob"},
+        {"path": "atmel-samd", "type": "tree"},
+        {"path": "raspberrypi", "type": "tree"},
+        {"path": "unix", "type": "tree"},
+        {"path": "zephyr-cp", "type": "tree"},
+    ],
+    "ports/atmel-samd/boards": [
+        {"path": "pygamer", "type": "tree"},
+        {"path": "board.h", "type": "blob"},
+    ],
+    "ports/raspberrypi/boards": [
+        {"path": "pico", "type": "tree"},
+        {"path": "pygamer", "type": "tree"},
+    ],
+    "ports/zephyr-cp/boards": [
+        {"path": "nordic", "type": "tree"},
+        {"path": "board_aliases.cmake", "type": "blob"},
+    ],
+    "ports/zephyr-cp/boards/nordic": [
+        {"path": "nrf5340dk", "type": "tree"},
+        {"path": "nrf7002dk", "type": "tree"},
+    ],
+}
+
+
+def mock_get_tree(
+    url: str, headers: dict[str, str], requested: list[tuple[str, dict[str, str]]]
+) -> requests.Response:
+    """Mock the GitHub git tree endpoint for the fake trees, which supports ETags."""
+    path = url.rpartition("/trees/main:")[2]
+    requested.append((path, headers))
+    response = requests.Response()
+    response.raw = io.BytesIO()
+    response.headers["ETag"] = f'"{path}-etag"'
+    if path not in FAKE_TREES:
+        response.status_code = 404
+    elif headers.get("If-None-Match") == response.headers["ETag"]:
+        response.status_code = 304
+    else:
+        response.status_code = 200
+        tree_json = {"sha": f"{path}-sha", "tree": FAKE_TREES[path], "truncated": 0}
+        response.raw = io.BytesIO(json.dumps(tree_json, indent=2).encode())
+    return response
+
 
 def test_get_board_list() -> None:
     """Tests the ability of the backend to get the board list."""
@@ -34,3 +86,89 @@ def test_get_rate_limit() -> None:
     assert available <= total
     assert total == total_rate_limit
     assert reset_time
+
+
+def test_get_board_list_stored(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests revalidating the stored board list with a conditional request."""
+    requested = []
+    monkeypatch.setattr(
+        circfirm.backend.session,
+        "get",
+        lambda url, headers, **kwargs: mock_get_tree(url, headers, requested),
+    )
+    expected_board_list = ["nordic_nrf5340dk", "nordic_nrf7002dk", "pico", "pygamer"]
+
+    try:
+        # The board list is fetched and stored the first time
+        board_list = circfirm.backend.github.get_board_id_list("")
+        assert board_list == expected_board_list
+        assert "If-None-Match" not in requested[0][1]
+        stored = circfirm.backend.github.read_board_list()
+        assert stored == (expected_board_list, "ports-sha", '"ports-etag"')
+
+        # The stored board list is revalidated and reused afterwards
+        requested.clear()
+        board_list = circfirm.backend.github.get_board_id_list("")
+        assert board_list == expected_board_list
+        assert requested == [
+            ("ports", {**requested[0][1], "If-None-Match": '"ports-etag"'})
+        ]
+
+        # The stored board list is not used when refreshing
+        requested.clear()
+        board_list = circfirm.backend.github.get_board_id_list("", refresh=True)
+        assert board_list == expected_board_list
+        assert all("If-None-Match" not in headers for _, headers in requested)
+    finally:
+        pathlib.Path(circfirm.UF2_BOARD_LIST).write_text("", encoding="utf-8")
+
+
+def test_iter_board_ids(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests fetching only the boards folders of the ports."""
+    requested = []
+    monkeypatch.setattr(
+        circfirm.backend.session,
+        "get",
+        lambda url, headers, **kwargs: mock_get_tree(url, headers, requested),
+    )
+    # Read the responses in small chunks so values are split between them
+    monkeypatch.setattr(circfirm.backend.github, "STREAM_CHUNK_SIZE", 7)
+
+    try:
+        # Only the ports folder is fetched before iterating
+        board_ids = circfirm.backend.github.iter_board_ids("", refresh=True)
+        assert [path for path, _ in requested] == ["ports"]
+
+        # Each board ID is found once, in the order the folders are fetched
+        board_ids = list(board_ids)
+        assert sorted(board_ids) == [
+            "nordic_nrf5340dk",
+            "nordic_nrf7002dk",
+            "pico",
+            "pygamer",
+        ]
+        assert sorted(path for path, _ in requested) == [
+            "ports",
+            "ports/atmel-samd/boards",
+            "ports/raspberrypi/boards",
+            "ports/unix/boards",
+            "ports/zephyr-cp/boards",
+            "ports/zephyr-cp/boards/nordic",
+        ]
+    finally:
+        pathlib.Path(circfirm.UF2_BOARD_LIST).write_text("", encoding="utf-8")
+
+
+def test_iter_board_ids_bad_token(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that unsuccessful responses are not parsed."""
+
+    def mock_get(*args, **kwargs) -> requests.Response:
+        """Mock an unauthorized response from the GitHub API."""
+        response = requests.Response()
+        response.status_code = 401
+        response.raw = io.BytesIO(b'{"message": "Bad credentials"}')
+        return response
+
+    monkeypatch.setattr(circfirm.backend.session, "get", mock_get)
+    with pytest.raises(ValueError):
+        circfirm.backend.github.iter_board_ids("badtoken", refresh=True)
@@ -0,0 +1,117 @@
+# SPDX-FileCopyrightText: 2026 Alec Delaney
+# SPDX-License-Identifier: MIT
+
+"""Tests the backend release index functionality.
+
+Author(s): Alec Delaney
+"""
+
+from collections.abc import Iterator
+
+import pytest
+
+import circfirm.backend.index
+import circfirm.backend.s3
+
+FAKE_KEYS = [
+    "bin/feather_m4_express/en_US/adafruit-circuitpython-feather_m4_express-en_US-8.0.0.uf2",
+    "bin/feather_m4_express/en_US/adafruit-circuitpython-feather_m4_express-en_US-9.0.0-beta.1.uf2",
+    "bin/feather_m4_express/en_US/adafruit-circuitpython-feather_m4_express-en_US-8.2.0.uf2",
+    "bin/feather_m4_express/fr/adafruit-circuitpython-feather_m4_express-fr-8.0.0.uf2",
+    "bin/feather_m4_express/en_US/adafruit-circuitpython-feather_m4_express-en_US-8.0.0.bin",
+    "bin/pygamer/en_US/adafruit-circuitpython-pygamer-en_US-7.0.0.uf2",
+    "bin/pygamer/en_US/adafruit-circuitpython-feather_m4_express-en_US-7.0.0.uf2",
+    "bin/pygamer/index.html",
+]
+
+
+def mock_iter_objects(prefix: str) -> Iterator[dict[str, str | int]]:
+    """Mock listing the objects in the bucket."""
+    for key in FAKE_KEYS:
+        yield {"Key": key, "Size": len(key), "ETag": f'"{key[-12:]}"'}
+
+
+@pytest.fixture
+def mock_index(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    """Run with a release index built from fake bucket contents."""  # noqa: D401
+    monkeypatch.setattr(circfirm.backend.s3, "iter_objects", mock_iter_objects)
+    circfirm.backend.s3.build_index()
+    yield
+    circfirm.backend.index.delete_index()
+
+
+def test_build_index(mock_index: None) -> None:
+    """Tests building the release index."""
+    assert circfirm.backend.index.index_exists()
+    assert circfirm.backend.index.get_build_time() is not None
+
+    entries = circfirm.backend.index.get_entries("feather_m4_express", "fr")
+    key = FAKE_KEYS[3]
+    assert entries == [
+        circfirm.backend.index.IndexEntry(
+            "feather_m4_express", "fr", "8.0.0", len(key), key[-12:]
+        )
+    ]
+
+    # Keys for other files or in the wrong folders are not indexed
+    assert circfirm.backend.index.get_versions("pygamer", "en_US") == ["7.0.0"]
+    assert circfirm.backend.index.get_versions("pygamer", "fr") is None
+
+
+def test_get_board_versions_from_index(
+    monkeypatch: pytest.MonkeyPatch, mock_index: None
+) -> None:
+    """Tests getting firmware versions from the release index."""
+    listings = []
+
+    def mock_iter_objects_recorded(prefix: str) -> list[dict[str, str]]:
+        """Mock listing the objects in the bucket, recording the listing."""
+        listings.append(prefix)
+        return []
+
+    monkeypatch.setattr(circfirm.backend.s3, "iter_objects", mock_iter_objects_recorded)
+
+    versions = circfirm.backend.s3.get_board_versions("feather_m4_express")
+    assert versions == ["9.0.0-beta.1", "8.2.0", "8.0.0"]
+    latest = circfirm.backend.s3.get_latest_board_version(
+        "feather_m4_express", "en_US", False
+    )
+    assert latest == "8.2.0"
+    assert not listings
+
+    # The index is not used when refreshing
+    circfirm.backend.s3.get_board_versions("feather_m4_express", refresh=True)
+    assert listings
+
+
+def test_get_board_versions_index_miss(
+    monkeypatch: pytest.MonkeyPatch, mock_index: None
+) -> None:
+    """Tests listing the bucket for boards and languages missing from the index."""
+    key = "bin/new_board/en_US/adafruit-circuitpython-new_board-en_US-9.0.0.uf2"
+    listings = []
+
+    def mock_iter_objects_new(prefix: str) -> list[dict[str, str]]:
+        """Mock listing the objects in the bucket for a newly released board."""
+        listings.append(prefix)
+        return [{"Key": key}] if prefix == "bin/new_board/en_US" else []
+
+    monkeypatch.setattr(circfirm.backend.s3, "iter_objects", mock_iter_objects_new)
+
+    try:
+        assert circfirm.backend.s3.get_board_versions("new_board") == ["9.0.0"]
+        assert circfirm.backend.s3.get_board_versions("pygamer", "fr") == []
+        assert listings == ["bin/new_board/en_US", "bin/pygamer/fr"]
+    finally:
+        for board_id, language in (("new_board", "en_US"), ("pygamer", "fr")):
+            circfirm.backend.s3.get_listing_filepath(board_id, language).unlink(
+                missing_ok=True
+            )
+
+
+def test_delete_index(mock_index: None) -> None:
+    """Tests deleting the release index."""
+    circfirm.backend.index.delete_index()
+    assert not circfirm.backend.index.index_exists()
+    assert circfirm.backend.index.get_build_time() is None
+    assert circfirm.backend.index.get_versions("pygamer", "en_US") is None
@@ -0,0 +1,71 @@
+# SPDX-FileCopyrightText: 2026 Alec Delaney
+# SPDX-License-Identifier: MIT
+
+"""Tests the backend archive locking functionality.
+
+Author(s): Alec Delaney
+"""
+
+import pathlib
+import platform
+import threading
+
+import pytest
+
+import circfirm
+import circfirm.backend.lock
+
+
+@pytest.fixture
+def mock_locks(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    """Run with the lock files in a temporary folder."""  # noqa: D401
+    monkeypatch.setattr(circfirm, "ARCHIVE_LOCKS", str(tmp_path / "locks"))
+
+
+def test_lock_exclusive(mock_locks: None) -> None:
+    """Tests that an exclusive lock is waited on by other holders."""
+    events = []
+    acquired = threading.Event()
+
+    def hold_lock() -> None:
+        """Acquire the lock from another thread."""
+        acquired.set()
+        with circfirm.backend.lock.lock("test", exclusive=False) as waited:
+            events.append(("acquired", waited))
+
+    with circfirm.backend.lock.lock("test") as waited:
+        assert not waited
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        acquired.wait()
+        thread.join(0.2)
+        assert thread.is_alive()
+        events.append(("released", None))
+    thread.join()
+    assert events == [("released", None), ("acquired", True)]
+
+    # Different locks do not wait on each other
+    with circfirm.backend.lock.lock("test"):
+        with circfirm.backend.lock.lock("other") as waited:
+            assert not waited
+
+
+@pytest.mark.skipif(
+    platform.system() == "Windows", reason="Windows locks are always exclusive"
+)
+def test_lock_shared(mock_locks: None) -> None:
+    """Tests that shared locks can be held at the same time."""
+    with circfirm.backend.lock.lock("test", exclusive=False):
+        with circfirm.backend.lock.lock("test", exclusive=False) as waited:
+            assert not waited
+
+
+def test_try_lock(mock_locks: None) -> None:
+    """Tests that a lock held elsewhere is not waited on when trying to acquire it."""
+    with circfirm.backend.lock.lock("test"):
+        with circfirm.backend.lock.try_lock("test") as acquired:
+            assert not acquired
+    with circfirm.backend.lock.try_lock("test") as acquired:
+        assert acquired
+        with circfirm.backend.lock.try_lock("test") as acquired_again:
+            assert not acquired_again
@@ -6,25 +6,23 @@
 Author(s): Alec Delaney
 """
 
-from collections import namedtuple
+import threading
+import time
 from functools import partial
 
-import boto3.resources.collection
 import pytest
 
 import circfirm.backend.s3
 
-MockS3Object = namedtuple("MockS3Object", ["key"])
-
 
 def get_fake_s3_objects(
     board: str, keys: list[str], *args, **kwargs
-) -> list[MockS3Object]:
+) -> list[dict[str, str]]:
     """Create a set of fake S3 objects."""
     template_link = (
         f"bin/{board}/en_US/adafruit-circuitpython-{board}-en_US-[version].uf2"
     )
-    return [MockS3Object(template_link.replace("[version]", key)) for key in keys]
+    return [{"Key": template_link.replace("[version]", key)} for key in keys]
 
 
 def test_get_board_versions() -> None:
@@ -51,8 +49,8 @@ def test_get_board_versions_bad_version(monkeypatch: pytest.MonkeyPatch) -> None
     ]
 
     monkeypatch.setattr(
-        boto3.resources.collection.CollectionManager,
-        "filter",
+        circfirm.backend.s3,
+        "iter_objects",
         partial(get_fake_s3_objects, board, possible_versions),
     )
 
@@ -61,3 +59,86 @@ def test_get_board_versions_bad_version(monkeypatch: pytest.MonkeyPatch) -> None
 
     versions = circfirm.backend.s3.get_board_versions(board)
     assert versions == expected_versions
+
+
+def test_get_s3_client_shared() -> None:
+    """Tests that the S3 client is created once and shared between threads."""
+    clients = []
+    threads = [
+        threading.Thread(
+            target=lambda: clients.append(circfirm.backend.s3.get_s3_client())
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(client is clients[0] for client in clients)
+    assert circfirm.backend.s3.get_s3_client() is clients[0]
+
+
+def test_configure_s3_client() -> None:
+    """Tests that reconfiguring the S3 client creates a new one."""
+    orig_options = circfirm.backend.s3.S3_CLIENT_OPTIONS.copy()
+    client = circfirm.backend.s3.get_s3_client()
+    try:
+        # Configuring with the same options keeps the client
+        circfirm.backend.s3.configure_s3_client(**orig_options)
+        assert circfirm.backend.s3.get_s3_client() is client
+
+        # Configuring with new options replaces the client
+        circfirm.backend.s3.configure_s3_client(
+            max_pool_connections=20, endpoint_url="http://localhost:9000"
+        )
+        new_client = circfirm.backend.s3.get_s3_client()
+        assert new_client is not client
+        assert new_client.meta.endpoint_url == "http://localhost:9000"
+        assert new_client.meta.config.max_pool_connections == 20  # noqa: PLR2004
+    finally:
+        circfirm.backend.s3.configure_s3_client(**orig_options)
+
+
+def test_get_board_versions_cached(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests using cached version listings for a given board."""
+    board = "test_board"
+    possible_versions = ["6.2.0", "6.1.0"]
+    listings = []
+
+    def mock_iter_objects(*args, **kwargs) -> list[dict[str, str]]:
+        """Mock listing the objects in the bucket, recording the listing."""
+        listings.append(args)
+        return get_fake_s3_objects(board, possible_versions)
+
+    monkeypatch.setattr(circfirm.backend.s3, "iter_objects", mock_iter_objects)
+    listing_file = circfirm.backend.s3.get_listing_filepath(board, "en_US")
+    orig_ttl = circfirm.backend.s3.LISTING_CACHE_OPTIONS["ttl"]
+
+    try:
+        # Listings are not cached by default
+        circfirm.backend.s3.get_board_versions(board)
+        assert len(listings) == 1
+        assert not listing_file.exists()
+
+        # Cached listings are used when they have not expired
+        circfirm.backend.s3.configure_listing_cache(ttl=3600)
+        circfirm.backend.s3.get_board_versions(board)
+        assert len(listings) == 2  # noqa: PLR2004
+        assert listing_file.exists()
+        versions = circfirm.backend.s3.get_board_versions(board, regex="6.1")
+        assert versions == ["6.1.0"]
+        assert len(listings) == 2  # noqa: PLR2004
+
+        # Cached listings are not used when refreshing
+        versions = circfirm.backend.s3.get_board_versions(board, refresh=True)
+        assert versions == possible_versions
+        assert len(listings) == 3  # noqa: PLR2004
+
+        # Cached listings are not used once they have expired
+        monkeypatch.setattr(time, "time", lambda: listing_file.stat().st_mtime + 7200)
+        circfirm.backend.s3.get_board_versions(board)
+        assert len(listings) == 4  # noqa: PLR2004
+    finally:
+        circfirm.backend.s3.configure_listing_cache(ttl=orig_ttl)
+        listing_file.unlink(missing_ok=True)
+        listing_file.parent.rmdir()
@@ -0,0 +1,73 @@
+# SPDX-FileCopyrightText: 2026 Alec Delaney
+# SPDX-License-Identifier: MIT
+
+"""Tests the backend HTTP session functionality.
+
+Author(s): Alec Delaney
+"""
+
+import threading
+
+import pytest
+import requests
+
+import circfirm.backend.session
+
+
+def test_get_session_shared() -> None:
+    """Tests that the HTTP session is created once and shared between threads."""
+    sessions = []
+    threads = [
+        threading.Thread(
+            target=lambda: sessions.append(circfirm.backend.session.get_session())
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(session is sessions[0] for session in sessions)
+
+    adapter = sessions[0].get_adapter("https://downloads.circuitpython.org")
+    options = circfirm.backend.session.HTTP_SESSION_OPTIONS
+    assert adapter.max_retries.total == options["retries"]
+    assert adapter.max_retries.backoff_factor == options["backoff_factor"]
+
+
+def test_configure_session() -> None:
+    """Tests that reconfiguring the HTTP session creates a new one."""
+    orig_options = circfirm.backend.session.HTTP_SESSION_OPTIONS.copy()
+    session = circfirm.backend.session.get_session()
+    try:
+        # Configuring with the same options keeps the session
+        circfirm.backend.session.configure_session(**orig_options)
+        assert circfirm.backend.session.get_session() is session
+
+        # Configuring with new options replaces the session
+        circfirm.backend.session.configure_session(retries=5, read_timeout=5)
+        new_session = circfirm.backend.session.get_session()
+        assert new_session is not session
+        adapter = new_session.get_adapter("https://api.github.com")
+        assert adapter.max_retries.total == 5  # noqa: PLR2004
+        assert circfirm.backend.session.get_timeout() == (10, 5)
+    finally:
+        circfirm.backend.session.configure_session(**orig_options)
+
+
+def test_get_default_timeout(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that requests made through the session use the default timeouts."""
+    used_kwargs = {}
+
+    def mock_session_get(self, url: str, **kwargs) -> requests.Response:
+        """Mock GET method."""
+        used_kwargs.update(kwargs)
+        return requests.Response()
+
+    monkeypatch.setattr(requests.Session, "get", mock_session_get)
+
+    circfirm.backend.session.get("https://api.github.com")
+    assert used_kwargs["timeout"] == circfirm.backend.session.get_timeout()
+
+    circfirm.backend.session.get("https://api.github.com", timeout=1)
+    assert used_kwargs["timeout"] == 1
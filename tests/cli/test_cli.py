@@ -6,12 +6,18 @@
 Author(s): Alec Delaney
 """
 
+import pathlib
 import shutil
-from typing import NoReturn
+import subprocess
+import sys
+from typing import Any, NoReturn
 
+import click
 import pytest
 
+import circfirm
 import circfirm.backend.cache
+import circfirm.backend.device
 import circfirm.cli
 
 BOARD = "feather_m0_express"
@@ -70,3 +76,224 @@ def test_download_if_needed_cached_no_internet(
         board_folder = circfirm.backend.cache.get_board_folder(BOARD)
         if board_folder.exists():  # pragma: no cover
             shutil.rmtree(board_folder)
+
+
+def test_detect_does_not_import_boto3() -> None:
+    """Tests that running the detect command never imports boto3."""
+    script = "\n".join(
+        [
+            "import sys",
+            "from circfirm.cli import cli",
+            "cli(['detect', 'circuitpy'], standalone_mode=False)",
+            "cli(['--help'], standalone_mode=False)",
+            "print('boto3' in sys.modules, 'botocore' in sys.modules)",
+        ]
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.splitlines()[-1] == "False False"
+
+
+def test_prefetch() -> None:
+    """Tests doing work for a board in the background while waiting."""
+    prefetch = circfirm.cli.Prefetch(lambda board: f"{board} done")
+    assert prefetch.wait(BOARD) is None
+
+    prefetch.start(BOARD)
+    assert prefetch.wait(BOARD) == f"{BOARD} done"
+    assert prefetch.wait("other_board") is None
+
+    def fail(board: str) -> NoReturn:
+        """Fail to do the work."""
+        raise ValueError(board)
+
+    prefetch = circfirm.cli.Prefetch(fail)
+    prefetch.start(BOARD)
+    with pytest.raises(ValueError):
+        prefetch.wait(BOARD)
+
+
+def test_prefetch_firmware_no_internet(
+    monkeypatch: pytest.MonkeyPatch, mock_no_internet: NoReturn
+) -> None:
+    """Tests that prefetching firmware without internet fails silently."""
+    monkeypatch.setattr(
+        circfirm.backend.cache, "is_downloaded", lambda _x, _y, _z: False
+    )
+    circfirm.cli.prefetch_firmware(BOARD, VERSION, LANGUAGE)
+    assert not circfirm.backend.cache.get_board_folder(BOARD).exists()
+
+
+def test_install_firmware_device_error(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture
+) -> None:
+    """Tests copying the downloaded firmware if writing it while downloading fails."""
+    downloaded = iter([False, True])
+    copies = []
+
+    def mock_download_firmware(msg: str, args: tuple[str, ...]) -> NoReturn:
+        """Fail to write the firmware to the device."""
+        raise OSError("Device disconnected")
+
+    monkeypatch.setattr(
+        circfirm.backend.cache, "is_downloaded", lambda *_args: next(downloaded)
+    )
+    monkeypatch.setattr(circfirm.cli, "_download_firmware", mock_download_firmware)
+    monkeypatch.setattr(
+        circfirm.cli, "copy_cache_firmware", lambda *args: copies.append(args)
+    )
+
+    circfirm.cli.install_firmware(BOARD, VERSION, LANGUAGE, "bootloader")
+    assert copies == [(BOARD, VERSION, LANGUAGE, "bootloader")]
+    assert "Device disconnected" in capsys.readouterr().out
+
+    # The error is reported if the firmware was not downloaded either
+    downloaded = iter([False, False])
+    with pytest.raises(click.ClickException, match="Device disconnected"):
+        circfirm.cli.install_firmware(BOARD, VERSION, LANGUAGE, "bootloader")
+
+
+@pytest.fixture
+def mock_verify_settings(monkeypatch: pytest.MonkeyPatch) -> dict[str, Any]:
+    """Run with verification settings that can be changed by the test."""  # noqa: D401
+    verify_settings = {"retries": 0, "timeout": 1}
+    monkeypatch.setattr(
+        circfirm.cli, "get_settings", lambda: {"verify": verify_settings}
+    )
+    return verify_settings
+
+
+def test_verify_firmware(
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture,
+    tmp_path: pathlib.Path,
+    mock_verify_settings: dict[str, Any],
+) -> None:
+    """Tests verifying the firmware version of a rebooted device."""
+    shutil.copyfile(
+        pathlib.Path("tests/assets", circfirm.BOOTOUT_FILE),
+        tmp_path / circfirm.BOOTOUT_FILE,
+    )
+    monkeypatch.setattr(
+        circfirm.backend.device,
+        "wait_for_circuitpy",
+        lambda *_args, **_kwargs: str(tmp_path),
+    )
+    circfirm.cli.verify_firmware(BOARD, "8.0.0-beta.6", LANGUAGE, 0)
+    assert "Verified CircuitPython 8.0.0-beta.6 is installed" in capsys.readouterr().out
+
+    # Test a device that reports a different version
+    with pytest.raises(click.ClickException):
+        circfirm.cli.verify_firmware(BOARD, VERSION, LANGUAGE, 0)
+    assert "reports version 8.0.0-beta.6" in capsys.readouterr().out
+
+    # Test a device that does not reboot
+    monkeypatch.setattr(
+        circfirm.backend.device, "wait_for_circuitpy", lambda *_args, **_kwargs: None
+    )
+    with pytest.raises(click.ClickException):
+        circfirm.cli.verify_firmware(BOARD, VERSION, LANGUAGE, 0)
+    assert "did not reboot" in capsys.readouterr().out
+
+
+def test_verify_firmware_retry(
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture,
+    tmp_path: pathlib.Path,
+    mock_verify_settings: dict[str, Any],
+) -> None:
+    """Tests installing the firmware again when verification fails."""
+    mock_verify_settings["retries"] = 1
+    shutil.copyfile(
+        pathlib.Path("tests/assets", circfirm.BOOTOUT_FILE),
+        tmp_path / circfirm.BOOTOUT_FILE,
+    )
+    circuitpys = iter([None, str(tmp_path)])
+    copies = []
+    monkeypatch.setattr(
+        circfirm.backend.device,
+        "wait_for_circuitpy",
+        lambda *_args, **_kwargs: next(circuitpys),
+    )
+    monkeypatch.setattr(
+        circfirm.backend.device, "find_bootloader", lambda: "bootloader"
+    )
+    monkeypatch.setattr(
+        circfirm.cli, "copy_cache_firmware", lambda *args: copies.append(args)
+    )
+
+    circfirm.cli.verify_firmware(BOARD, "8.0.0-beta.6", LANGUAGE, 0)
+    assert copies == [(BOARD, "8.0.0-beta.6", LANGUAGE, "bootloader")]
+    output = capsys.readouterr().out
+    assert "Verification failed" in output
+    assert "Verified CircuitPython 8.0.0-beta.6 is installed" in output
+
+
+def test_verify_firmware_many_devices(
+    capsys: pytest.CaptureFixture,
+    mock_with_many_devices: dict[str, list[str]],
+    mock_verify_settings: dict[str, Any],
+) -> None:
+    """Tests that other connected devices are not mistaken for the rebooted one."""
+    board = "feather_m4_express"
+    version = "8.0.0-beta.6"
+    circuitpys = mock_with_many_devices["circuitpy"]
+
+    # Devices that were already connected are ignored
+    with pytest.raises(click.ClickException):
+        circfirm.cli.verify_firmware(board, version, LANGUAGE, 0, circuitpys)
+    assert "did not reboot" in capsys.readouterr().out
+
+    # Devices with other board IDs are ignored
+    with pytest.raises(click.ClickException):
+        circfirm.cli.verify_firmware(BOARD, version, LANGUAGE, 0, circuitpys[:1])
+    assert "did not reboot" in capsys.readouterr().out
+
+    circfirm.cli.verify_firmware(board, version, LANGUAGE, 0, circuitpys[:1])
+    assert f"Verified CircuitPython {version} is installed" in capsys.readouterr().out
+
+
+def test_evict_firmware(
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture,
+    mock_with_firmwares_archived: None,
+) -> None:
+    """Tests evicting the least recently used cached firmware."""
+    cache_settings = {"max_size": 0, "pinned": [{"board-id": "pygamer"}]}
+    settings = {"cache": cache_settings, "output": {"supporting": {"silence": False}}}
+    monkeypatch.setattr(circfirm.cli, "get_settings", lambda: settings)
+    archive = pathlib.Path(circfirm.UF2_ARCHIVE)
+    firmware_files = sorted(archive.glob("*/*.uf2"))
+
+    # Nothing is evicted without a size limit, but abandoned downloads for the
+    # boards of the firmware to keep are removed
+    temp_files = [
+        file.parent / f".{file.name}.a1b2c3d4.part"
+        for file in (
+            circfirm.backend.cache.get_uf2_filepath(BOARD, "7.0.0"),
+            circfirm.backend.cache.get_uf2_filepath("pygamer", "7.0.0"),
+        )
+    ]
+    for temp_file in temp_files:
+        temp_file.write_bytes(b"UF2")
+    circfirm.cli.evict_firmware([(BOARD, "7.0.0", "en_US")])
+    assert sorted(archive.glob("*/*.uf2")) == firmware_files
+    assert not temp_files[0].exists()
+    assert temp_files[1].exists()
+    assert capsys.readouterr().out == ""
+
+    cache_settings["max_size"] = 1
+    circfirm.cli.evict_firmware([(BOARD, "7.0.0", "en_US")])
+    assert sorted(archive.glob("*/*.uf2")) == sorted(
+        [
+            *archive.glob("pygamer/*.uf2"),
+            circfirm.backend.cache.get_uf2_filepath(BOARD, "7.0.0"),
+        ]
+    )
+    assert "least recently used firmware files" in capsys.readouterr().out
+
+    # Pins that cannot be parsed are reported
+    cache_settings["pinned"] = [{"version": "7.0.0"}]
+    with pytest.raises(click.ClickException):
+        circfirm.cli.evict_firmware([])
@@ -11,15 +11,26 @@ import pathlib
 import shutil
 from typing import NoReturn
 
+import pytest
 from click.testing import CliRunner
 
 import circfirm
 import circfirm.backend.cache
+import circfirm.backend.s3
 from circfirm.cli import cli
 
 RUNNER = CliRunner()
 
 
+def mock_download_uf2(board_id: str, version: str, language: str = "en_US") -> None:
+    """Mock downloading a UF2 file, failing for non-existent versions."""
+    if version == "doesnotexist":
+        raise ConnectionError("Could not download the specified UF2 file")
+    uf2_file = circfirm.backend.cache.get_uf2_filepath(board_id, version, language)
+    uf2_file.parent.mkdir(parents=True, exist_ok=True)
+    uf2_file.write_bytes(b"UF2")
+
+
 def test_cache_list_empty() -> None:
     """Tests the cache list command with an empty cache."""
     result = RUNNER.invoke(cli, ["cache", "list"])
@@ -118,11 +129,17 @@ def test_cache_clear(mock_with_firmwares_archived: None) -> None:
     assert not uf2_file.exists()
     assert board_folder.exists()
 
-    # Remove a specific board firmware from the cache
+    # Remove a specific board firmware from the cache, along with its
+    # abandoned downloads
+    temp_file = board_folder / f".{uf2_file.name}.a1b2c3d4.part"
+    temp_file.write_bytes(b"UF2")
+    other_temp_file = pathlib.Path(circfirm.UF2_ARCHIVE) / "pygamer" / temp_file.name
+    other_temp_file.write_bytes(b"UF2")
     result = RUNNER.invoke(cli, ["cache", "clear", "--board-id", board])
     assert result.exit_code == 0
     assert result.output == "Cache cleared of specified entries!\n"
     assert not board_folder.exists()
+    assert other_temp_file.exists()
 
     # Remove entire cache
     result = RUNNER.invoke(cli, ["cache", "clear"])
@@ -131,6 +148,69 @@ def test_cache_clear(mock_with_firmwares_archived: None) -> None:
     assert len(list(board_folder.parent.glob("*"))) == 0
 
 
+def test_cache_clear_dry_run(mock_with_firmwares_archived: None) -> None:
+    """Tests the cache clear command without clearing anything."""
+    archive = pathlib.Path(circfirm.UF2_ARCHIVE)
+    firmware_files = sorted(archive.glob("*/*.uf2"))
+    cleared_files = sorted(archive.glob("feather_*/*-7.?.0.uf2"))
+    cleared_size = sum(file.stat().st_size for file in cleared_files) / 1_000_000
+
+    result = RUNNER.invoke(
+        cli, ["cache", "clear", "--board-id", "feather_*", "--version", "7.?.0", "-n"]
+    )
+    assert result.exit_code == 0
+    assert "  * feather_m0_express 7.0.0 (fr)\n" in result.output
+    assert result.output.endswith(
+        f"Would clear {len(cleared_files)} firmware versions ({cleared_size:.2f} MB)\n"
+    )
+    assert sorted(archive.glob("*/*.uf2")) == firmware_files
+
+    # Invalid regex patterns are reported
+    result = RUNNER.invoke(cli, ["cache", "clear", "--regex", "--version", "7.("])
+    assert result.exit_code != 0
+    assert sorted(archive.glob("*/*.uf2")) == firmware_files
+
+
+def test_cache_rebuild(mock_with_firmwares_archived: None) -> None:
+    """Tests the cache rebuild command."""
+    firmwares = list(pathlib.Path(circfirm.UF2_ARCHIVE).glob("*/*.uf2"))
+    result = RUNNER.invoke(cli, ["cache", "rebuild"])
+    assert result.exit_code == 0
+    assert result.output == f"Cataloged {len(firmwares)} firmware files\n"
+
+
+def test_cache_prune(mock_with_firmwares_archived: None) -> None:
+    """Tests the cache prune command."""
+    archive = pathlib.Path(circfirm.UF2_ARCHIVE)
+    firmware_files = sorted(archive.glob("*/*.uf2"))
+    pruned_files = [file for file in firmware_files if "-zh_Latn_pinyin-" in file.name]
+    pruned_size = sum(file.stat().st_size for file in pruned_files) / 1_000_000
+
+    # A retention policy is required
+    result = RUNNER.invoke(cli, ["cache", "prune"])
+    assert result.exit_code != 0
+
+    # The firmware versions are only listed for a dry run
+    args = ["cache", "prune", "--language", "en_US,fr", "--keep-latest", "3"]
+    result = RUNNER.invoke(cli, [*args, "--dry-run"])
+    assert result.exit_code == 0
+    assert "  * pygamer 7.2.0 (zh_Latn_pinyin)\n" in result.output
+    assert result.output.endswith(
+        f"Would remove {len(pruned_files)} firmware versions ({pruned_size:.2f} MB)\n"
+    )
+    assert sorted(archive.glob("*/*.uf2")) == firmware_files
+
+    result = RUNNER.invoke(cli, args)
+    assert result.exit_code == 0
+    assert result.output.endswith(
+        f"Removed {len(pruned_files)} firmware versions "
+        f"({pruned_size:.2f} MB reclaimed)\n"
+    )
+    assert sorted(archive.glob("*/*.uf2")) == sorted(
+        set(firmware_files) - set(pruned_files)
+    )
+
+
 def test_cache_clear_regex_board_id(mock_with_firmwares_archived: None) -> None:
     """Tests the cache clear command when using a regex flag for board ID."""
     board = "feather_m4_express"
@@ -293,3 +373,107 @@ def test_cache_latest_no_internet(mock_no_internet: NoReturn) -> None:
         board_folder = circfirm.backend.cache.get_board_folder(board)
         if board_folder.exists():  # pragma: no cover
             shutil.rmtree(board_folder)
+
+
+def test_cache_save_many(
+    monkeypatch: pytest.MonkeyPatch, mock_with_firmwares_archived: None
+) -> None:
+    """Tests the cache save command with multiple boards, versions, and languages."""
+    monkeypatch.setattr(circfirm.backend.cache, "download_uf2", mock_download_uf2)
+    boards = ("feather_m4_express", "feather_m0_express")
+    versions = ("7.0.0", "7.3.0")
+    languages = ("fr", "cs")
+
+    result = RUNNER.invoke(
+        cli,
+        [
+            "cache",
+            "save",
+            ",".join(boards),
+            ",".join(versions),
+            "--language",
+            languages[0],
+            "--language",
+            languages[1],
+        ],
+    )
+    assert result.exit_code == 0
+    assert "Cached 6 firmware versions (2 already cached, 0 failed)" in result.output
+    for board in boards:
+        for version in versions:
+            for language in languages:
+                assert circfirm.backend.cache.is_downloaded(board, version, language)
+
+    # Save with a failing version
+    result = RUNNER.invoke(cli, ["cache", "save", boards[0], "7.3.0,doesnotexist"])
+    assert result.exit_code == 1
+    assert "(0 already cached, 1 failed)" in result.output
+    assert "feather_m4_express doesnotexist (en_US)" in result.output
+
+
+def test_cache_save_manifest(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+) -> None:
+    """Tests the cache save command with a manifest file."""
+    monkeypatch.setattr(circfirm.backend.cache, "download_uf2", mock_download_uf2)
+    manifest = tmp_path / "manifest.yaml"
+    manifest.write_text(
+        "- board-id: feather_m4_express\n"
+        "  version: [7.0.0, 7.1.0]\n"
+        "  language: fr\n"
+        "- board-id: pygamer\n"
+        "  version: 7.2.0\n",
+        encoding="utf-8",
+    )
+    expected_jobs = (
+        ("feather_m4_express", "7.0.0", "fr"),
+        ("feather_m4_express", "7.1.0", "fr"),
+        ("pygamer", "7.2.0", "en_US"),
+    )
+
+    try:
+        result = RUNNER.invoke(cli, ["cache", "save", "--manifest", str(manifest)])
+        assert result.exit_code == 0
+        for job in expected_jobs:
+            assert circfirm.backend.cache.is_downloaded(*job)
+
+        # Test a manifest that cannot be parsed
+        manifest.write_text("- version: 7.0.0\n", encoding="utf-8")
+        result = RUNNER.invoke(cli, ["cache", "save", "--manifest", str(manifest)])
+        assert result.exit_code == 1
+
+        # Test not providing a board ID or manifest
+        result = RUNNER.invoke(cli, ["cache", "save"])
+        assert result.exit_code == 2  # noqa: PLR2004
+    finally:
+        shutil.rmtree(circfirm.UF2_ARCHIVE)
+        os.mkdir(circfirm.UF2_ARCHIVE)
+
+
+def test_cache_latest_many(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests the cache latest command with multiple boards and languages."""
+    latest_versions = {"feather_m4_express": "9.0.0", "pygamer": "8.2.0"}
+    monkeypatch.setattr(circfirm.backend.cache, "download_uf2", mock_download_uf2)
+    monkeypatch.setattr(
+        circfirm.backend.s3,
+        "get_latest_board_version",
+        lambda board_id, language, pre_release, refresh: latest_versions.get(board_id),
+    )
+
+    try:
+        result = RUNNER.invoke(
+            cli,
+            ["cache", "latest", "feather_m4_express,pygamer", "-l", "fr,en_US"],
+        )
+        assert result.exit_code == 0
+        for board, version in latest_versions.items():
+            for language in ("fr", "en_US"):
+                assert circfirm.backend.cache.is_downloaded(board, version, language)
+
+        # Test with a board without any versions
+        result = RUNNER.invoke(cli, ["cache", "latest", "pygamer,doesnotexist"])
+        assert result.exit_code == 1
+        assert "doesnotexist (en_US): no versions found" in result.output
+    finally:
+        shutil.rmtree(circfirm.UF2_ARCHIVE)
+        os.mkdir(circfirm.UF2_ARCHIVE)
@@ -12,6 +12,7 @@ import click
 from click.testing import CliRunner
 
 import circfirm
+import circfirm.cli
 from circfirm.cli import cli
 
 RUNNER = CliRunner()
@@ -70,6 +71,34 @@ def test_config_edit(mock_default_config: None) -> None:
     assert result.exit_code != 0
 
 
+def test_config_edit_list(mock_default_config: None) -> None:
+    """Tests the config edit command with a list setting."""
+    pins = "[{board-id: pygamer}, {board-id: feather_m4_express, version: 9.0.0}]"
+    result = RUNNER.invoke(cli, ["config", "edit", "cache.pinned", pins])
+    assert result.exit_code == 0
+    assert circfirm.cli.get_settings()["cache"]["pinned"] == [
+        {"board-id": "pygamer"},
+        {"board-id": "feather_m4_express", "version": "9.0.0"},
+    ]
+    assert circfirm.cli.get_cache_pins() == [
+        ("pygamer", None, None),
+        ("feather_m4_express", "9.0.0", None),
+    ]
+
+    # Test writing values that are not lists, which are not split into characters
+    for value in ("pygamer", "true", "[unclosed"):
+        result = RUNNER.invoke(cli, ["config", "edit", "cache.pinned", value])
+        assert result.exit_code != 0
+    assert circfirm.cli.get_cache_pins() == [
+        ("pygamer", None, None),
+        ("feather_m4_express", "9.0.0", None),
+    ]
+
+    result = RUNNER.invoke(cli, ["config", "edit", "cache.pinned", "[]"])
+    assert result.exit_code == 0
+    assert circfirm.cli.get_settings()["cache"]["pinned"] == []
+
+
 def test_config_edit_setting_only(mock_default_config: None) -> None:
     """Tests the config edit command with only a setting argument."""
     result = RUNNER.invoke(cli, ["config", "edit", "somesetting"])
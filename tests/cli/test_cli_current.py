@@ -6,6 +6,8 @@
 Author(s): Alec Delaney
 """
 
+import psutil
+import pytest
 from click.testing import CliRunner
 
 from circfirm.cli import cli
@@ -29,3 +31,29 @@ def test_current_in_bootloader(mock_with_bootloader: None) -> None:
     """Tests the current command whenn connected in bootloader mode."""
     result = RUNNER.invoke(cli, ["current", "board-id"])
     assert result.exit_code != 0
+
+
+def test_current_all(mock_with_many_devices: dict[str, list[str]]) -> None:
+    """Tests the current commands for every connected board."""
+    circuitpys = mock_with_many_devices["circuitpy"]
+    result = RUNNER.invoke(cli, ["current", "board-id", "--all"])
+    assert result.exit_code == 0
+    assert result.output == "".join(
+        f"{circuitpy}: feather_m4_express\n" for circuitpy in circuitpys
+    )
+
+    result = RUNNER.invoke(cli, ["current", "version", "--all"])
+    assert result.exit_code == 0
+    assert result.output == "".join(
+        f"{circuitpy}: 8.0.0-beta.6\n" for circuitpy in circuitpys
+    )
+
+
+def test_current_all_in_bootloader(
+    monkeypatch: pytest.MonkeyPatch, mock_with_many_devices: dict[str, list[str]]
+) -> None:
+    """Tests the current commands for every connected board when all are in bootloader mode."""
+    partitions = psutil.disk_partitions()
+    monkeypatch.setattr(psutil, "disk_partitions", lambda: partitions[2:])
+    result = RUNNER.invoke(cli, ["current", "board-id", "--all"])
+    assert result.exit_code != 0
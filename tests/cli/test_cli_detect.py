@@ -46,3 +46,29 @@ def test_detect_bootloader_not_found(mock_with_no_device: None) -> None:
     """Tests the detect bootloader command without a connected board."""
     result = RUNNER.invoke(cli, ["detect", "bootloader"])
     assert result.output == "No board connected in bootloader mode\n"
+
+
+def test_detect_all(mock_with_many_devices: dict[str, list[str]]) -> None:
+    """Tests the detect commands finding every connected board."""
+    result = RUNNER.invoke(cli, ["detect", "circuitpy", "--all"])
+    assert result.exit_code == 0
+    assert result.output.splitlines() == [
+        f"{circuitpy} (feather_m4_express 8.0.0-beta.6)"
+        for circuitpy in mock_with_many_devices["circuitpy"]
+    ]
+
+    result = RUNNER.invoke(cli, ["detect", "bootloader", "--all"])
+    assert result.exit_code == 0
+    assert result.output.splitlines() == [
+        f"{bootloader} (SAMD51J19A-PyGamer-M4 3.6.0)"
+        for bootloader in mock_with_many_devices["bootloader"]
+    ]
+
+
+def test_detect_all_not_found(mock_with_no_device: None) -> None:
+    """Tests the detect commands finding every connected board without any."""
+    result = RUNNER.invoke(cli, ["detect", "circuitpy", "--all"])
+    assert result.output == "No board connected in CIRCUITPY or equivalent mode\n"
+
+    result = RUNNER.invoke(cli, ["detect", "bootloader", "--all"])
+    assert result.output == "No board connected in bootloader mode\n"
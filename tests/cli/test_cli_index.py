@@ -0,0 +1,60 @@
+# SPDX-FileCopyrightText: 2026 Alec Delaney
+# SPDX-License-Identifier: MIT
+
+"""Tests the CLI functionality for index command.
+
+Author(s): Alec Delaney
+"""
+
+from typing import NoReturn
+
+import pytest
+from click.testing import CliRunner
+
+import circfirm.backend.index
+import circfirm.backend.s3
+from circfirm.cli import cli
+
+RUNNER = CliRunner()
+
+
+def test_index(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests building, checking, and clearing the release index."""
+    key = "bin/pygamer/en_US/adafruit-circuitpython-pygamer-en_US-7.0.0.uf2"
+    monkeypatch.setattr(
+        circfirm.backend.s3,
+        "iter_objects",
+        lambda prefix: [{"Key": key, "Size": 1, "ETag": '"etag"'}],
+    )
+
+    try:
+        result = RUNNER.invoke(cli, ["index", "build"])
+        assert result.exit_code == 0
+        assert result.output == (
+            "Building the release index... done\nIndexed 1 firmware files\n"
+        )
+
+        result = RUNNER.invoke(cli, ["index", "info"])
+        assert result.exit_code == 0
+        assert result.output.startswith("The release index was built on")
+
+        # Querying versions works from the index without the bucket
+        monkeypatch.setattr(circfirm.backend.s3, "iter_objects", None)
+        result = RUNNER.invoke(cli, ["query", "versions", "pygamer"])
+        assert result.exit_code == 0
+        assert result.output == "7.0.0\n"
+    finally:
+        result = RUNNER.invoke(cli, ["index", "clear"])
+        assert result.exit_code == 0
+        assert result.output == "Release index cleared!\n"
+
+    result = RUNNER.invoke(cli, ["index", "info"])
+    assert result.exit_code == 0
+    assert result.output == "The release index has not been built.\n"
+
+
+def test_index_build_no_internet(mock_no_internet: NoReturn) -> None:
+    """Tests building the release index when there is no internet connection."""
+    result = RUNNER.invoke(cli, ["index", "build"])
+    assert result.exit_code != 0
+    assert not circfirm.backend.index.index_exists()
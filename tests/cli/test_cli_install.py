@@ -7,12 +7,16 @@ Author(s): Alec Delaney
 """
 
 import os
+import pathlib
 import shutil
 import time
 
+import pytest
 from click.testing import CliRunner
 
+import circfirm
 import circfirm.backend.cache
+import circfirm.backend.github
 import tests.helpers
 from circfirm.cli import cli
 
@@ -73,14 +77,17 @@ def test_install_as_circuitpy(mock_with_circuitpy: None) -> None:
     assert result.exit_code == ERR_FOUND_CIRCUITPY
 
 
-def test_install_bad_version(mock_with_bootloader: None) -> None:
+def test_install_bad_version(
+    monkeypatch: pytest.MonkeyPatch, mock_with_bootloader: None
+) -> None:
     """Tests the install command using a bad board version."""
     result = RUNNER.invoke(
         cli, ["install", "doesnotexist", "--board-id", "feather_m4_express"]
     )
     assert result.exit_code == ERR_UF2_DOWNLOAD
 
-    # Test using install when in bootloader mode
+    # Test using install when in bootloader mode with an unmatched bootloader
+    monkeypatch.setattr(circfirm.cli, "get_bootloader_board_id", lambda _: None)
     result = RUNNER.invoke(cli, ["install", VERSION])
     assert result.exit_code == ERR_IN_BOOTLOADER
 
@@ -118,3 +125,55 @@ def test_install_with_timeout_failure(mock_with_circuitpy: None) -> None:
         "Error: Bootloader mode device not found within the timeout period\n"
     )
     assert time.time() - start_time >= timeout
+
+
+def test_install_all_connected(
+    mock_with_many_devices: dict[str, list[str]], mock_with_firmwares_archived: None
+) -> None:
+    """Tests the install command on every connected board in bootloader mode."""
+    version = "7.0.0"
+    result = RUNNER.invoke(
+        cli, ["install", version, "--board-id", "pygamer", "--all-connected"]
+    )
+    assert result.exit_code == 0
+    assert "Using cached firmware file" in result.output
+
+    expected_uf2_filename = circfirm.backend.get_uf2_filename("pygamer", version)
+    for bootloader in mock_with_many_devices["bootloader"]:
+        assert f"  * {bootloader} (pygamer {version}): done (" in result.output
+        assert os.path.exists(os.path.join(bootloader, expected_uf2_filename))
+    for circuitpy in mock_with_many_devices["circuitpy"]:
+        assert not os.path.exists(os.path.join(circuitpy, expected_uf2_filename))
+
+
+def test_install_all_connected_no_board_id(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: pathlib.Path,
+    mock_with_many_devices: dict[str, list[str]],
+    mock_with_firmwares_archived: None,
+) -> None:
+    """Tests the install command on every connected board without a board ID."""
+    version = "7.0.0"
+    monkeypatch.setattr(circfirm, "BOOTLOADER_MAP", str(tmp_path / "bootloaders.yaml"))
+
+    # Test when the bootloaders cannot be matched to a board ID
+    monkeypatch.setattr(
+        circfirm.backend.github,
+        "read_board_list",
+        lambda: circfirm.backend.github.BoardList(["feather_m4_express"], "sha", None),
+    )
+    result = RUNNER.invoke(cli, ["install", version, "--all-connected"])
+    assert result.exit_code != 0
+
+    # Test when the bootloaders are matched to a board ID
+    monkeypatch.setattr(
+        circfirm.backend.github,
+        "read_board_list",
+        lambda: circfirm.backend.github.BoardList(["pygamer"], "sha", None),
+    )
+    result = RUNNER.invoke(cli, ["install", version, "--all-connected"])
+    assert result.exit_code == 0
+    expected_uf2_filename = circfirm.backend.get_uf2_filename("pygamer", version)
+    for bootloader in mock_with_many_devices["bootloader"]:
+        assert f"  * {bootloader} (pygamer {version}): done (" in result.output
+        assert os.path.exists(os.path.join(bootloader, expected_uf2_filename))
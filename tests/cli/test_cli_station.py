@@ -0,0 +1,126 @@
+# SPDX-FileCopyrightText: 2026 Alec Delaney
+# SPDX-License-Identifier: MIT
+
+"""Tests the CLI functionality for station command.
+
+Author(s): Alec Delaney
+"""
+
+import os
+import pathlib
+from collections.abc import Iterator
+
+import pytest
+from click.testing import CliRunner
+
+import circfirm.backend
+import circfirm.backend.cache
+import circfirm.backend.catalog
+import circfirm.backend.device
+from circfirm.cli import cli
+
+RUNNER = CliRunner()
+
+VERSION = "7.0.0"
+
+
+def test_station(
+    mock_with_many_devices: dict[str, list[str]], mock_with_firmwares_archived: None
+) -> None:
+    """Tests the station command installing on boards as they are connected."""
+    result = RUNNER.invoke(
+        cli, ["station", "--board-id", "pygamer", "--version", VERSION, "--count", "2"]
+    )
+    assert result.exit_code == 0
+    assert "Using cached firmware file" in result.output
+    assert "CircuitPython installed on 2 boards\n" in result.output
+
+    expected_uf2_filename = circfirm.backend.get_uf2_filename("pygamer", VERSION)
+    for bootloader in mock_with_many_devices["bootloader"]:
+        assert os.path.exists(os.path.join(bootloader, expected_uf2_filename))
+
+
+def test_station_policy(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: pathlib.Path,
+    mock_with_many_devices: dict[str, list[str]],
+    mock_with_firmwares_archived: None,
+) -> None:
+    """Tests the station command matching boards using a policy file."""
+    policy_file = tmp_path / "policy.yaml"
+    policy_file.write_text(
+        "- bootloader-id: SAMD51J19A-PyGamer-M4\n"
+        "  board-id: pygamer\n"
+        f"  version: {VERSION}\n"
+    )
+    bootloaders = mock_with_many_devices["bootloader"]
+    devices = [
+        circfirm.backend.device.Device(bootloaders[0], True, "unknown_board", "3.6.0"),
+        circfirm.backend.device.Device(
+            bootloaders[1], True, "SAMD51J19A-PyGamer-M4", "3.6.0"
+        ),
+    ]
+    monkeypatch.setattr(
+        circfirm.backend.device, "watch_bootloaders", lambda: iter(devices)
+    )
+
+    result = RUNNER.invoke(cli, ["station", "--policy", str(policy_file)])
+    assert result.exit_code == 0
+    assert (
+        f"Skipping {bootloaders[0]}, as no policy matches bootloader board ID "
+        "unknown_board\n"
+    ) in result.output
+    assert "CircuitPython installed on 1 boards\n" in result.output
+
+    expected_uf2_filename = circfirm.backend.get_uf2_filename("pygamer", VERSION)
+    assert not os.path.exists(os.path.join(bootloaders[0], expected_uf2_filename))
+    assert os.path.exists(os.path.join(bootloaders[1], expected_uf2_filename))
+
+    # Test an unparsable policy file
+    policy_file.write_text("- version: 7.0.0\n")
+    result = RUNNER.invoke(cli, ["station", "--policy", str(policy_file)])
+    assert result.exit_code != 0
+
+
+def test_station_firmware_removed(
+    monkeypatch: pytest.MonkeyPatch,
+    mock_with_many_devices: dict[str, list[str]],
+    mock_with_firmwares_archived: None,
+) -> None:
+    """Tests the station command when its firmware is removed from the cache."""
+    uf2_file = circfirm.backend.cache.get_uf2_filepath("pygamer", VERSION)
+    uf2_contents = uf2_file.read_bytes()
+    downloads = []
+
+    def mock_download_uf2(board_id: str, version: str, language: str) -> None:
+        """Mock downloading the firmware into the cache."""
+        downloads.append((board_id, version, language))
+        uf2_file.write_bytes(uf2_contents)
+
+    def mock_watch_bootloaders() -> Iterator[circfirm.backend.device.Device]:
+        """Remove the firmware from the cache before each board is connected."""
+        for bootloader in mock_with_many_devices["bootloader"]:
+            uf2_file.unlink()
+            yield circfirm.backend.device.Device(
+                bootloader, True, "SAMD51J19A-PyGamer-M4", "3.6.0"
+            )
+
+    monkeypatch.setattr(circfirm.backend.cache, "download_uf2", mock_download_uf2)
+    monkeypatch.setattr(
+        circfirm.backend.device, "watch_bootloaders", mock_watch_bootloaders
+    )
+
+    result = RUNNER.invoke(cli, ["station", "--board-id", "pygamer", "-v", VERSION])
+    assert result.exit_code == 0
+    assert "CircuitPython installed on 2 boards\n" in result.output
+    assert downloads == [("pygamer", VERSION, "en_US")] * 2
+
+    # The firmware is the most recently used, as it was copied last
+    entries = circfirm.backend.catalog.get_least_recently_used()
+    assert entries[-1][:3] == ("pygamer", VERSION, "en_US")
+
+
+def test_station_no_board_id() -> None:
+    """Tests the station command without a board ID or policy file."""
+    result = RUNNER.invoke(cli, ["station"])
+    assert result.exit_code != 0
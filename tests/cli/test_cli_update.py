@@ -11,10 +11,12 @@ import pathlib
 import shutil
 import time
 
+import pytest
 from click.testing import CliRunner
 
 import circfirm
 import circfirm.backend.cache
+import circfirm.backend.s3
 import tests.helpers
 from circfirm.cli import cli
 
@@ -184,3 +186,33 @@ def test_update_timeout_failure(mock_with_circuitpy: None) -> None:
         "Error: Bootloader mode device not found within the timeout period\n"
     )
     assert time.time() - start_time >= timeout
+
+
+def test_update_all_connected(
+    monkeypatch: pytest.MonkeyPatch,
+    mock_with_many_devices: dict[str, list[str]],
+    mock_with_firmwares_archived: None,
+) -> None:
+    """Test the update command on every connected board in bootloader mode."""
+    latest_version = "7.2.0"
+    monkeypatch.setattr(
+        circfirm.backend.s3,
+        "get_latest_board_version",
+        lambda *args, **kwargs: latest_version,
+    )
+    result = RUNNER.invoke(
+        cli, ["update", "--board-id", "pygamer", "--language", "fr", "--all-connected"]
+    )
+    assert result.exit_code == 0
+
+    expected_uf2_filename = circfirm.backend.get_uf2_filename(
+        "pygamer", latest_version, language="fr"
+    )
+    for bootloader in mock_with_many_devices["bootloader"]:
+        assert os.path.exists(os.path.join(bootloader, expected_uf2_filename))
+
+    # Updates cannot be limited, since the installed versions are unknown
+    result = RUNNER.invoke(
+        cli, ["update", "--board-id", "pygamer", "--all-connected", "--limit-to-minor"]
+    )
+    assert result.exit_code != 0
@@ -9,11 +9,13 @@ Author(s): Alec Delaney
 import os
 import pathlib
 import shutil
+import types
 from collections.abc import Iterator
 from typing import NoReturn
 
 import botocore.exceptions
 import click
+import psutil
 import pytest
 import requests
 import yaml
@@ -90,6 +92,36 @@ def mock_with_bootloader() -> Iterator[None]:
     tests.helpers.delete_mount_node(circfirm.UF2INFO_FILE, missing_ok=True)
 
 
+@pytest.fixture
+def mock_with_many_devices(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+) -> dict[str, list[str]]:
+    """Run with two devices connected in CIRCUITPY mode and two in bootloader mode."""  # noqa: D401
+    devices: dict[str, list[str]] = {"circuitpy": [], "bootloader": []}
+    partitions = []
+    for mode, filename in (
+        ("circuitpy", circfirm.BOOTOUT_FILE),
+        ("bootloader", circfirm.UF2INFO_FILE),
+    ):
+        for index in range(2):
+            mountpoint = tmp_path / f"{mode}{index}"
+            mountpoint.mkdir()
+            shutil.copyfile(
+                pathlib.Path("tests/assets", filename), mountpoint / filename
+            )
+            devices[mode].append(str(mountpoint))
+            partitions.append(
+                types.SimpleNamespace(
+                    device=f"{mode}{index}",
+                    mountpoint=str(mountpoint),
+                    fstype="vfat",
+                    opts="rw,removable",
+                )
+            )
+    monkeypatch.setattr(psutil, "disk_partitions", lambda: partitions)
+    return devices
+
+
 @pytest.fixture
 def mock_with_no_device() -> None:
     """Run without a device connected in either CIRCUITPY or bootloader mode."""  # noqa: D401
@@ -132,6 +164,7 @@ def mock_no_internet(monkeypatch: pytest.MonkeyPatch) -> NoReturn:
         raise botocore.exceptions.EndpointConnectionError(endpoint_url="test")
 
     monkeypatch.setattr(requests, "get", mock_requests_get)
+    monkeypatch.setattr(requests.Session, "get", mock_requests_get)
     monkeypatch.setattr(URLLib3Session, "send", mock_urllib3session_send)
 
 